@@ -5,6 +5,7 @@ import time
 from datetime import datetime
 from functools import wraps
 
+import telegram
 import telegram.ext as tg
 
 # enable logging
@@ -72,6 +73,10 @@ if ENV:
         CERT_PATH = os.environ.get("CERT_PATH")
 
         DB_URI = os.environ.get('DATABASE_URL')
+        DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+        DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+        DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+        DB_POOL_PRE_PING = bool(os.environ.get('DB_POOL_PRE_PING', True))
         LOAD = os.environ.get("LOAD", "").split()
         NO_LOAD = os.environ.get("NO_LOAD", "").split()
         DEL_CMDS = bool(os.environ.get('DEL_CMDS', False))
@@ -82,6 +87,14 @@ if ENV:
         CUSTOM_CMD = os.environ.get('CUSTOM_CMD', False)
         TEMPORARY_DATA = os.environ.get('TEMPORARY_DATA', None)
         SPAMWATCH_TOKEN = os.environ.get('SPAMWATCH_TOKEN', None)
+        MODERATION_PIPELINE = bool(os.environ.get('MODERATION_PIPELINE', False))
+        BROADCAST_RATE = int(os.environ.get('BROADCAST_RATE', 20))
+        BROADCAST_CONCURRENCY = int(os.environ.get('BROADCAST_CONCURRENCY', 4))
+        PERF_STATS = bool(os.environ.get('PERF_STATS', False))
+        PERF_DUMP_FILE = os.environ.get('PERF_DUMP_FILE', 'perf_stats.json')
+        PERF_DUMP_INTERVAL = int(os.environ.get('PERF_DUMP_INTERVAL', 300))
+        HTTP_TIMEOUT = int(os.environ.get('HTTP_TIMEOUT', 10))
+        HTTP_CACHE_FILE = os.environ.get('HTTP_CACHE_FILE', None)
 
 else:
         from metabutler.config import Development as Config
@@ -145,11 +158,49 @@ else:
                 SPAMWATCH_TOKEN = Config.SPAMWATCH_TOKEN
         except:
                 pass
+        try:
+                MODERATION_PIPELINE = Config.MODERATION_PIPELINE
+        except AttributeError:
+                MODERATION_PIPELINE = False
+        try:
+                BROADCAST_RATE = Config.BROADCAST_RATE
+                BROADCAST_CONCURRENCY = Config.BROADCAST_CONCURRENCY
+        except AttributeError:
+                BROADCAST_RATE = 20
+                BROADCAST_CONCURRENCY = 4
+        try:
+                DB_POOL_SIZE = Config.DB_POOL_SIZE
+                DB_MAX_OVERFLOW = Config.DB_MAX_OVERFLOW
+                DB_POOL_TIMEOUT = Config.DB_POOL_TIMEOUT
+                DB_POOL_PRE_PING = Config.DB_POOL_PRE_PING
+        except AttributeError:
+                DB_POOL_SIZE = 10
+                DB_MAX_OVERFLOW = 20
+                DB_POOL_TIMEOUT = 30
+                DB_POOL_PRE_PING = True
+        try:
+                PERF_STATS = Config.PERF_STATS
+                PERF_DUMP_FILE = Config.PERF_DUMP_FILE
+                PERF_DUMP_INTERVAL = Config.PERF_DUMP_INTERVAL
+        except AttributeError:
+                PERF_STATS = False
+                PERF_DUMP_FILE = 'perf_stats.json'
+                PERF_DUMP_INTERVAL = 300
+        try:
+                HTTP_TIMEOUT = Config.HTTP_TIMEOUT
+                HTTP_CACHE_FILE = Config.HTTP_CACHE_FILE
+        except AttributeError:
+                HTTP_TIMEOUT = 10
+                HTTP_CACHE_FILE = None
 
 
 SUDO_USERS.add(OWNER_ID)
 
-updater = tg.Updater(TOKEN, workers=WORKERS, use_context=True)
+# every Bot API call goes through the throttled request, see helper_funcs/ratelimit.py
+from metabutler.modules.helper_funcs.ratelimit import ThrottledRequest
+
+updater = tg.Updater(bot=telegram.Bot(TOKEN, request=ThrottledRequest(con_pool_size=WORKERS + 4)),
+                     workers=WORKERS, use_context=True)
 
 dispatcher = updater.dispatcher
 
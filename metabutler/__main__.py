@@ -12,15 +12,20 @@ from telegram import Message, Chat, Update, Bot, User
 from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.error import Unauthorized, BadRequest, TimedOut, NetworkError, ChatMigrated, TelegramError
 from telegram.ext import CommandHandler, Filters, MessageHandler, CallbackQueryHandler
-from telegram.ext.dispatcher import run_async, DispatcherHandlerStop, Dispatcher
+from telegram.ext.dispatcher import DispatcherHandlerStop, Dispatcher
 from telegram.utils.helpers import escape_markdown, mention_html
 
-from metabutler import dispatcher, updater, TOKEN, WEBHOOK, OWNER_ID, CERT_PATH, PORT, URL, LOGGER
+from metabutler import dispatcher, updater, TOKEN, WEBHOOK, OWNER_ID, CERT_PATH, PORT, URL, LOGGER, \
+    MODERATION_PIPELINE, PERF_STATS, PERF_DUMP_FILE, PERF_DUMP_INTERVAL
 # needed to dynamically load modules
 # NOTE: Module order is not guaranteed, specify that in the config file!
 from metabutler.modules import ALL_MODULES
 from metabutler.modules.helper_funcs.chat_status import is_user_admin
 from metabutler.modules.helper_funcs.misc import paginate_modules
+from metabutler.modules.helper_funcs.pipeline import install_pipeline, run_async
+from metabutler.modules.helper_funcs.handlers import install_router
+from metabutler.modules.helper_funcs.perf import install_perf, perf_command, dump_perf_job
+from metabutler.modules.sql import BASE
 from metabutler.modules.helper_funcs.verifier import verify_welcome
 
 from metabutler.modules.connection import connect_button
@@ -61,6 +66,9 @@ DATA_EXPORT = []
 CHAT_SETTINGS = {}
 USER_SETTINGS = {}
 
+# chat_member updates are opt-in on the Bot API side, ask for everything so the admin cache sees promotions
+ALLOWED_UPDATES = getattr(Update, "ALL_TYPES", None)
+
 for module_name in ALL_MODULES:
     imported_module = importlib.import_module("metabutler.modules." + module_name)
     if not hasattr(imported_module, "__mod_name__"):
@@ -484,6 +492,18 @@ def main():
     dispatcher.add_handler(settings_callback_handler)
     dispatcher.add_handler(M_CONNECT_BTN_HANDLER)
 
+    if PERF_STATS:
+        install_perf(dispatcher, BASE.metadata.bind)
+        dispatcher.add_handler(CommandHandler("perf", perf_command, filters=Filters.user(OWNER_ID)))
+        if PERF_DUMP_FILE:
+            updater.job_queue.run_repeating(dump_perf_job(PERF_DUMP_FILE), interval=PERF_DUMP_INTERVAL,
+                                            first=PERF_DUMP_INTERVAL)
+
+    if MODERATION_PIPELINE:
+        install_pipeline(dispatcher)
+
+    install_router(dispatcher)
+
     # dispatcher.add_error_handler(error_callback)
 
     if WEBHOOK:
@@ -494,13 +514,14 @@ def main():
 
         if CERT_PATH:
             updater.bot.set_webhook(url=URL + TOKEN,
-                                    certificate=open(CERT_PATH, 'rb'))
+                                    certificate=open(CERT_PATH, 'rb'),
+                                    allowed_updates=ALLOWED_UPDATES)
         else:
-            updater.bot.set_webhook(url=URL + TOKEN)
+            updater.bot.set_webhook(url=URL + TOKEN, allowed_updates=ALLOWED_UPDATES)
 
     else:
         LOGGER.info("Using long polling.")
-        updater.start_polling(timeout=15, read_latency=4)
+        updater.start_polling(timeout=15, read_latency=4, allowed_updates=ALLOWED_UPDATES)
 
     updater.idle()
 
@@ -5,12 +5,17 @@ from telegram import Message, Chat, Update, Bot, User, InlineKeyboardMarkup, Cha
 from telegram import ParseMode
 from telegram.error import BadRequest
 from telegram.ext import CommandHandler, MessageHandler, Filters
-from telegram.ext.dispatcher import run_async
+try:
+	from telegram.ext import ChatMemberHandler
+except ImportError:  # python-telegram-bot older than 13.4, admin cache then only expires by TTL
+	ChatMemberHandler = None
 from telegram.utils.helpers import escape_markdown, mention_html, mention_markdown
 
 from metabutler import dispatcher, updater, LOGGER
 from metabutler.modules.disable import DisableAbleCommandHandler
-from metabutler.modules.helper_funcs.chat_status import bot_admin, can_promote, user_admin, can_pin
+from metabutler.modules.helper_funcs.pipeline import run_async
+from metabutler.modules.helper_funcs.chat_status import bot_admin, can_promote, user_admin, can_pin, \
+	invalidate_admin_cache, ADMIN_CACHE
 from metabutler.modules.helper_funcs.extraction import extract_user
 from metabutler.modules.helper_funcs.msg_types import get_message_type
 from metabutler.modules.helper_funcs.misc import build_keyboard_alternate
@@ -95,6 +100,7 @@ def promote(update, context):
 			send_message(update.effective_message, "Cannot promote users, maybe I am not admin or do not have permission to promote users.")
 		return
 
+	invalidate_admin_cache(chat_id)
 	send_message(update.effective_message, f"Admin {mention_html(user.id, user.first_name)} promoted {mention_html(user_member.user.id, user_member.user.first_name)}", parse_mode=ParseMode.HTML)
 	
 	return "<b>{}:</b>" \
@@ -161,6 +167,7 @@ def demote(update, context):
 							  can_pin_messages=False,
 							  can_promote_members=False
 							)
+		invalidate_admin_cache(chat.id)
 		send_message(update.effective_message, f"Admin {mention_html(user.id, user.first_name)} demoted {mention_html(user_member.user.id, user_member.user.first_name)}", parse_mode=ParseMode.HTML)
 		return "<b>{}:</b>" \
 			   "\n#DEMOTED" \
@@ -500,6 +507,20 @@ def permanent_pin(update, context):
 	
 
 
+def admin_status_changed(update, context):
+	member_update = update.chat_member or update.my_chat_member
+	if not member_update:
+		return
+	# any change into, out of or within the admin ranks makes the cached admin list stale
+	statuses = ('administrator', 'creator')
+	if member_update.old_chat_member.status in statuses or member_update.new_chat_member.status in statuses:
+		invalidate_admin_cache(member_update.chat.id)
+
+
+def __stats__():
+	return ADMIN_CACHE.stats()
+
+
 def __chat_settings__(chat_id, user_id):
 	administrators = dispatcher.bot.getChatAdministrators(chat_id)
 	chat = dispatcher.bot.getChat(chat_id)
@@ -557,6 +578,8 @@ PERMANENT_PIN_SET_HANDLER = CommandHandler("permanentpin", permanent_pin_set, pa
 PERMANENT_PIN_HANDLER = MessageHandler(Filters.status_update.pinned_message | Filters.user(777000), permanent_pin)
 
 ADMINLIST_HANDLER = DisableAbleCommandHandler(["adminlist", "admins"], adminlist)
+if ChatMemberHandler:
+	ADMIN_STATUS_HANDLER = ChatMemberHandler(admin_status_changed, ChatMemberHandler.ANY_CHAT_MEMBER)
 
 dispatcher.add_handler(PIN_HANDLER)
 dispatcher.add_handler(UNPIN_HANDLER)
@@ -567,3 +590,5 @@ dispatcher.add_handler(DEMOTE_HANDLER)
 dispatcher.add_handler(PERMANENT_PIN_SET_HANDLER)
 dispatcher.add_handler(PERMANENT_PIN_HANDLER)
 dispatcher.add_handler(ADMINLIST_HANDLER)
+if ChatMemberHandler:
+	dispatcher.add_handler(ADMIN_STATUS_HANDLER)
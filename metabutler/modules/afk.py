@@ -3,12 +3,12 @@ from typing import Optional
 from telegram import Message, Update, Bot, User
 from telegram import MessageEntity
 from telegram.error import BadRequest
-from telegram.ext import Filters, MessageHandler, run_async
+from telegram.ext import Filters, MessageHandler
 
-from metabutler import dispatcher, OWNER_ID, SUDO_USERS, SUPPORT_USERS
+from metabutler import dispatcher, OWNER_ID, SUDO_USERS, SUPPORT_USERS, LOGGER
 from metabutler.modules.disable import DisableAbleCommandHandler, DisableAbleMessageHandler
 from metabutler.modules.sql import afk_sql as sql
-from metabutler.modules.users import get_user_id
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.helper_funcs.alternate import send_message
 
@@ -24,7 +24,8 @@ def afk(update, context):
     else:
         reason = ""
 
-    sql.set_afk(update.effective_user.id, reason)
+    user = update.effective_user
+    sql.set_afk(user.id, reason, user.username, user.first_name)
     send_message(update.effective_message, f"{update.effective_user.first_name} is now AFK!\nSays its because of : {reason}")
 
 
@@ -44,26 +45,34 @@ def no_longer_afk(update, context):
 def reply_afk(update, context):
     message = update.effective_message  # type: Optional[Message]
 
+    if not message.entities or not sql.AFK_USERS:
+        return
+
     entities = message.parse_entities([MessageEntity.TEXT_MENTION, MessageEntity.MENTION])
-    if message.entities and entities:
+    if entities:
         for ent in entities:
             if ent.type == MessageEntity.TEXT_MENTION:
                 user_id = ent.user.id
                 fst_name = ent.user.first_name
-                
+
             elif ent.type == MessageEntity.MENTION:
-                user_id = get_user_id(message.text[ent.offset:ent.offset + ent.length])
+                # only AFK users are looked up, so other mentions cost neither a query nor an API call
+                user_id = sql.get_afk_by_username(message.text[ent.offset:ent.offset + ent.length])
                 if not user_id:
-                    # Should never happen, since for a user to become AFK they must have spoken. Maybe changed username?
-                    return
-                try:
-                    chat = context.bot.get_chat(user_id)
-                except BadRequest:
-                    print("Error: Could not fetch userid {} for AFK module".format(user_id))
-                    return
-                fst_name = chat.first_name
-                
-            else:   
+                    continue
+                afk_user = sql.get_afk_user(user_id)
+                if not afk_user:
+                    continue
+                fst_name = afk_user.first_name
+                if not fst_name:
+                    try:
+                        fst_name = context.bot.get_chat(user_id).first_name
+                    except BadRequest:
+                        LOGGER.warning("Could not fetch userid %s for AFK module", user_id)
+                        return
+                    sql.set_afk_name(user_id, fst_name)
+
+            else:
                 return
 
             if sql.is_afk(user_id):
@@ -1,5 +1,5 @@
 import json
-import html, time
+import html
 from bs4 import BeautifulSoup
 from datetime import datetime
 from typing import Optional, List
@@ -9,13 +9,13 @@ from telegram import Message, Chat, Update, Bot, ParseMode
 from telegram.error import BadRequest
 from telegram.utils.helpers import escape_markdown, mention_html
 from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import run_async
 
 from metabutler import dispatcher, LOGGER
 from metabutler.modules.disable import DisableAbleCommandHandler
 from metabutler.modules.helper_funcs.alternate import send_message
+from metabutler.modules.helper_funcs.pipeline import run_async
 
-from requests import get
+from metabutler.modules.helper_funcs.http_client import HTTP
 
 # Greeting all bot owners that is using this module,
 # - RealAkito (used to be peaktogoo) [Module Maker]
@@ -27,6 +27,13 @@ from requests import get
 
 #LOGGER.info("android: Original Android Modules by @RealAkito on Telegram")
 DEVICES_DATA = 'https://raw.githubusercontent.com/androidtrackers/certified-android-devices/master/by_device.json'
+RELEASE_TTL = 30 * 60  # releases are cached this long, repeated lookups don't hit the network
+DEVICES_TTL = 24 * 60 * 60
+
+
+def cached_get(url, ttl=RELEASE_TTL):
+    return HTTP.get(url, ttl=ttl)
+
 
 @run_async
 def shrp(update, context):
@@ -39,7 +46,7 @@ def shrp(update, context):
     else:
         device = args[1]
         url = "https://sourceforge.net/projects/shrp/files/{0}/".format(device)
-        request = get(url)
+        request = cached_get(url)
         if request.status_code == 404:
             context.bot.send_message(chat_id, "That device does not have a SHRP recovery released yet", reply_to_message_id=msg_id)
             return
@@ -69,7 +76,7 @@ def bliss(update, context):
     else:
         device = args[1].lower()
         url = "https://raw.githubusercontent.com/BlissRoms-Devices/OTA/master/builds.json"
-        response = get(url).json()
+        response = cached_get(url).json()
         response = {k.lower():v for k,v in response.items()}
         if device in response.keys():
             device_info = response[device][0]
@@ -98,13 +105,13 @@ def ofox(update, context):
         del_msg = send_message(update.effective_message, "{}".format(reply), parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
         return
     device = str(args[1])
-    url = get("https://api.orangefox.download/v2/device/{}".format(device))
+    url = cached_get("https://api.orangefox.download/v2/device/{}".format(device))
     if url.status_code == 404:
         reply = "Couldn't find Orangefox downloads for {}!\n".format(device)
         send_message(update.effective_message, "{}".format(reply))
     else:
         reply = "<b>Latest Stable Orangefox for {0}</b>\n".format(device)
-        url = get(f'https://api.orangefox.download/v2/device/{device}/releases/stable/last').json()
+        url = cached_get(f'https://api.orangefox.download/v2/device/{device}/releases/stable/last').json()
         try:
             bugs = url['bugs']
         except Exception:
@@ -138,13 +145,15 @@ def twrp(update, context):
         reply = "No codename provided, write a codename for fetching informations."
         del_msg = send_message(update.effective_message, "{}".format(reply))
     device = " ".join(args)
-    url = get(f'https://eu.dl.twrp.me/{device}/')
+    # the device list is only needed when twrp has the device, but fetching both at once saves a round trip
+    devices = HTTP.submit(DEVICES_DATA, ttl=DEVICES_TTL)
+    url = cached_get(f'https://eu.dl.twrp.me/{device}/')
     if url.status_code == 404:
         reply = "Couldn't find twrp downloads for {}!\n".format(device)
         send_message(update.effective_message, "{}".format(reply))
     else:
         reply = f'*Latest Official TWRP for {device}*\n'            
-        db = get(DEVICES_DATA).json()
+        db = devices.result().json()
         newdevice = device.strip('lte') if device.startswith('beyond') else device
         try:
             brand = db[newdevice][0]['brand']
@@ -170,8 +179,11 @@ def twrp(update, context):
 def magisk(update, context):
     url = 'https://raw.githubusercontent.com/topjohnwu/magisk_files/'
     releases = ""
-    for type, branch in {"Stable":["master/stable","master"], "Beta":["master/beta","master"], "Canary (release)":["canary/release","canary"], "Canary (debug)":["canary/debug","canary"]}.items():
-        data = get(url + branch[0] + '.json').json()
+    branches = {"Stable":["master/stable","master"], "Beta":["master/beta","master"], "Canary (release)":["canary/release","canary"], "Canary (debug)":["canary/debug","canary"]}
+    # all channels are fetched at the same time
+    pending = {type: HTTP.submit(url + branch[0] + '.json', ttl=RELEASE_TTL) for type, branch in branches.items()}
+    for type, branch in branches.items():
+        data = pending[type].result().json()
         releases += f'*{type}*: \n' \
                     f'• [Changelog](https://github.com/topjohnwu/magisk_files/blob/{branch[1]}/notes.md)\n' \
                     f'• Zip - [{data["magisk"]["version"]}-{data["magisk"]["versionCode"]}]({data["magisk"]["link"]}) \n' \
@@ -181,10 +193,14 @@ def magisk(update, context):
 
     del_msg = send_message(update.effective_message, "*Latest Magisk Releases:*\n{}".format(releases),
                                parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
-    time.sleep(300)
+    # cleaned up by the job queue instead of holding a worker for five minutes
+    context.job_queue.run_once(lambda job_context: delete_messages(del_msg, update.effective_message), 300)
+
+
+def delete_messages(*messages):
     try:
-        del_msg.delete()
-        update.effective_message.delete()
+        for message in messages:
+            message.delete()
     except BadRequest as err:
         if (err.message == "Message to delete not found" ) or (err.message == "Message can't be deleted" ):
             return
@@ -197,7 +213,7 @@ def havoc(update, context):
     chat = update.effective_chat  # type: Optional[Chat]
     device = message.text[len(f'/{cmd_name} '):]
 
-    fetch = get(
+    fetch = cached_get(
         f'https://raw.githubusercontent.com/Havoc-Devices/android_vendor_OTA/pie/{device}.json'
     )
 
@@ -248,7 +264,7 @@ def pixys(update, context):
         send_message(update.effective_message, reply_text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
         return
 
-    fetch = get(f'https://raw.githubusercontent.com/PixysOS-Devices/official_devices/master/{device}/build.json')
+    fetch = cached_get(f'https://raw.githubusercontent.com/PixysOS-Devices/official_devices/master/{device}/build.json')
     if fetch.status_code == 200:
         usr = fetch.json()
         response = usr['response'][0]
@@ -283,7 +299,7 @@ def dotos(update, context):
         send_message(update.effective_message, reply_text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
         return
 
-    fetch = get(f'https://raw.githubusercontent.com/DotOS/ota_config/dot-p/{device}.json')
+    fetch = cached_get(f'https://raw.githubusercontent.com/DotOS/ota_config/dot-p/{device}.json')
     if fetch.status_code == 200:
         usr = fetch.json()
         response = usr['response'][0]
@@ -318,7 +334,7 @@ def viper(update, context):
         send_message(update.effective_message, reply_text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
         return
 
-    fetch = get(f'https://raw.githubusercontent.com/Viper-Devices/official_devices/master/{device}/build.json')
+    fetch = cached_get(f'https://raw.githubusercontent.com/Viper-Devices/official_devices/master/{device}/build.json')
     if fetch.status_code == 200:
         usr = fetch.json()
         response = usr['response'][0]
@@ -344,7 +360,7 @@ def viper(update, context):
 def enesrelease(update, context):
     args = context.args
     message = update.effective_message
-    usr = get(f'https://api.github.com/repos/EnesSastim/Downloads/releases/latest').json()
+    usr = cached_get(f'https://api.github.com/repos/EnesSastim/Downloads/releases/latest').json()
     reply_text = "*Enes Sastim's lastest upload(s)*\n"
     for i in range(len(usr)):
         try:
@@ -359,7 +375,7 @@ def enesrelease(update, context):
 def descendant(update, context):
     args = context.args
     message = update.effective_message
-    usr = get(f'https://api.github.com/repos/Descendant/InOps/releases/latest').json()
+    usr = cached_get(f'https://api.github.com/repos/Descendant/InOps/releases/latest').json()
     reply_text = "*Descendant GSI Download(s)*\n"
     for i in range(len(usr)):
         try:
@@ -385,7 +401,7 @@ def los(update, context):
                            disable_web_page_preview=True)
         return
 
-    fetch = get(f'https://download.lineageos.org/api/v1/{device}/nightly/*')
+    fetch = cached_get(f'https://download.lineageos.org/api/v1/{device}/nightly/*')
     if fetch.status_code == 200 and len(fetch.json()['response']) != 0:
         usr = fetch.json()
         response = usr['response'][0]
@@ -435,7 +451,7 @@ def evo(update, context):
     if device == "x01bd":
         device = "X01BD"
 
-    fetch = get(
+    fetch = cached_get(
         f'https://raw.githubusercontent.com/Evolution-X-Devices/official_devices/master/builds/{device}.json'
     )
 
@@ -507,7 +523,7 @@ def phh(update, context):
     message = update.effective_message
     chat = update.effective_chat  # type: Optional[Chat]
 
-    usr = get(
+    usr = cached_get(
         f'https://api.github.com/repos/phhusson/treble_experimentations/releases/latest'
     ).json()
     reply_text = "*{} latest release(s)*\n".format(romname)
@@ -535,7 +551,7 @@ def bootleggers(update, context):
                            disable_web_page_preview=True)
         return
 
-    fetch = get('https://bootleggersrom-devices.github.io/api/devices.json')
+    fetch = cached_get('https://bootleggersrom-devices.github.io/api/devices.json')
     if fetch.status_code == 200:
         nestedjson = fetch.json()
 
@@ -3,15 +3,17 @@ from typing import Optional, List
 
 from telegram import Message, Chat, Update, Bot, User, InlineKeyboardButton, InlineKeyboardMarkup, ParseMode, ChatPermissions
 from telegram.error import BadRequest
-from telegram.ext import Filters, MessageHandler, CommandHandler, run_async, CallbackQueryHandler
+from telegram.ext import Filters, MessageHandler, CommandHandler, CallbackQueryHandler
 from telegram.utils.helpers import mention_html, escape_markdown
 
 from metabutler import dispatcher
+from metabutler.modules.helper_funcs import pipeline
 from metabutler.modules.helper_funcs.chat_status import is_user_admin, user_admin, can_restrict
 from metabutler.modules.helper_funcs.string_handling import extract_time
 from metabutler.modules.log_channel import loggable
 from metabutler.modules.sql import antiflood_sql as sql
 from metabutler.modules.connection import connected
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.helper_funcs.alternate import send_message
 
@@ -28,15 +30,14 @@ def check_flood(update, context) -> str:
     if not user:  # ignore channels
         return ""
 
-    # ignore admins
-    if is_user_admin(chat, user.id):
-        sql.update_flood(chat.id, None)
-        return ""
-
     should_ban = sql.update_flood(chat.id, user.id)
     if not should_ban:
         return ""
 
+    # ignore admins, only checked once someone actually flooded
+    if is_user_admin(chat, user.id):
+        return ""
+
     try:
         getmode, getvalue = sql.get_flood_setting(chat.id)
         if getmode == 1:
@@ -62,6 +63,7 @@ def check_flood(update, context) -> str:
             context.bot.restrict_chat_member(chat.id, user.id, until_date=mutetime, permissions=ChatPermissions(can_send_messages=False))
             execstrings = "Now you shutup for {}!".format(getvalue)
             tag = "TMUTE"
+        pipeline.halt()
         send_message(update.effective_message, "I like to leave the flooding to natural disasters. But you, you were just a disappointment. {}".format(execstrings))
 
         return "<b>{}:</b>" \
@@ -145,6 +147,51 @@ def set_flood(update, context) -> str:
     return ""
 
 
+@run_async
+@user_admin
+@loggable
+def set_flood_timer(update, context) -> str:
+    chat = update.effective_chat  # type: Optional[Chat]
+    user = update.effective_user  # type: Optional[User]
+    args = context.args
+
+    conn = connected(context.bot, update, chat, user.id, need_admin=True)
+    if conn:
+        chat_id = conn
+        chat_name = dispatcher.bot.getChat(conn).title
+    else:
+        if update.effective_message.chat.type == "private":
+            send_message(update.effective_message, "You can do this command in groups, not PM")
+            return ""
+        chat_id = update.effective_chat.id
+        chat_name = update.effective_message.chat.title
+
+    if not args:
+        send_message(update.effective_message, "Flood messages are currently counted over *{}* seconds. Use `/setfloodtimer <seconds>` to change it.".format(sql.get_flood_window(chat_id)), parse_mode="markdown")
+        return ""
+
+    val = args[0].lower()
+    if val.endswith("s"):
+        val = val[:-1]
+    elif val.endswith("m") and val[:-1].isdigit():
+        val = str(int(val[:-1]) * 60)
+    if not val.isdigit() or not 1 <= int(val) <= 3600:
+        send_message(update.effective_message, "The timer has to be a number of seconds between 1 and 3600.")
+        return ""
+
+    sql.set_flood_window(chat_id, int(val))
+    if conn:
+        text = "Flood messages are now counted over *{}* seconds in *{}*.".format(val, chat_name)
+    else:
+        text = "Flood messages are now counted over *{}* seconds.".format(val)
+    send_message(update.effective_message, text, parse_mode="markdown")
+    return "<b>{}:</b>" \
+           "\n#SETFLOODTIMER" \
+           "\n<b>Admin:</b> {}" \
+           "\nSet antiflood timer to <code>{}</code> seconds.".format(html.escape(chat_name),
+                                                                   mention_html(user.id, user.first_name), val)
+
+
 @run_async
 def flood(update, context):
     chat = update.effective_chat  # type: Optional[Chat]
@@ -181,10 +228,10 @@ def flood(update, context):
         elif getmode == 5:
             settypeflood = 'temporarily muted for {}'.format(getvalue)
         if conn:
-            text = "This chat is currently enforcing flood control after *{}* messages. Any users sending more than that amount of messages will be *{}* in *{}*.".format(limit, settypeflood, chat_name)
+            text = "This chat is currently enforcing flood control after *{}* messages in {} seconds. Any users sending more than that amount of messages will be *{}* in *{}*.".format(limit, sql.get_flood_window(chat_id), settypeflood, chat_name)
 #             text = "If member is flooding messages, they will got *{}* in *{}*.".format(settypeflood, chat_name)
         else:
-            text = "This chat is currently enforcing flood control after *{}* messages. Any users sending more than that amount of messages will be *{}*.".format(limit, settypeflood)
+            text = "This chat is currently enforcing flood control after *{}* messages in {} seconds. Any users sending more than that amount of messages will be *{}*.".format(limit, sql.get_flood_window(chat_id), settypeflood)
 #             text = "If member is flooding messages, they will got *{}*.".format(settypeflood)
         send_message(update.effective_message, text, parse_mode="markdown")
 #     else:
@@ -387,6 +434,7 @@ __help__ = """
 
 *Admin only:*
  - /setflood <int/'no'/'off'>: enables or disables flood control
+ - /setfloodtimer <seconds>: how many seconds the flood limit counts messages over (default 10)
  - /setfloodmode <ban/kick/mute/tban/tmute> <value>: select the action perform when warnings have been exceeded. ban/kick/mute/tmute/tban
 
  Note:
@@ -402,11 +450,13 @@ __mod_name__ = "Antiflood"
 FLOOD_BAN_HANDLER = MessageHandler(Filters.all & ~Filters.status_update & Filters.group, check_flood)
 SET_FLOOD_HANDLER = CommandHandler("setflood", set_flood, pass_args=True, filters=Filters.group)
 SET_FLOOD_MODE_HANDLER = CommandHandler("setfloodmode", set_flood_mode, pass_args=True, filters=Filters.group)
+SET_FLOOD_TIMER_HANDLER = CommandHandler("setfloodtimer", set_flood_timer, pass_args=True, filters=Filters.group)
 FLOOD_HANDLER = CommandHandler("flood", flood, filters=Filters.group)
 # FLOOD_BTNSET_HANDLER = CallbackQueryHandler(FLOOD_EDITBTN, pattern=r"set_flim")
 
 dispatcher.add_handler(FLOOD_BAN_HANDLER, FLOOD_GROUP)
 dispatcher.add_handler(SET_FLOOD_HANDLER)
 dispatcher.add_handler(SET_FLOOD_MODE_HANDLER)
+dispatcher.add_handler(SET_FLOOD_TIMER_HANDLER)
 dispatcher.add_handler(FLOOD_HANDLER)
 # dispatcher.add_handler(FLOOD_BTNSET_HANDLER)
@@ -1,20 +1,23 @@
-import json, time, os
+import io, json, time, os, tempfile
+from collections import Counter, OrderedDict
 from io import BytesIO
 from typing import Optional
 
 from telegram import MAX_MESSAGE_LENGTH, ParseMode, InlineKeyboardMarkup
 from telegram import Message, Chat, Update, Bot
 from telegram.error import BadRequest
-from telegram.ext import CommandHandler, run_async, Filters
+from telegram.ext import CommandHandler, Filters
 
 import metabutler.modules.sql.notes_sql as sql
 from metabutler import dispatcher, LOGGER, OWNER_ID, SUDO_USERS, TEMPORARY_DATA
 from metabutler.__main__ import DATA_IMPORT
+from metabutler.modules.sql import batched_session
 from metabutler.modules.helper_funcs.chat_status import user_admin
 from metabutler.modules.helper_funcs.misc import build_keyboard, revert_buttons
 from metabutler.modules.helper_funcs.msg_types import get_note_type
 from metabutler.modules.rules import get_rules
 from metabutler.modules.helper_funcs.string_handling import button_markdown_parser, make_time
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 # SQL
 import metabutler.modules.sql.antiflood_sql as antifloodsql
@@ -68,411 +71,40 @@ def import_data(update, context):
 			send_message(update.effective_message, "Try downloading and reuploading the file as yourself before importing - this one seems to be iffy!")
 			return
 
-		with BytesIO() as file:
+		with tempfile.TemporaryFile() as file:
 			file_info.download(out=file)
 			file.seek(0)
-			data = json.load(file)
+			backup = io.TextIOWrapper(file, encoding="utf-8")
+			header = backup_header(backup.readline())
+			if header:
+				# streamed backup, restored one record at a time
+				importer = BackupImporter(chat_id, header.get('bot_id') == context.bot.id)
+				try:
+					with batched_session():
+						for line in backup:
+							if line.strip():
+								importer.import_record(json.loads(line))
+				except Exception:
+					send_message(update.effective_message, "An exception occured while restoring your data from Metabutler backup!", parse_mode="markdown")
+					LOGGER.exception("An error when importing from Metabutler base!")
+					return
+				finally:
+					reload_chat_caches(chat_id)
+				importer.send_report(update, context, conn, chat_name)
+				return
+			backup.seek(0)
+			data = json.load(backup)
 
 		try:
 			# If backup is from metabutler
 			if data.get('bot_base') == "Metabutler":
-				imp_antiflood = False
-				imp_blacklist = False
-				imp_blacklist_count = 0
-				imp_blsticker = False
-				imp_blsticker_count = 0
-				imp_disabled_count = 0
-				imp_filters_count = 0
-				imp_greet = False
-				imp_gdbye = False
-				imp_greet_pref = False
-				imp_locks = False
-				imp_notes = 0
-				imp_report = False
-				imp_rules = False
-				imp_lang = False
-				imp_warn = False
-				imp_warn_chat = 0
-				imp_warn_filter = 0
-				NOT_IMPORTED = "This cannot be imported because from other bot."
-				NOT_IMPORTED_INT = 0
-				# If backup is from this bot, import all files
-				if data.get('bot_id') == context.bot.id:
-					is_self = True
-				else:
-					is_self = False
-				if data.get('bot_base') == "Metabutler":
-					is_metabutler = True
-				else:
-					is_metabutler = False
-				# Import antiflood
-				if data.get('antiflood'):
-					imp_antiflood = True
-					flood_limit = data['antiflood'].get('flood_limit')
-					flood_mode = data['antiflood'].get('flood_mode')
-					flood_duration = data['antiflood'].get('flood_duration')
-
-					# Add to db
-					antifloodsql.set_flood(chat_id, int(flood_limit))
-					antifloodsql.set_flood_strength(chat_id, flood_mode, flood_duration)
-
-				# Import blacklist
-				if data.get('blacklists'):
-					imp_blacklist = True
-					blacklist_mode = data['blacklists'].get('blacklist_mode')
-					blacklist_duration = data['blacklists'].get('blacklist_duration')
-					blacklisted = data['blacklists'].get('blacklists')
-
-					# Add to db
-					blacklistsql.set_blacklist_strength(chat_id, blacklist_mode, blacklist_duration)
-					if blacklisted:
-						for x in blacklisted:
-							blacklistsql.add_to_blacklist(chat_id, x.lower())
-							imp_blacklist_count += 1
-
-				# Import blacklist sticker
-				if data.get('blstickers'):
-					imp_blsticker = True
-					blsticker_mode = data['blstickers'].get('blsticker_mode')
-					blsticker_duration = data['blstickers'].get('blsticker_duration')
-					blstickers = data['blstickers'].get('blstickers')
-
-					# Add to db
-					blackliststksql.set_blacklist_strength(chat_id, blsticker_mode, blsticker_duration)
-					if blstickers:
-						for x in blstickers:
-							blackliststksql.add_to_stickers(chat_id, x.lower())
-							imp_blsticker_count += 1
-
-				# Import disabled
-				if data.get('disabled'):
-					candisable = disabledsql.get_disableable()
-					if data['disabled'].get('disabled'):
-						for listdisabled in data['disabled'].get('disabled'):
-							if listdisabled in candisable:
-								disabledsql.disable_command(chat_id, listdisabled)
-								imp_disabled_count += 1
-
-				# Import filters
-				if data.get('filters'):
-					NOT_IMPORTED += "\n\nFilters:\n"
-					for x in data['filters'].get('filters'):
-						# If from self, import all
-						if is_self:
-							is_sticker = False
-							is_document = False
-							is_image = False
-							is_audio = False
-							is_voice = False
-							is_video = False
-							has_markdown = False
-							universal = False
-							if x['type'] == 1:
-								is_sticker = True
-							elif x['type'] == 2:
-								is_document = True
-							elif x['type'] == 3:
-								is_image = True
-							elif x['type'] == 4:
-								is_audio = True
-							elif x['type'] == 5:
-								is_voice = True
-							elif x['type'] == 6:
-								is_video = True
-							elif x['type'] == 0:
-								has_markdown = True
-							note_data, buttons = button_markdown_parser(x['reply'], entities=0)
-							filtersql.add_filter(chat_id, x['name'], note_data, is_sticker, is_document, is_image, is_audio, is_voice, is_video, buttons)
-							imp_filters_count += 1
-						elif is_metabutler:
-							is_sticker = False
-							is_document = False
-							is_image = False
-							is_audio = False
-							is_voice = False
-							is_video = False
-							has_markdown = False
-							universal = False
-							if x['type'] == 0:
-								has_markdown = True
-							else:
-								NOT_IMPORTED += "- {}\n".format(x['name'])
-								NOT_IMPORTED_INT += 1
-								continue
-							note_data, buttons = button_markdown_parser(x['reply'], entities=0)
-							filtersql.add_filter(chat_id, x['name'], note_data, is_sticker, is_document, is_image, is_audio, is_voice, is_video, buttons)
-							imp_filters_count += 1
-						else:
-							if x['has_markdown']:
-								note_data, buttons = button_markdown_parser(x['reply'], entities=0)
-								filtersql.add_filter(chat_id, x['name'], note_data, False, False, False, False, False, False, buttons)
-								imp_filters_count += 1
-							else:
-								NOT_IMPORTED += "- {}\n".format(x['name'])
-								NOT_IMPORTED_INT += 1
-
-				# Import greetings
-				if data.get('greetings'):
-					if data['greetings'].get('welcome'):
-						welcenable = data['greetings']['welcome'].get('enable')
-						welcsql.set_welc_preference(str(chat_id), bool(welcenable))
-
-						welctext = data['greetings']['welcome'].get('text')
-						welctype = data['greetings']['welcome'].get('type')
-						if welctype == 0:
-							welctype = Types.TEXT
-						elif welctype == 1:
-							welctype = Types.BUTTON_TEXT
-						elif welctype == 2:
-							welctype = Types.STICKER
-						elif welctype == 3:
-							welctype = Types.DOCUMENT
-						elif welctype == 4:
-							welctype = Types.PHOTO
-						elif welctype == 5:
-							welctype = Types.AUDIO
-						elif welctype == 6:
-							welctype = Types.VOICE
-						elif welctype == 7:
-							welctype = Types.VIDEO
-						elif welctype == 8:
-							welctype = Types.VIDEO_NOTE
-						else:
-							welctype = None
-						welccontent = data['greetings']['welcome'].get('content')
-						if welctext and welctype:
-							note_data, buttons = button_markdown_parser(welctext, entities=0)
-							welcsql.set_custom_welcome(chat_id, welccontent, note_data, welctype, buttons)
-							imp_greet = True
-					if data['greetings'].get('goodbye'):
-						gdbyenable = data['greetings']['goodbye'].get('enable')
-						welcsql.set_gdbye_preference(str(chat_id), bool(gdbyenable))
-
-						gdbytext = data['greetings']['goodbye'].get('text')
-						gdbytype = data['greetings']['goodbye'].get('type')
-						if gdbytype == 0:
-							gdbytype = Types.TEXT
-						elif gdbytype == 1:
-							gdbytype = Types.BUTTON_TEXT
-						elif gdbytype == 2:
-							gdbytype = Types.STICKER
-						elif gdbytype == 3:
-							gdbytype = Types.DOCUMENT
-						elif gdbytype == 4:
-							gdbytype = Types.PHOTO
-						elif gdbytype == 5:
-							gdbytype = Types.AUDIO
-						elif gdbytype == 6:
-							gdbytype = Types.VOICE
-						elif gdbytype == 7:
-							gdbytype = Types.VIDEO
-						elif gdbytype == 8:
-							gdbytype = Types.VIDEO_NOTE
-						else:
-							gdbytype = None
-						gdbycontent = data['greetings']['goodbye'].get('content')
-						if welctext and gdbytype:
-							note_data, buttons = button_markdown_parser(gdbytext, entities=0)
-							welcsql.set_custom_gdbye(chat_id, gdbycontent, note_data, gdbytype, buttons)
-							imp_gdbye = True
-
-				# clean service
-				cleanserv = data['greetings'].get('clean_service')
-				welcsql.set_clean_service(chat_id, bool(cleanserv))
-
-				# security welcome
-				if data['greetings'].get('security'):
-					secenable = data['greetings']['security'].get('enable')
-					secbtn = data['greetings']['security'].get('text')
-					sectime = data['greetings']['security'].get('time')
-					extra_verify = data['greetings']['security'].get('extra_verify')
-					if not extra_verify:
-						extra_verify = False
-					timeout = data['greetings']['security'].get('timeout')
-					if not timeout:
-						timeout = "0"
-					timeout_mode = data['greetings']['security'].get('timeout_mode')
-					if not timeout_mode:
-						timeout_mode = 1
-					welcsql.set_welcome_security(chat_id, extra_verify, bool(secenable), str(sectime), str(timeout), int(timeout_mode), str(secbtn))
-					imp_greet_pref = True
-
-				# Import language
-				if data['greetings'].get('language'):
-					lang = data['language'].get('language')
-					if lang:
-						if lang in ('en', 'id'):
-							langsql.set_lang(chat_id, lang)
-							imp_lang = True
-
-				# Import Locks
-				if data.get('locks'):
-					if data['locks'].get('lock_warn'):
-						locksql.set_lockconf(chat_id, True)
-					else:
-						locksql.set_lockconf(chat_id, False)
-					if data['locks'].get('locks'):
-						for x in list(data['locks'].get('locks')):
-							if x in LOCK_TYPES:
-								is_locked = data['locks']['locks'].get('x')
-								locksql.update_lock(chat_id, x, locked=is_locked)
-								imp_locks = True
-
-				# Import notes
-				if data.get('notes'):
-					allnotes = data['notes']
-					NOT_IMPORTED += "\n\nNotes:\n"
-					for x in allnotes:
-						# If from self, import all
-						if is_self:
-							note_data, buttons = button_markdown_parser(x['note_data'], entities=0)
-							note_name = x['note_tag']
-							note_file = None
-							note_type = x['note_type']
-							if x['note_file']:
-								note_file = x['note_file']
-							if note_type == 0:
-								note_type = Types.TEXT
-							elif note_type == 1:
-								note_type = Types.BUTTON_TEXT
-							elif note_type == 2:
-								note_type = Types.STICKER
-							elif note_type == 3:
-								note_type = Types.DOCUMENT
-							elif note_type == 4:
-								note_type = Types.PHOTO
-							elif note_type == 5:
-								note_type = Types.AUDIO
-							elif note_type == 6:
-								note_type = Types.VOICE
-							elif note_type == 7:
-								note_type = Types.VIDEO
-							elif note_type == 8:
-								note_type = Types.VIDEO_NOTE
-							else:
-								note_type = None
-							if note_type <= 8:
-								notesql.add_note_to_db(chat_id, note_name, note_data, note_type, buttons, note_file)
-								imp_notes += 1
-						elif is_metabutler:
-							note_data, buttons = button_markdown_parser(x['note_data'], entities=0)
-							note_name = x['note_tag']
-							note_file = None
-							note_type = x['note_type']
-							if x['note_file']:
-								note_file = x['note_file']
-							if note_type == 0:
-								note_type = Types.TEXT
-							elif note_type == 1:
-								note_type = Types.BUTTON_TEXT
-							else:
-								NOT_IMPORTED += "- {}\n".format(x['note_tag'])
-								NOT_IMPORTED_INT += 1
-								continue
-							if note_type <= 8:
-								notesql.add_note_to_db(chat_id, note_name, note_data, note_type, buttons, note_file)
-								imp_notes += 1
-						else:
-							# If this text
-							if x['note_type'] == 0:
-								note_data, buttons = button_markdown_parser(x['text'].replace("\\", ""), entities=0)
-								note_name = x['name']
-								notesql.add_note_to_db(chat_id, note_name, note_data, Types.TEXT, buttons, None)
-								imp_notes += 1
-							else:
-								NOT_IMPORTED += "- {}\n".format(x['name'])
-								NOT_IMPORTED_INT += 1
-
-				# Import reports
-				if data.get('report'):
-					reporting = data['report'].get('report')
-					reportsql.set_chat_setting(chat_id, bool(reporting))
-					imp_report = True
-
-				# Import rules
-				if data.get('rules'):
-					contrules = data['rules'].get('rules')
-					if contrules:
-						rulessql.set_rules(chat_id, contrules)
-						imp_rules = True
-
-				# Import warn config
-				if data.get('warns'):
-					warn_limit = data['warns'].get('warn_limit')
-					if warn_limit >= 3:
-						warnssql.set_warn_limit(chat_id, int(warn_limit))
-
-					warn_mode = data['warns'].get('warn_mode')
-					if warn_mode:
-						if warn_mode <= 3:
-							warnssql.set_warn_mode(chat_id, int(warn_mode))
-							imp_warn = True
-
-					# Import all warn filters
-					if data['warns'].get('warn_filters'):
-						for x in data['warns'].get('warn_filters'):
-							warnssql.add_warn_filter(chat_id, x['name'], x['reason'])
-							imp_warn_filter += 1
-
-					# Import all warn from backup chat, reset first for prevent overwarn
-					if data['warns'].get('chat_warns'):
-						for x in data['warns'].get('chat_warns'):
-							# If this invaild
-							if x['warns'] > warn_limit:
-								break
-							warnssql.reset_warns(x['user_id'], chat_id)
-							warnssql.import_warns(x['user_id'], chat_id, int(x['warns']), x['reasons'])
-							imp_warn_chat += 1
-
-				if conn:
-					text = "Backup fully imported in *{}*. Welcome back! 😀".format(chat_name)
-				else:
-					text = "Backup fully imported. Welcome back! 😀".format(chat_name)
-				text += "\n\nRestored:\n"
-				if imp_antiflood:
-					text += "- Antiflood Settings\n"
-				if imp_blacklist:
-					text += "- Blacklist Settings\n"
-				if imp_blacklist_count:
-					text += "- {} blacklists\n".format(imp_blacklist_count)
-				if imp_blsticker:
-					text += "- {} blacklist stickers\n".format(imp_blsticker_count)
-				if imp_disabled_count:
-					text += "- {} cmd disabled\n".format(imp_disabled_count)
-				if imp_filters_count:
-					text += "- {} filters\n".format(imp_filters_count)
-				if imp_greet_pref:
-					text += "- Greeting settings\n"
-				if imp_greet:
-					text += "- Greetings message\n"
-				if imp_gdbye:
-					text += "- Goodbye message\n"
-				if imp_locks:
-					text += "- Locked\n"
-				if imp_notes:
-					text += "- {} notes\n".format(imp_notes)
-				if imp_report:
-					text += "- Reporting setting\n"
-				if imp_rules:
-					text += "- Rules group\n"
-				if imp_lang:
-					text += "- Language settings\n"
-				if imp_warn:
-					text += "- Warn settings\n"
-				if imp_warn_chat:
-					text += "- {} user alert\n".format(imp_warn_chat)
-				if imp_warn_filter:
-					text += "- {} filter warning\n".format(imp_warn_filter)
+				importer = BackupImporter(chat_id, data.get('bot_id') == context.bot.id)
 				try:
-					send_message(update.effective_message, text, parse_mode="markdown")
-				except BadRequest:
-					send_message(update.effective_message, text, parse_mode="markdown", quote=False)
-				if NOT_IMPORTED_INT:
-					f = open("{}-notimported.txt".format(chat_id), "w")
-					f.write(str(NOT_IMPORTED))
-					f.close()
-					context.bot.sendDocument(chat_id, document=open('{}-notimported.txt'.format(chat_id), 'rb'), caption="*Data which can't be imported*", timeout=360, parse_mode=ParseMode.MARKDOWN)
-					os.remove("{}-notimported.txt".format(chat_id))
+					with batched_session():
+						importer.import_dict(data)
+				finally:
+					reload_chat_caches(chat_id)
+				importer.send_report(update, context, conn, chat_name)
 				return
 		except Exception as err:
 			send_message(update.effective_message, "An exception occured while restoring your data from Metabutler backup!", parse_mode="markdown")
@@ -735,8 +367,12 @@ def import_data(update, context):
 			data = data[list(data.keys())[0]]['hashes']
 
 		try:
-			for mod in DATA_IMPORT:
-				mod.__import_data__(str(chat_id), data)
+			try:
+				with batched_session():
+					for mod in DATA_IMPORT:
+						mod.__import_data__(str(chat_id), data)
+			finally:
+				reload_chat_caches(chat_id)
 		except Exception:
 			send_message(update.effective_message, "An exception occured while restoring your data. The process may not be complete. If "
                                                    "you have a problem with this, contact @AyraHikari with your backup file, so "
@@ -794,38 +430,70 @@ def export_data(update, context):
 			put_chat(chat_id, user.id, new_jam, chat_data)
 
 
-	# Backup version
-	# Revision: 07/07/2019
-	backup_ver = 1
-	bot_base = "Metabutler"
+	context.bot.sendChatAction(current_chat_id, "upload_document")
+	tgl = time.strftime("%H:%M:%S - %d/%m/%Y", time.localtime(time.time()))
+	try:
+		context.bot.sendMessage(TEMPORARY_DATA, "*Successfully backed up for:*\nChat name: `{}`\nID chat: `{}`\nat: `{}`".format(chat.title, chat_id, tgl), parse_mode=ParseMode.MARKDOWN)
+	except BadRequest:
+		pass
+
+	# One JSON record per line, written straight to a temporary file
+	with tempfile.TemporaryFile() as output:
+		for record in backup_records(chat_id, context.bot.id):
+			output.write((json.dumps(record, cls=SetEncoder) + "\n").encode("utf-8"))
+		output.seek(0)
+		send = context.bot.sendDocument(current_chat_id, document=output, filename="{}-Metabutler.backup".format(chat_id), caption="*Successfully backed up for:*\nChat: `{}`\nChat ID: `{}`\nAt: `{}`\n\nNote: This backup is specific to this bot, if it is imported to another bot then document, video, audio, voice, and other notes will be lost".format(chat.title, chat_id, tgl), timeout=360, reply_to_message_id=msg.message_id, parse_mode=ParseMode.MARKDOWN)
+	try:
+		# Send to temp data for prevent unexpected issue
+		context.bot.sendDocument(TEMPORARY_DATA, document=send.document.file_id, caption="*Successfully backed up for:*\nChat: `{}`\nChat ID: `{}`\nAt: `{}`\n\nNote: This backup is specific to this bot, if it is imported to another bot then document, video, audio, voice, and other notes will be lost".format(chat.title, chat_id, tgl), timeout=360, parse_mode=ParseMode.MARKDOWN)
+	except BadRequest:
+		pass
+
+
+# Backup version
+# Revision: 07/07/2019 - one JSON document
+# Revision: 18/10/2026 - header line, then one JSON record per line
+BACKUP_VERSION = 2
+BOT_BASE = "Metabutler"
+
+
+def backup_header(line):
+	# header of a streamed backup, None for anything else (older backups start with a bare "{")
+	try:
+		header = json.loads(line)
+	except ValueError:
+		return None
+	if isinstance(header, dict) and header.get('bot_base') == BOT_BASE and header.get('format') == "ndjson":
+		return header
+	return None
+
 
-	# Make sure this backup is for this bot
-	bot_id = context.bot.id
+def backup_records(chat_id, bot_id):
+	yield {"bot_id": bot_id, "bot_base": BOT_BASE, "version": BACKUP_VERSION, "format": "ndjson"}
 
 	# Backuping antiflood
 	flood_mode, flood_duration = antifloodsql.get_flood_setting(chat_id)
 	flood_limit = antifloodsql.get_flood_limit(chat_id)
-	antiflood = {'flood_mode': flood_mode, 'flood_duration': flood_duration, 'flood_limit': flood_limit}
+	yield {"section": "antiflood", 'flood_mode': flood_mode, 'flood_duration': flood_duration, 'flood_limit': flood_limit}
 
 	# Backuping blacklists
-	all_blacklisted = blacklistsql.get_chat_blacklist(chat_id)
-	blacklist_mode, blacklist_duration = blacklistsql.get_blacklist_setting(chat.id)
-	blacklists = {'blacklist_mode': blacklist_mode, 'blacklist_duration': blacklist_duration, 'blacklists': all_blacklisted}
+	blacklist_mode, blacklist_duration = blacklistsql.get_blacklist_setting(chat_id)
+	yield {"section": "blacklists", 'blacklist_mode': blacklist_mode, 'blacklist_duration': blacklist_duration}
+	for trigger in blacklistsql.get_chat_blacklist(chat_id):
+		yield {"section": "blacklist", "trigger": trigger}
 
 	# Backuping blacklists sticker
-	all_blsticker = blackliststksql.get_chat_stickers(chat_id)
-	blsticker_mode, blsticker_duration = blacklistsql.get_blacklist_setting(chat.id)
-	blstickers = {'blsticker_mode': blsticker_mode, 'blsticker_duration': blsticker_duration, 'blstickers': all_blsticker}
+	blsticker_mode, blsticker_duration = blackliststksql.get_blacklist_setting(chat_id)
+	yield {"section": "blstickers", 'blsticker_mode': blsticker_mode, 'blsticker_duration': blsticker_duration}
+	for trigger in blackliststksql.get_chat_stickers(chat_id):
+		yield {"section": "blsticker", "trigger": trigger}
 
 	# Backuping disabled
-	cmd_disabled = disabledsql.get_all_disabled(chat_id)
-	disabled = {'disabled': cmd_disabled}
+	yield {"section": "disabled", 'disabled': disabledsql.get_all_disabled(chat_id)}
 
 	# Backuping filters
-	all_filters = filtersql.get_chat_triggers(chat_id)
-	filters_gen = []
-	for x in all_filters:
-		filt = filtersql.get_filter(chat.id, x)
+	for x in filtersql.get_chat_triggers(chat_id):
+		filt = filtersql.get_filter(chat_id, x)
 		if filt.is_sticker:
 			filt_type = 1
 		elif filt.is_document:
@@ -842,34 +510,23 @@ def export_data(update, context):
 			filt_type = 0
 		else:
 			filt_type = 7
-		filters_gen.append({"name": x, "reply": filt.reply, "type": filt_type})
-	filters = {'filters': filters_gen}
+		yield {"section": "filter", "name": x, "reply": filt.reply, "type": filt_type}
 
 	# Backuping greetings msg and config
-	greetings = {}
+	greetings = {"section": "greetings"}
 	pref, welcome_m, cust_content, welcome_type = welcsql.get_welc_pref(chat_id)
-	if not welcome_m:
-		welcome_m = ""
-	if not cust_content:
-		cust_content = ""
-	buttons = welcsql.get_welc_buttons(chat_id)
-	welcome_m += revert_buttons(buttons)
-	greetings["welcome"] = {"enable": pref, "text": welcome_m, "content": cust_content, "type": welcome_type}
+	welcome_m = (welcome_m or "") + revert_buttons(welcsql.get_welc_buttons(chat_id))
+	greetings["welcome"] = {"enable": pref, "text": welcome_m, "content": cust_content or "", "type": welcome_type}
 
 	pref, goodbye_m, cust_content, goodbye_type = welcsql.get_gdbye_pref(chat_id)
-	if not goodbye_m:
-		goodbye_m = ""
-	if not cust_content:
-		cust_content = ""
-	buttons = welcsql.get_gdbye_buttons(chat_id)
-	goodbye_m += revert_buttons(buttons)
-	greetings["goodbye"] = {"enable": pref, "text": goodbye_m, "content": cust_content, "type": goodbye_type}
+	goodbye_m = (goodbye_m or "") + revert_buttons(welcsql.get_gdbye_buttons(chat_id))
+	greetings["goodbye"] = {"enable": pref, "text": goodbye_m, "content": cust_content or "", "type": goodbye_type}
 
-	curr = welcsql.clean_service(chat_id)
-	greetings["clean_service"] = curr
+	greetings["clean_service"] = welcsql.clean_service(chat_id)
 
 	getcur, cur_value, extra_verify, timeout, timeout_mode, cust_text = welcsql.welcome_security(chat_id)
 	greetings["security"] = {"enable": getcur, "text": cust_text, "time": cur_value, "extra_verify": extra_verify, "timeout": timeout, "timeout_mode": timeout_mode}
+	yield greetings
 
 	# Backuping locks
 	curr_locks = locksql.get_locks(chat_id)
@@ -906,23 +563,13 @@ def export_data(update, context):
 	else:
 		locked_restr = {}
 
-	lock_warn = locksql.get_lockconf(chat_id)
-
-	locks = {'lock_warn': lock_warn, 'locks': locked_lock, 'restrict': locked_restr}
+	yield {"section": "locks", 'lock_warn': locksql.get_lockconf(chat_id), 'locks': locked_lock, 'restrict': locked_restr}
 
-	# Backuping notes
-	note_list = notesql.get_all_chat_notes(chat_id)
-	notes = []
-	for note in note_list:
-		buttonlist = ""
-		note_tag = note.name
-		note_type = note.msgtype
-		getnote = notesql.get_note(chat_id, note.name)
+	# Backuping notes, a batch at a time
+	for note, tombol in notesql.iter_chat_notes(chat_id):
 		if not note.value:
 			note_data = ""
 		else:
-			tombol = notesql.get_buttons(chat_id, note_tag)
-			keyb = []
 			buttonlist = ""
 			for btn in tombol:
 				if btn.same_line:
@@ -930,54 +577,263 @@ def export_data(update, context):
 				else:
 					buttonlist += "[{}](buttonurl:{})\n".format(btn.name, btn.url)
 			note_data = "{}\n\n{}".format(note.value, buttonlist)
-		note_file = note.file
-		if not note_file:
-			note_file = ""
-		notes.append({"note_tag": note_tag, "note_data": note_data, "note_file": note_file, "note_type": note_type})
+		yield {"section": "note", "note_tag": note.name, "note_data": note_data, "note_file": note.file or "", "note_type": note.msgtype}
 
 	# Backuping reports
-	get_report = reportsql.user_should_report(chat_id)
-	report = {'report': get_report}
+	yield {"section": "report", 'report': reportsql.user_should_report(chat_id)}
 
 	# Backuping rules
-	getrules = rulessql.get_rules(chat_id)
-	rules = {"rules": getrules}
+	yield {"section": "rules", "rules": rulessql.get_rules(chat_id)}
 
-	# Backuping warns config and warn filters
+	# Backuping warns config, warn filters and all warnings in current chat
 	warn_limit, _, warn_mode = warnssql.get_warn_setting(chat_id)
-	all_handlers = warnssql.get_chat_warn_triggers(chat_id)
-	all_warn_filter = []
-	for x in all_handlers:
-		warnreply = warnssql.get_warn_filter(chat_id, x)
-		all_warn_filter.append({'name': x, 'reason': warnreply.reply})
-	if not warn_mode:
-		warn_mode = ""
-	# Get all warnings in current chat
-	allwarns = warnssql.get_allwarns(chat_id)
-	warns = {"warn_limit": warn_limit, "warn_mode": warn_mode, "warn_filters": all_warn_filter, "chat_warns": allwarns}
-
-
-	# Parsing backups
-	backup = {"bot_id": bot_id, "bot_base": bot_base, "antiflood": antiflood, "blacklists": blacklists, "blstickers": blstickers, "disabled": disabled, "filters": filters, "greetings": greetings, "locks": locks, "notes": notes, "report": report, "rules": rules, "warns": warns, "version": backup_ver}
-
-
-	all_backups = json.dumps(backup, indent=4, cls=SetEncoder)
-	f = open("{}-Metabutler.backup".format(chat_id), "w")
-	f.write(str(all_backups))
-	f.close()
-	context.bot.sendChatAction(current_chat_id, "upload_document")
-	tgl = time.strftime("%H:%M:%S - %d/%m/%Y", time.localtime(time.time()))
-	try:
-		context.bot.sendMessage(TEMPORARY_DATA, "*Successfully backed up for:*\nChat name: `{}`\nID chat: `{}`\nat: `{}`".format(chat.title, chat_id, tgl), parse_mode=ParseMode.MARKDOWN)
-	except BadRequest:
-		pass
-	send = context.bot.sendDocument(current_chat_id, document=open('{}-Metabutler.backup'.format(chat_id), 'rb'), caption="*Successfully backed up for:*\nChat: `{}`\nChat ID: `{}`\nAt: `{}`\n\nNote: This backup is specific to this bot, if it is imported to another bot then document, video, audio, voice, and other notes will be lost".format(chat.title, chat_id, tgl), timeout=360, reply_to_message_id=msg.message_id, parse_mode=ParseMode.MARKDOWN)
+	yield {"section": "warns", "warn_limit": warn_limit, "warn_mode": warn_mode or ""}
+	for x in warnssql.get_chat_warn_triggers(chat_id):
+		yield {"section": "warn_filter", 'name': x, 'reason': warnssql.get_warn_filter(chat_id, x).reply}
+	for x in warnssql.iter_chat_warns(chat_id):
+		yield dict(x, section="chat_warn")
+
+
+def backup_type(value):
 	try:
-		# Send to temp data for prevent unexpected issue
-		context.bot.sendDocument(TEMPORARY_DATA, document=send.document.file_id, caption="*Successfully backed up for:*\nChat: `{}`\nChat ID: `{}`\nAt: `{}`\n\nNote: This backup is specific to this bot, if it is imported to another bot then document, video, audio, voice, and other notes will be lost".format(chat.title, chat_id, tgl), timeout=360, parse_mode=ParseMode.MARKDOWN)
-	except BadRequest:
-		pass
-	os.remove("{}-Metabutler.backup".format(chat_id)) # Cleaning file
+		return Types(value)
+	except ValueError:
+		return None
+
+
+def reload_chat_caches(chat_id):
+	# The import runs in one transaction, but the modules update their caches right after their own commit(),
+	# which only flushes inside it. Re-read the chat once it is over, so a rolled back import leaves nothing behind.
+	for module in (antifloodsql, blacklistsql, blackliststksql, disabledsql, filtersql, locksql, warnssql, welcsql):
+		module.reload_chat(chat_id)
+	notesql.invalidate_chat(chat_id)
+
+
+class BackupImporter(object):
+	"""
+	Restores a Metabutler backup into one chat. Single-document backups go through import_dict, streamed ones
+	through import_record; both carry the same sections, the streamed format just has one record per list item.
+	"""
+
+	SECTIONS = ('antiflood', 'blacklists', 'blacklist', 'blstickers', 'blsticker', 'disabled', 'filter', 'greetings',
+				'locks', 'note', 'report', 'rules', 'warns', 'warn_filter', 'chat_warn')
+
+	def __init__(self, chat_id, is_self):
+		self.chat_id = chat_id
+		self.is_self = is_self  # backups of this bot keep their media
+		self.imported = Counter()
+		self.not_imported = OrderedDict()  # section -> names of items only this bot could restore
+		self.warn_limit = None
+		self.warns_stopped = False
+
+	def skip(self, section, name):
+		self.not_imported.setdefault(section, []).append(name)
+
+	def import_record(self, record):
+		section = record.get('section')
+		if section in self.SECTIONS:
+			getattr(self, 'import_' + section)(record)
+
+	def import_dict(self, data):
+		if data.get('antiflood'):
+			self.import_antiflood(data['antiflood'])
+		if data.get('blacklists'):
+			self.import_blacklists(data['blacklists'])
+			for trigger in data['blacklists'].get('blacklists') or []:
+				self.import_blacklist({'trigger': trigger})
+		if data.get('blstickers'):
+			self.import_blstickers(data['blstickers'])
+			for trigger in data['blstickers'].get('blstickers') or []:
+				self.import_blsticker({'trigger': trigger})
+		if data.get('disabled'):
+			self.import_disabled(data['disabled'])
+		if data.get('filters'):
+			for x in data['filters'].get('filters') or []:
+				self.import_filter(x)
+		if data.get('greetings'):
+			self.import_greetings(data['greetings'])
+		if data.get('locks'):
+			self.import_locks(data['locks'])
+		for x in data.get('notes') or []:
+			self.import_note(x)
+		if data.get('report'):
+			self.import_report(data['report'])
+		if data.get('rules'):
+			self.import_rules(data['rules'])
+		if data.get('warns'):
+			self.import_warns(data['warns'])
+			for x in data['warns'].get('warn_filters') or []:
+				self.import_warn_filter(x)
+			for x in data['warns'].get('chat_warns') or []:
+				self.import_chat_warn(x)
+
+	def import_antiflood(self, section):
+		antifloodsql.set_flood(self.chat_id, int(section.get('flood_limit')))
+		antifloodsql.set_flood_strength(self.chat_id, section.get('flood_mode'), section.get('flood_duration'))
+		self.imported['antiflood'] = 1
+
+	def import_blacklists(self, section):
+		blacklistsql.set_blacklist_strength(self.chat_id, section.get('blacklist_mode'), section.get('blacklist_duration'))
+		self.imported['blacklist'] = 1
+
+	def import_blacklist(self, record):
+		blacklistsql.add_to_blacklist(self.chat_id, record['trigger'].lower())
+		self.imported['blacklists'] += 1
+
+	def import_blstickers(self, section):
+		blackliststksql.set_blacklist_strength(self.chat_id, section.get('blsticker_mode'), section.get('blsticker_duration'))
+		self.imported['blsticker'] = 1
+
+	def import_blsticker(self, record):
+		blackliststksql.add_to_stickers(self.chat_id, record['trigger'].lower())
+		self.imported['blstickers'] += 1
+
+	def import_disabled(self, section):
+		candisable = disabledsql.get_disableable()
+		for listdisabled in section.get('disabled') or []:
+			if listdisabled in candisable:
+				disabledsql.disable_command(self.chat_id, listdisabled)
+				self.imported['disabled'] += 1
+
+	def import_filter(self, x):
+		# Media only survives in backups of this bot
+		if not self.is_self and x['type'] != 0:
+			self.skip("Filters", x['name'])
+			return
+		# sticker, document, image, audio, voice, video
+		flags = [x['type'] == filt_type for filt_type in range(1, 7)]
+		note_data, buttons = button_markdown_parser(x['reply'], entities=0)
+		filtersql.add_filter(self.chat_id, x['name'], note_data, *flags, buttons)
+		self.imported['filters'] += 1
+
+	def import_greetings(self, section):
+		if section.get('welcome'):
+			welcsql.set_welc_preference(str(self.chat_id), bool(section['welcome'].get('enable')))
+			welctext = section['welcome'].get('text')
+			welctype = backup_type(section['welcome'].get('type'))
+			if welctext and welctype is not None:
+				note_data, buttons = button_markdown_parser(welctext, entities=0)
+				welcsql.set_custom_welcome(self.chat_id, section['welcome'].get('content'), note_data, welctype, buttons)
+				self.imported['greet'] = 1
+		if section.get('goodbye'):
+			welcsql.set_gdbye_preference(str(self.chat_id), bool(section['goodbye'].get('enable')))
+			gdbytext = section['goodbye'].get('text')
+			gdbytype = backup_type(section['goodbye'].get('type'))
+			if gdbytext and gdbytype is not None:
+				note_data, buttons = button_markdown_parser(gdbytext, entities=0)
+				welcsql.set_custom_gdbye(self.chat_id, section['goodbye'].get('content'), note_data, gdbytype, buttons)
+				self.imported['gdbye'] = 1
+
+		# clean service
+		welcsql.set_clean_service(self.chat_id, bool(section.get('clean_service')))
+
+		# security welcome
+		if section.get('security'):
+			security = section['security']
+			welcsql.set_welcome_security(self.chat_id, security.get('extra_verify') or False, bool(security.get('enable')),
+										 str(security.get('time')), str(security.get('timeout') or "0"),
+										 int(security.get('timeout_mode') or 1), str(security.get('text')))
+			self.imported['greet_pref'] = 1
+
+	def import_locks(self, section):
+		locksql.set_lockconf(self.chat_id, bool(section.get('lock_warn')))
+		for x in list(section.get('locks') or []):
+			if x in LOCK_TYPES:
+				locksql.update_lock(self.chat_id, x, locked=section['locks'].get(x))
+				self.imported['locks'] = 1
+
+	def import_note(self, x):
+		note_type = backup_type(x['note_type'])
+		# Media only survives in backups of this bot
+		if note_type is None or not self.is_self and note_type > Types.BUTTON_TEXT:
+			self.skip("Notes", x['note_tag'])
+			return
+		note_data, buttons = button_markdown_parser(x['note_data'], entities=0)
+		notesql.add_note_to_db(self.chat_id, x['note_tag'], note_data, note_type, buttons, x['note_file'] or None)
+		self.imported['notes'] += 1
+
+	def import_report(self, section):
+		reportsql.set_chat_setting(self.chat_id, bool(section.get('report')))
+		self.imported['report'] = 1
+
+	def import_rules(self, section):
+		if section.get('rules'):
+			rulessql.set_rules(self.chat_id, section['rules'])
+			self.imported['rules'] = 1
+
+	def import_warns(self, section):
+		warn_limit = section.get('warn_limit')
+		if warn_limit >= 3:
+			warnssql.set_warn_limit(self.chat_id, int(warn_limit))
+		self.warn_limit = warn_limit
+
+		warn_mode = section.get('warn_mode')
+		if warn_mode and warn_mode <= 3:
+			warnssql.set_warn_mode(self.chat_id, int(warn_mode))
+			self.imported['warn'] = 1
+
+	def import_warn_filter(self, x):
+		warnssql.add_warn_filter(self.chat_id, x['name'], x['reason'])
+		self.imported['warn_filters'] += 1
+
+	def import_chat_warn(self, x):
+		# Reset first for prevent overwarn, stop at the first invalid entry
+		if self.warns_stopped or self.warn_limit is not None and x['warns'] > self.warn_limit:
+			self.warns_stopped = True
+			return
+		warnssql.reset_warns(x['user_id'], self.chat_id)
+		warnssql.import_warns(x['user_id'], self.chat_id, int(x['warns']), x['reasons'])
+		self.imported['chat_warns'] += 1
+
+	def send_report(self, update, context, conn, chat_name):
+		imported = self.imported
+		if conn:
+			text = "Backup fully imported in *{}*. Welcome back! 😀".format(chat_name)
+		else:
+			text = "Backup fully imported. Welcome back! 😀"
+		text += "\n\nRestored:\n"
+		if imported['antiflood']:
+			text += "- Antiflood Settings\n"
+		if imported['blacklist']:
+			text += "- Blacklist Settings\n"
+		if imported['blacklists']:
+			text += "- {} blacklists\n".format(imported['blacklists'])
+		if imported['blsticker']:
+			text += "- {} blacklist stickers\n".format(imported['blstickers'])
+		if imported['disabled']:
+			text += "- {} cmd disabled\n".format(imported['disabled'])
+		if imported['filters']:
+			text += "- {} filters\n".format(imported['filters'])
+		if imported['greet_pref']:
+			text += "- Greeting settings\n"
+		if imported['greet']:
+			text += "- Greetings message\n"
+		if imported['gdbye']:
+			text += "- Goodbye message\n"
+		if imported['locks']:
+			text += "- Locked\n"
+		if imported['notes']:
+			text += "- {} notes\n".format(imported['notes'])
+		if imported['report']:
+			text += "- Reporting setting\n"
+		if imported['rules']:
+			text += "- Rules group\n"
+		if imported['warn']:
+			text += "- Warn settings\n"
+		if imported['chat_warns']:
+			text += "- {} user alert\n".format(imported['chat_warns'])
+		if imported['warn_filters']:
+			text += "- {} filter warning\n".format(imported['warn_filters'])
+		try:
+			send_message(update.effective_message, text, parse_mode="markdown")
+		except BadRequest:
+			send_message(update.effective_message, text, parse_mode="markdown", quote=False)
+
+		if self.not_imported:
+			not_imported = "This cannot be imported because from other bot."
+			for section, names in self.not_imported.items():
+				not_imported += "\n\n{}:\n".format(section) + "".join("- {}\n".format(name) for name in names)
+			context.bot.sendDocument(self.chat_id, document=BytesIO(not_imported.encode("utf-8")), filename="{}-notimported.txt".format(self.chat_id), caption="*Data which can't be imported*", timeout=360, parse_mode=ParseMode.MARKDOWN)
 
 
 class SetEncoder(json.JSONEncoder):
@@ -3,11 +3,12 @@ from typing import Optional, List
 
 from telegram import Message, Chat, Update, Bot, User, ParseMode
 from telegram.error import BadRequest
-from telegram.ext import run_async, CommandHandler, Filters
+from telegram.ext import CommandHandler, Filters
 from telegram.utils.helpers import mention_html
 
 from metabutler import dispatcher, BAN_STICKER, LOGGER
 from metabutler.modules.disable import DisableAbleCommandHandler
+from metabutler.modules.helper_funcs.pipeline import run_async
 from metabutler.modules.helper_funcs.chat_status import bot_admin, user_admin, is_user_ban_protected, can_restrict, \
     is_user_admin, is_user_in_chat
 from metabutler.modules.helper_funcs.extraction import extract_user_and_text
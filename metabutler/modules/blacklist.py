@@ -1,16 +1,17 @@
 import html
-import re
 from typing import Optional, List
 
 from telegram import Message, Chat, Update, Bot, ParseMode
 from telegram.error import BadRequest
-from telegram.ext import CommandHandler, MessageHandler, Filters, run_async
+from telegram.ext import CommandHandler, MessageHandler, Filters
 from telegram.utils.helpers import mention_html, escape_markdown
 
 import metabutler.modules.sql.blacklist_sql as sql
 from metabutler import dispatcher, LOGGER, OWNER_ID
 from metabutler.modules.disable import DisableAbleCommandHandler
+from metabutler.modules.helper_funcs.pipeline import run_async
 from telegram.utils.helpers import mention_markdown
+from metabutler.modules.helper_funcs import pipeline
 from metabutler.modules.helper_funcs.chat_status import user_admin, user_not_admin
 from metabutler.modules.helper_funcs.extraction import extract_text
 from metabutler.modules.helper_funcs.misc import split_message
@@ -276,53 +277,54 @@ def del_blacklist(update, context):
 
 	getmode, value = sql.get_blacklist_setting(chat.id)
 
-	chat_filters = sql.get_chat_blacklist(chat.id)
-	for trigger in chat_filters:
-		pattern = r"( |^|[^\w])" + re.escape(trigger) + r"( |$|[^\w])"
-		if re.search(pattern, to_match, flags=re.IGNORECASE):
-			try:
-				if getmode == 0:
-					return
-				elif getmode == 1:
-					message.delete()
-				elif getmode == 2:
-					message.delete()
-					warn(update.effective_user, chat, "Say '{}' which in blacklist words".format(trigger), message, update.effective_user, conn=False)
-					return
-				elif getmode == 3:
-					message.delete()
-					bot.restrict_chat_member(chat.id, update.effective_user.id, can_send_messages=False)
-					bot.sendMessage(chat.id, "{} muted because say '{}' which in blacklist words".format(mention_markdown(user.id, user.first_name), trigger), parse_mode="markdown")
-					return
-				elif getmode == 4:
-					message.delete()
-					res = chat.unban_member(update.effective_user.id)
-					if res:
-						bot.sendMessage(chat.id, "{} kicked because say '{}' which in blacklist words".format(mention_markdown(user.id, user.first_name), trigger), parse_mode="markdown")
-					return
-				elif getmode == 5:
-					message.delete()
-					chat.kick_member(user.id)
-					bot.sendMessage(chat.id, "{} banned because say '{}' which in blacklist words".format(mention_markdown(user.id, user.first_name), trigger), parse_mode="markdown")
-					return
-				elif getmode == 6:
-					message.delete()
-					bantime = extract_time(message, value)
-					chat.kick_member(user.id, until_date=bantime)
-					bot.sendMessage(chat.id, "{} banned for {} because say '{}' which in blacklist words".format(mention_markdown(user.id, user.first_name), value, trigger), parse_mode="markdown")
-					return
-				elif getmode == 7:
-					message.delete()
-					mutetime = extract_time(message, value)
-					bot.restrict_chat_member(chat.id, user.id, until_date=mutetime, can_send_messages=False)
-					bot.sendMessage(chat.id, "{} muted for {} because say '{}' which in blacklist words".format(mention_markdown(user.id, user.first_name), value, trigger), parse_mode="markdown")
-					return
-			except BadRequest as excp:
-				if excp.message == "Message to delete not found":
-					pass
-				else:
-					LOGGER.exception("Error while deleting blacklist message.")
-			break
+	trigger = sql.match_blacklist(chat.id, to_match)
+	if trigger:
+		bot = context.bot
+		if getmode:
+			# every mode but "nothing" deletes the message
+			pipeline.halt()
+		try:
+			if getmode == 0:
+				return
+			elif getmode == 1:
+				message.delete()
+			elif getmode == 2:
+				message.delete()
+				warn(update.effective_user, chat, "Say '{}' which in blacklist words".format(trigger), message, update.effective_user, conn=False)
+				return
+			elif getmode == 3:
+				message.delete()
+				bot.restrict_chat_member(chat.id, update.effective_user.id, can_send_messages=False)
+				bot.sendMessage(chat.id, "{} muted because say '{}' which in blacklist words".format(mention_markdown(user.id, user.first_name), trigger), parse_mode="markdown")
+				return
+			elif getmode == 4:
+				message.delete()
+				res = chat.unban_member(update.effective_user.id)
+				if res:
+					bot.sendMessage(chat.id, "{} kicked because say '{}' which in blacklist words".format(mention_markdown(user.id, user.first_name), trigger), parse_mode="markdown")
+				return
+			elif getmode == 5:
+				message.delete()
+				chat.kick_member(user.id)
+				bot.sendMessage(chat.id, "{} banned because say '{}' which in blacklist words".format(mention_markdown(user.id, user.first_name), trigger), parse_mode="markdown")
+				return
+			elif getmode == 6:
+				message.delete()
+				bantime = extract_time(message, value)
+				chat.kick_member(user.id, until_date=bantime)
+				bot.sendMessage(chat.id, "{} banned for {} because say '{}' which in blacklist words".format(mention_markdown(user.id, user.first_name), value, trigger), parse_mode="markdown")
+				return
+			elif getmode == 7:
+				message.delete()
+				mutetime = extract_time(message, value)
+				bot.restrict_chat_member(chat.id, user.id, until_date=mutetime, can_send_messages=False)
+				bot.sendMessage(chat.id, "{} muted for {} because say '{}' which in blacklist words".format(mention_markdown(user.id, user.first_name), value, trigger), parse_mode="markdown")
+				return
+		except BadRequest as excp:
+			if excp.message == "Message to delete not found":
+				pass
+			else:
+				LOGGER.exception("Error while deleting blacklist message.")
 
 
 def __import_data__(chat_id, data):
@@ -6,12 +6,12 @@ from telegram import Message, Chat, Update, Bot, ParseMode, User, MessageEntity
 from telegram import TelegramError
 from telegram.error import BadRequest
 from telegram.ext import CommandHandler, MessageHandler, Filters
-from telegram.ext.dispatcher import run_async
 from telegram.utils.helpers import mention_html, mention_markdown
 
 import metabutler.modules.sql.blsticker_sql as sql
 from metabutler import dispatcher, SUDO_USERS, LOGGER, OWNER_ID
 from metabutler.modules.disable import DisableAbleCommandHandler
+from metabutler.modules.helper_funcs.pipeline import run_async
 from metabutler.modules.helper_funcs.chat_status import can_delete, is_user_admin, user_not_admin, user_admin, \
 		bot_can_delete, is_bot_admin
 from metabutler.modules.helper_funcs.filters import CustomFilters
@@ -3,16 +3,18 @@ from typing import Optional, List
 
 from telegram import Message, Chat, Update, Bot, User, ParseMode
 from telegram.error import BadRequest
-from telegram.ext import Filters, MessageHandler, CommandHandler, run_async
+from telegram.ext import Filters, MessageHandler, CommandHandler
 from telegram.utils.helpers import mention_html, escape_markdown
 
 from metabutler import CUSTOM_CMD, dispatcher, CustomCommandHandler
-from metabutler.modules.helper_funcs.chat_status import is_user_admin, user_admin, can_restrict, bot_can_delete
+from metabutler.modules.helper_funcs import pipeline
+from metabutler.modules.helper_funcs.chat_status import is_user_admin, user_admin, can_restrict, bot_can_delete, can_delete
 from metabutler.modules.helper_funcs.string_handling import extract_time
 from metabutler.modules.disable import DisableAbleCommandHandler
 from metabutler.modules.log_channel import loggable
 from metabutler.modules.sql import cleaner_sql as sql
 from metabutler.modules.connection import connected
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.helper_funcs.alternate import send_message
 
@@ -39,7 +41,7 @@ def clean_blue_text_must_click(update, context):
         chat = update.effective_chat
         message = update.effective_message
 
-        if chat.get_member(context.bot.id).can_delete_messages:
+        if can_delete(chat, context.bot.id):
                 if sql.is_enabled(chat.id):
                         fst_word = message.text.strip().split(None, 1)[0]
 
@@ -54,6 +56,7 @@ def clean_blue_text_must_click(update, context):
 
                                 if command[0] not in command_list:
                                         message.delete()
+                                        pipeline.halt()
 @run_async
 @bot_can_delete
 @user_admin
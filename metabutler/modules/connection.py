@@ -6,7 +6,6 @@ from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram import Message, Chat, Update, Bot, User, error
 from telegram.error import BadRequest
 from telegram.ext import CommandHandler, Filters, CallbackQueryHandler
-from telegram.ext.dispatcher import run_async
 from telegram.utils.helpers import mention_html
 
 import metabutler.modules.sql.connection_sql as sql
@@ -14,6 +13,7 @@ from metabutler import dispatcher, LOGGER, SUDO_USERS
 from metabutler.modules.helper_funcs.chat_status import bot_admin, user_admin, is_user_admin, can_restrict
 from metabutler.modules.helper_funcs.extraction import extract_user, extract_user_and_text
 from metabutler.modules.helper_funcs.string_handling import extract_time
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.helper_funcs.alternate import send_message
 
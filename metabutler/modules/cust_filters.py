@@ -1,11 +1,10 @@
-import re
 from typing import Optional
 
 import telegram
 from telegram import ParseMode, InlineKeyboardMarkup, Message, Chat
 from telegram import Update, Bot
 from telegram.error import BadRequest
-from telegram.ext import CommandHandler, MessageHandler, DispatcherHandlerStop, run_async, Filters
+from telegram.ext import CommandHandler, MessageHandler, DispatcherHandlerStop, Filters
 from telegram.utils.helpers import escape_markdown, mention_markdown
 
 from metabutler import dispatcher, LOGGER, OWNER_ID
@@ -17,6 +16,7 @@ from metabutler.modules.helper_funcs.misc import build_keyboard_parser
 from metabutler.modules.helper_funcs.msg_types import get_filter_type
 from metabutler.modules.helper_funcs.string_handling import split_quotes, button_markdown_parser, escape_invalid_curly_brackets
 from metabutler.modules.sql import cust_filters_sql as sql
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.connection import connected
 
@@ -212,105 +212,103 @@ def reply_filter(update, context):
 	if not to_match:
 		return
 
-	chat_filters = sql.get_chat_triggers(chat.id)
-	for keyword in chat_filters:
-		pattern = r"( |^|[^\w])" + re.escape(keyword) + r"( |$|[^\w])"
-		if re.search(pattern, to_match, flags=re.IGNORECASE):
-			filt = sql.get_filter(chat.id, keyword)
-			if filt.reply == "there is should be a new reply":
-				buttons = sql.get_buttons(chat.id, filt.keyword)
-				keyb = build_keyboard_parser(context.bot, chat.id, buttons)
-				keyboard = InlineKeyboardMarkup(keyb)
-
-				VALID_WELCOME_FORMATTERS = ['first', 'last', 'fullname', 'username', 'id', 'chatname', 'mention']
-				if filt.reply_text:
-					valid_format = escape_invalid_curly_brackets(filt.reply_text, VALID_WELCOME_FORMATTERS)
-					if valid_format:
-						filtext = valid_format.format(first=escape_markdown(message.from_user.first_name),
-													  last=escape_markdown(message.from_user.last_name or message.from_user.first_name),
-													  fullname=escape_markdown(" ".join([message.from_user.first_name, message.from_user.last_name] if message.from_user.last_name else [message.from_user.first_name])), username="@" + message.from_user.username if message.from_user.username else mention_markdown(message.from_user.id, message.from_user.first_name), mention=mention_markdown(message.from_user.id, message.from_user.first_name), chatname=escape_markdown(message.chat.title if message.chat.type != "private" else message.from_user.first_name), id=message.from_user.id)
-					else:
-						filtext = ""
-				else:
-					filtext = ""
+	keyword = sql.match_filter(chat.id, to_match)
+	if not keyword:
+		return
 
-				if filt.file_type in (sql.Types.BUTTON_TEXT, sql.Types.TEXT):
+	filt = sql.get_filter(chat.id, keyword)
+	if filt.reply == "there is should be a new reply":
+		buttons = sql.get_buttons(chat.id, filt.keyword)
+		keyb = build_keyboard_parser(context.bot, chat.id, buttons)
+		keyboard = InlineKeyboardMarkup(keyb)
+
+		VALID_WELCOME_FORMATTERS = ['first', 'last', 'fullname', 'username', 'id', 'chatname', 'mention']
+		if filt.reply_text:
+			valid_format = escape_invalid_curly_brackets(filt.reply_text, VALID_WELCOME_FORMATTERS)
+			if valid_format:
+				filtext = valid_format.format(first=escape_markdown(message.from_user.first_name),
+											  last=escape_markdown(message.from_user.last_name or message.from_user.first_name),
+											  fullname=escape_markdown(" ".join([message.from_user.first_name, message.from_user.last_name] if message.from_user.last_name else [message.from_user.first_name])), username="@" + message.from_user.username if message.from_user.username else mention_markdown(message.from_user.id, message.from_user.first_name), mention=mention_markdown(message.from_user.id, message.from_user.first_name), chatname=escape_markdown(message.chat.title if message.chat.type != "private" else message.from_user.first_name), id=message.from_user.id)
+			else:
+				filtext = ""
+		else:
+			filtext = ""
+
+		if filt.file_type in (sql.Types.BUTTON_TEXT, sql.Types.TEXT):
+			try:
+				context.bot.send_message(chat.id, filtext, reply_to_message_id=message.message_id,
+								 parse_mode="markdown", disable_web_page_preview=True,
+								 reply_markup=keyboard)
+			except BadRequest as excp:
+				error_catch = get_exception(excp, filt, chat)
+				if error_catch == "noreply":
 					try:
-						context.bot.send_message(chat.id, filtext, reply_to_message_id=message.message_id,
-										 parse_mode="markdown", disable_web_page_preview=True,
-										 reply_markup=keyboard)
+						context.bot.send_message(chat.id, filtext, parse_mode="markdown", disable_web_page_preview=True, reply_markup=keyboard)
 					except BadRequest as excp:
-						error_catch = get_exception(excp, filt, chat)
-						if error_catch == "noreply":
-							try:
-								context.bot.send_message(chat.id, filtext, parse_mode="markdown", disable_web_page_preview=True, reply_markup=keyboard)
-							except BadRequest as excp:
-								LOGGER.exception("Failed to send message: " + excp.message)
-								send_message(update.effective_message, get_exception(excp, filt, chat))
-								pass
-						else:
-							try:
-								send_message(update.effective_message, get_exception(excp, filt, chat))
-							except BadRequest as excp:
-								LOGGER.exception("Failed to send message: " + excp.message)
-								pass
+						LOGGER.exception("Failed to send message: " + excp.message)
+						send_message(update.effective_message, get_exception(excp, filt, chat))
+						pass
 				else:
-					ENUM_FUNC_MAP[filt.file_type](chat.id, filt.file_id, caption=filtext, reply_to_message_id=message.message_id, parse_mode="markdown", disable_web_page_preview=True, reply_markup=keyboard)
-				break
-			else:
-				if filt.is_sticker:
-					message.reply_sticker(filt.reply)
-				elif filt.is_document:
-					message.reply_document(filt.reply)
-				elif filt.is_image:
-					message.reply_photo(filt.reply)
-				elif filt.is_audio:
-					message.reply_audio(filt.reply)
-				elif filt.is_voice:
-					message.reply_voice(filt.reply)
-				elif filt.is_video:
-					message.reply_video(filt.reply)
-				elif filt.has_markdown:
-					buttons = sql.get_buttons(chat.id, filt.keyword)
-					keyb = build_keyboard_parser(context.bot, chat.id, buttons)
-					keyboard = InlineKeyboardMarkup(keyb)
-
 					try:
-						send_message(update.effective_message, filt.reply, parse_mode=ParseMode.MARKDOWN,
-										   disable_web_page_preview=True,
-										   reply_markup=keyboard)
+						send_message(update.effective_message, get_exception(excp, filt, chat))
 					except BadRequest as excp:
-						if excp.message == "Unsupported url protocol":
-							try:
-								send_message(update.effective_message, "You seem to be trying to use an unsupported url protocol. Telegram doesn't support buttons for some protocols, such as tg://. Please try again")
-							except BadRequest as excp:
-								LOGGER.exception("Failed to send message: " + excp.message)
-								pass
-						elif excp.message == "Reply message not found":
-							try:
-								context.bot.send_message(chat.id, filt.reply, parse_mode=ParseMode.MARKDOWN,
-												 disable_web_page_preview=True,
-												 reply_markup=keyboard)
-							except BadRequest as excp:
-								LOGGER.exception("Failed to send message: " + excp.message)
-								pass
-						else:
-							try:
-								send_message(update.effective_message, "This note could not be sent, as it is incorrectly formatted.")
-							except BadRequest as excp:
-								LOGGER.exception("Failed to send message: " + excp.message)
-								pass
-							LOGGER.warning("Message %s could not be parsed", str(filt.reply))
-							LOGGER.exception("Could not parse filter %s in chat %s", str(filt.keyword), str(chat.id))
-
+						LOGGER.exception("Failed to send message: " + excp.message)
+						pass
+		else:
+			ENUM_FUNC_MAP[filt.file_type](chat.id, filt.file_id, caption=filtext, reply_to_message_id=message.message_id, parse_mode="markdown", disable_web_page_preview=True, reply_markup=keyboard)
+	else:
+		if filt.is_sticker:
+			message.reply_sticker(filt.reply)
+		elif filt.is_document:
+			message.reply_document(filt.reply)
+		elif filt.is_image:
+			message.reply_photo(filt.reply)
+		elif filt.is_audio:
+			message.reply_audio(filt.reply)
+		elif filt.is_voice:
+			message.reply_voice(filt.reply)
+		elif filt.is_video:
+			message.reply_video(filt.reply)
+		elif filt.has_markdown:
+			buttons = sql.get_buttons(chat.id, filt.keyword)
+			keyb = build_keyboard_parser(context.bot, chat.id, buttons)
+			keyboard = InlineKeyboardMarkup(keyb)
+
+			try:
+				send_message(update.effective_message, filt.reply, parse_mode=ParseMode.MARKDOWN,
+								   disable_web_page_preview=True,
+								   reply_markup=keyboard)
+			except BadRequest as excp:
+				if excp.message == "Unsupported url protocol":
+					try:
+						send_message(update.effective_message, "You seem to be trying to use an unsupported url protocol. Telegram doesn't support buttons for some protocols, such as tg://. Please try again")
+					except BadRequest as excp:
+						LOGGER.exception("Failed to send message: " + excp.message)
+						pass
+				elif excp.message == "Reply message not found":
+					try:
+						context.bot.send_message(chat.id, filt.reply, parse_mode=ParseMode.MARKDOWN,
+										 disable_web_page_preview=True,
+										 reply_markup=keyboard)
+					except BadRequest as excp:
+						LOGGER.exception("Failed to send message: " + excp.message)
+						pass
 				else:
-					# LEGACY - all new filters will have has_markdown set to True.
 					try:
-						send_message(update.effective_message, filt.reply)
+						send_message(update.effective_message, "This note could not be sent, as it is incorrectly formatted.")
 					except BadRequest as excp:
 						LOGGER.exception("Failed to send message: " + excp.message)
 						pass
-				break
+					LOGGER.warning("Message %s could not be parsed", str(filt.reply))
+					LOGGER.exception("Could not parse filter %s in chat %s", str(filt.keyword), str(chat.id))
+
+		else:
+			# LEGACY - all new filters will have has_markdown set to True.
+			try:
+				send_message(update.effective_message, filt.reply)
+			except BadRequest as excp:
+				LOGGER.exception("Failed to send message: " + excp.message)
+				pass
 
 
 def get_exception(excp, filt, chat):
@@ -1,12 +1,12 @@
 from typing import Union, List, Optional
 
 from future.utils import string_types
-from telegram import ParseMode, Update, Bot, Chat, User, MessageEntity
+from telegram import ParseMode, Update, Bot, Chat, User
 from telegram.ext import CommandHandler, MessageHandler, Filters
 from telegram.utils.helpers import escape_markdown
 
 from metabutler import dispatcher, OWNER_ID
-from metabutler.modules.helper_funcs.handlers import CMD_STARTERS
+from metabutler.modules.helper_funcs.handlers import CMD_STARTERS, parse_command
 from metabutler.modules.helper_funcs.misc import is_module_loaded
 from metabutler.modules.connection import connected
 
@@ -17,9 +17,9 @@ FILENAME = __name__.rsplit(".", 1)[-1]
 # If module is due to be loaded, then setup all the magical handlers
 if is_module_loaded(FILENAME):
     from metabutler.modules.helper_funcs.chat_status import user_admin, is_user_admin
-    from telegram.ext.dispatcher import run_async
 
     from metabutler.modules.sql import disable_sql as sql
+    from metabutler.modules.helper_funcs.pipeline import run_async
 
     DISABLE_CMDS = []
     DISABLE_OTHER = []
@@ -40,39 +40,33 @@ if is_module_loaded(FILENAME):
             sql.disableable_cache(command)
 
         def check_update(self, update):
-            if isinstance(update, Update) and update.effective_message:
-                message = update.effective_message
+            parsed = parse_command(update)
+            if parsed is None or not parsed.entity:
+                return None
 
-                if (message.entities and message.entities[0].type == MessageEntity.BOT_COMMAND
-                        and message.entities[0].offset == 0):
-                    command = message.text[1:message.entities[0].length]
-                    args = message.text.split()[1:]
-                    command = command.split('@')
-                    command.append(message.bot.username)
+            if not (parsed.command in self.command
+                    and parsed.target == update.effective_message.bot.username.lower()):
+                return None
 
-                    if not (command[0].lower() in self.command
-                            and command[1].lower() == message.bot.username.lower()):
+            filter_result = self.filters(update)
+            if filter_result:
+                chat = update.effective_chat
+                user = update.effective_user
+                # disabled, admincmd, user admin
+                if sql.is_command_disabled(chat.id, parsed.command):
+                    # check if command was disabled
+                    is_disabled = parsed.command in ADMIN_CMDS and is_user_admin(chat, user.id)
+                    if not is_disabled and sql.is_disable_del(chat.id):
+                        # disabled and should delete
+                        update.effective_message.delete()
+                    if not is_disabled:
                         return None
-
-                    filter_result = self.filters(update)
-                    if filter_result:
-                        chat = update.effective_chat
-                        user = update.effective_user
-                        # disabled, admincmd, user admin
-                        if sql.is_command_disabled(chat.id, command[0].lower()):
-                            # check if command was disabled
-                            is_disabled = command[0] in ADMIN_CMDS and is_user_admin(chat, user.id)
-                            if not is_disabled and sql.is_disable_del(chat.id):
-                                # disabled and should delete
-                                update.effective_message.delete()
-                            if not is_disabled:
-                                return None
-                            else:
-                                return args, filter_result
-
-                        return args, filter_result
                     else:
-                        return False
+                        return parsed.args, filter_result
+
+                return parsed.args, filter_result
+            else:
+                return False
 
 
     class DisableAbleMessageHandler(MessageHandler):
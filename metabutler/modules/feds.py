@@ -1,4 +1,6 @@
 import html
+import io
+import tempfile
 from io import BytesIO
 from typing import Optional, List
 import random
@@ -7,24 +9,28 @@ import re
 import json
 import time
 import csv
-import os
+import threading
 from time import sleep
 
 from future.utils import string_types
-from telegram.error import BadRequest, TelegramError, Unauthorized
+from telegram.error import BadRequest, TelegramError, Unauthorized, RetryAfter
 from telegram import ParseMode, Update, Bot, Chat, User, MessageEntity, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import run_async, CommandHandler, MessageHandler, Filters, CallbackQueryHandler
+from telegram.ext import CommandHandler, MessageHandler, Filters, CallbackQueryHandler
 from telegram.utils.helpers import escape_markdown, mention_html, mention_markdown
 
-from metabutler import dispatcher, OWNER_ID, SUDO_USERS, WHITELIST_USERS, TEMPORARY_DATA, LOGGER, FED_LOGS
+from metabutler import dispatcher, updater, OWNER_ID, SUDO_USERS, WHITELIST_USERS, TEMPORARY_DATA, LOGGER, FED_LOGS
 from metabutler.modules.helper_funcs.handlers import CMD_STARTERS
 from metabutler.modules.helper_funcs.misc import is_module_loaded, send_to_list
 from metabutler.modules.helper_funcs.chat_status import is_user_admin
 from metabutler.modules.helper_funcs.extraction import extract_user, extract_unt_fedban, extract_user_fban
 from metabutler.modules.helper_funcs.string_handling import markdown_parser
+from metabutler.modules.helper_funcs.ratelimit import TokenBucket, KeyedTokenBuckets
+from metabutler.modules.helper_funcs.broadcast import BROADCASTER
 from metabutler.modules.disable import DisableAbleCommandHandler
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 import metabutler.modules.sql.feds_sql as sql
+import metabutler.modules.sql.fban_queue_sql as fanout_sql
 
 from metabutler.modules.connection import connected
 from metabutler.modules.helper_funcs.alternate import send_message
@@ -266,7 +272,7 @@ def user_join_fed(update, context):
                 fed_id = sql.get_fed_id(chat.id)
                 fed_info = sql.get_fed_info(fed_id)
                 info = sql.get_fed_info(fed_id)
-                get_owner = eval(info['fusers'])['owner']
+                get_owner = info['owner']
                 get_owner = context.bot.get_chat(get_owner).id
                 if user_id == get_owner:
                         send_message(update.effective_message, "Why are you trying to promote federated owner!?")
@@ -529,7 +535,6 @@ def fed_ban(update, context):
                         send_message(update.effective_message, "Failed to fbanning user! If this problem continues, contact my creator.")
                         return
 
-                fed_chats = sql.all_fed_chats(fed_id)
                 # Will send to current chat
                 context.bot.send_message(chat.id, "<b>FedBan Reason is updated</b>\n<b>Fed:</b> {}\n<b>Fed Admin:</b> {}\n<b>User:</b> {}\n<b>User ID:</b> <code>{}</code>\n<b>Reason:</b> {}".format(fed_name, mention_html(user.id, user.first_name), user_target, fban_user_id, reason), parse_mode="HTML")
                 # Send message to owner if fednotif is enabled
@@ -547,69 +552,8 @@ def fed_ban(update, context):
                 if get_fedlog:
                         if int(get_fedlog) != int(chat.id):
                                 context.bot.send_message(get_fedlog, "<b>FedBan Reason is updated</b>\n<b>Fed:</b> {}\n<b>Fed Admin:</b> {}\n<b>User:</b> {}\n<b>User ID:</b> <code>{}</code>\n<b>Reason:</b> {}".format(fed_name, mention_html(user.id, user.first_name), user_target, fban_user_id, reason), parse_mode="HTML")
-                for fedschat in fed_chats:
-                        try:
-                                # Do not spamming all fed chats
-                                """
-                                context.bot.send_message(fedschat, "<b>Alasan FedBan Diperbarui</b>" \
-                                                         "\n<b>Federasi:</b> {}" \
-                                                         "\n<b>Federasi Admin:</b> {}" \
-                                                         "\n<b>Pengguna:</b> {}" \
-                                                         "\n<b>Pengguna ID:</b> <code>{}</code>" \
-                                                         "\n<b>Alasan:</b> {}".format(fed_name, mention_html(user.id, user.first_name), user_target, fban_user_id, reason), parse_mode="HTML")
-                                """
-                                context.bot.kick_chat_member(fedschat, fban_user_id)
-                        except BadRequest as excp:
-                                if excp.message in FBAN_ERRORS:
-                                        try:
-                                                dispatcher.bot.getChat(fedschat)
-                                        except Unauthorized:
-                                                sql.chat_leave_fed(fedschat)
-                                                LOGGER.info("Chat {} has leave fed {} because bot is kicked".format(fedschat, info['fname']))
-                                                continue
-                                elif excp.message == "User_id_invalid":
-                                        break
-                                else:
-                                        LOGGER.warning("Unable to fban on {} because: {}".format(fedschat, excp.message))
-                        except TelegramError:
-                                pass
-
-                # Also do not spamming all fed admins
-                """
-                send_to_list(bot, FEDADMIN,
-                                 "<b>Alasan FedBan Diperbarui</b>" \
-                                 "\n<b>Federasi:</b> {}" \
-                                 "\n<b>Federasi Admin:</b> {}" \
-                                 "\n<b>Pengguna:</b> {}" \
-                                 "\n<b>Pengguna ID:</b> <code>{}</code>" \
-                                 "\n<b>Alasan:</b> {}".format(fed_name, mention_html(user.id, user.first_name), user_target, fban_user_id, reason), 
-                                html=True)
-                """
-
-                # Fban for fed subscriber
-                subscriber = list(sql.get_subscriber(fed_id))
-                if len(subscriber) != 0:
-                        for fedsid in subscriber:
-                                all_fedschat = sql.all_fed_chats(fedsid)
-                                for fedschat in all_fedschat:
-                                        try:
-                                                context.bot.kick_chat_member(fedschat, fban_user_id)
-                                        except BadRequest as excp:
-                                                if excp.message in FBAN_ERRORS:
-                                                        try:
-                                                                dispatcher.bot.getChat(fedschat)
-                                                        except Unauthorized:
-                                                                targetfed_id = sql.get_fed_id(fedschat)
-                                                                sql.unsubs_fed(fed_id, targetfed_id)
-                                                                LOGGER.info("Chat {} has unsub fed {} because bot is kicked".format(fedschat, info['fname']))
-                                                                continue
-                                                elif excp.message == "User_id_invalid":
-                                                        break
-                                                else:
-                                                        LOGGER.warning("Unable to fban on {} because: {}".format(fedschat, excp.message))
-                                        except TelegramError:
-                                                pass
-                send_message(update.effective_message, "Fedban Reason has been updated.")
+                queue_fed_action(fed_id, fban_user_id, 'ban', chat.id)
+                send_message(update.effective_message, "Fedban Reason has been updated. I will report here once the user is removed from all federation chats.")
                 return
 
         fed_name = info['fname']
@@ -625,7 +569,6 @@ def fed_ban(update, context):
                 send_message(update.effective_message, "Failed to fbanning user! If this problem continues, contact my creator.")
                 return
 
-        fed_chats = sql.all_fed_chats(fed_id)
         # Will send to current chat
         context.bot.send_message(chat.id, "<b>New FedBan</b>\n<b>Fed:</b> {}\n<b>Fed Admin:</b> {}\n<b>User:</b> {}\n<b>User ID:</b> <code>{}</code>\n<b>Reason:</b> {}".format(fed_name, mention_html(user.id, user.first_name), user_target, fban_user_id, reason), parse_mode="HTML")
         # Send message to owner if fednotif is enabled
@@ -636,64 +579,8 @@ def fed_ban(update, context):
         if get_fedlog:
                 if int(get_fedlog) != int(chat.id):
                         context.bot.send_message(get_fedlog, "<b>New FedBan</b>\n<b>Fed:</b> {}\n<b>Fed Admin:</b> {}\n<b>User:</b> {}\n<b>User ID:</b> <code>{}</code>\n<b>Reason:</b> {}".format(fed_name, mention_html(user.id, user.first_name), user_target, fban_user_id, reason), parse_mode="HTML")
-        for fedschat in fed_chats:
-                try:
-                        # Do not spamming all fed chats
-                        """
-                        context.bot.send_message(fedschat, "<b>FedBan baru</b>" \
-                                                 "\n<b>Federasi:</b> {}" \
-                                                 "\n<b>Federasi Admin:</b> {}" \
-                                                 "\n<b>Pengguna:</b> {}" \
-                                                 "\n<b>Pengguna ID:</b> <code>{}</code>" \
-                                                 "\n<b>Alasan:</b> {}".format(fed_name, mention_html(user.id, user.first_name), user_target, fban_user_id, reason), parse_mode="HTML")
-                        """
-                        context.bot.kick_chat_member(fedschat, fban_user_id)
-                except BadRequest as excp:
-                        if excp.message in FBAN_ERRORS:
-                                pass
-                        elif excp.message == "User_id_invalid":
-                                break
-                        else:
-                                LOGGER.warning("Unable to fban on {} because: {}".format(fedschat, excp.message))
-                except TelegramError:
-                        pass
-
-        # Also do not spamming all fed admins
-        """
-        send_to_list(bot, FEDADMIN,
-                         "<b>FedBan baru</b>" \
-                         "\n<b>Federasi:</b> {}" \
-                         "\n<b>Federasi Admin:</b> {}" \
-                         "\n<b>Pengguna:</b> {}" \
-                         "\n<b>Pengguna ID:</b> <code>{}</code>" \
-                         "\n<b>Alasan:</b> {}".format(fed_name, mention_html(user.id, user.first_name), user_target, fban_user_id, reason), 
-                        html=True)
-        """
-
-        # Fban for fed subscriber
-        subscriber = list(sql.get_subscriber(fed_id))
-        if len(subscriber) != 0:
-                for fedsid in subscriber:
-                        all_fedschat = sql.all_fed_chats(fedsid)
-                        for fedschat in all_fedschat:
-                                try:
-                                        context.bot.kick_chat_member(fedschat, fban_user_id)
-                                except BadRequest as excp:
-                                        if excp.message in FBAN_ERRORS:
-                                                try:
-                                                        dispatcher.bot.getChat(fedschat)
-                                                except Unauthorized:
-                                                        targetfed_id = sql.get_fed_id(fedschat)
-                                                        sql.unsubs_fed(fed_id, targetfed_id)
-                                                        LOGGER.info("Chat {} has unsub fed {} because bot is kicked".format(fedschat, info['fname']))
-                                                        continue
-                                        elif excp.message == "User_id_invalid":
-                                                break
-                                        else:
-                                                LOGGER.warning("Unable to fban on {} because: {}".format(fedschat, excp.message))
-                                except TelegramError:
-                                        pass
-        send_message(update.effective_message, "This person has been fbanned.")
+        queued = queue_fed_action(fed_id, fban_user_id, 'ban', chat.id)
+        send_message(update.effective_message, "This person has been fbanned. Removing them from {} federation chats in the background, I will report here when done.".format(queued))
 
 
 @run_async
@@ -763,7 +650,6 @@ def unfban(update, context):
 
         send_message(update.effective_message, "I will give {} second chance in this federation.".format(user_target), parse_mode="HTML")
 
-        chat_list = sql.all_fed_chats(fed_id)
         # Will send to current chat
         context.bot.send_message(chat.id, "<b>Un-FedBan</b>\n<b>Fed:</b> {}\n<b>Fed Admin:</b> {}\n<b>User:</b> {}\n<b>User ID:</b> <code>{}</code>".format(info['fname'], mention_html(user.id, user.first_name), user_target, fban_user_id), parse_mode="HTML")
         # Send message to owner if fednotif is enabled
@@ -780,29 +666,6 @@ def unfban(update, context):
         if get_fedlog:
                 if int(get_fedlog) != int(chat.id):
                         context.bot.send_message(get_fedlog, "<b>Un-FedBan</b>\n<b>Fed:</b> {}\n<b>Fed Admin:</b> {}\n<b>User:</b> {}\n<b>User ID:</b> <code>{}</code>".format(info['fname'], mention_html(user.id, user.first_name), user_target, fban_user_id), parse_mode="HTML")
-        for fedchats in chat_list:
-                try:
-                        member = context.bot.get_chat_member(fedchats, user_id)
-                        if member.status == 'kicked':
-                                context.bot.unban_chat_member(fedchats, user_id)
-                                # Do not spamming all fed chats
-                                """
-                                context.bot.send_message(fedchats, "<b>Un-FedBan</b>" \
-                                                 "\n<b>Federasi:</b> {}" \
-                                                 "\n<b>Federasi Admin:</b> {}" \
-                                                 "\n<b>Pengguna:</b> {}" \
-                                                 "\n<b>Pengguna ID:</b> <code>{}</code>".format(info['fname'], mention_html(user.id, user.first_name), user_target, fban_user_id), parse_mode="HTML")
-                                """
-                except BadRequest as excp:
-                        if excp.message in UNFBAN_ERRORS:
-                                pass
-                        elif excp.message == "User_id_invalid":
-                                break
-                        else:
-                                LOGGER.warning("Unable to fban on {} because: {}".format(fedchats, excp.message))
-                except TelegramError:
-                        pass
-
         try:
                 x = sql.un_fban_user(fed_id, user_id)
                 if not x:
@@ -811,31 +674,9 @@ def unfban(update, context):
         except:
                 pass
 
-        # UnFban for fed subscriber
-        subscriber = list(sql.get_subscriber(fed_id))
-        if len(subscriber) != 0:
-                for fedsid in subscriber:
-                        all_fedschat = sql.all_fed_chats(fedsid)
-                        for fedschat in all_fedschat:
-                                try:
-                                        context.bot.unban_chat_member(fedchats, user_id)
-                                except BadRequest as excp:
-                                        if excp.message in FBAN_ERRORS:
-                                                try:
-                                                        dispatcher.bot.getChat(fedschat)
-                                                except Unauthorized:
-                                                        targetfed_id = sql.get_fed_id(fedschat)
-                                                        sql.unsubs_fed(fed_id, targetfed_id)
-                                                        LOGGER.info("Chat {} has unsub fed {} because bot is kicked".format(fedschat, info['fname']))
-                                                        continue
-                                        elif excp.message == "User_id_invalid":
-                                                break
-                                        else:
-                                                LOGGER.warning("Unable to fban on {} because: {}".format(fedschat, excp.message))
-                                except TelegramError:
-                                        pass
+        queued = queue_fed_action(fed_id, fban_user_id, 'unban', chat.id)
 
-        send_message(update.effective_message, "This person has been un-fbanned.")
+        send_message(update.effective_message, "This person has been un-fbanned. Unbanning them in {} federation chats in the background, I will report here when done.".format(queued))
         # Also do not spamming all fed admins
         """
         FEDADMIN = sql.all_fed_users(fed_id)
@@ -944,27 +785,21 @@ def fed_broadcast(update, context):
                 except:
                         broadcaster = user.first_name + " " + user.last_name
                 text += "\n\n- {}".format(mention_markdown(user.id, broadcaster))
-                chat_list = sql.all_fed_chats(fed_id)
-                failed = 0
-                for chat in chat_list:
-                        title = chat, "*New broadcast from Fed {}*\n".format(fedinfo['fname'])
-                        try:
-                                context.bot.sendMessage(chat, title + text, parse_mode="markdown")
-                        except TelegramError:
-                                try:
-                                        dispatcher.bot.getChat(chat)
-                                except Unauthorized:
-                                        failed += 1
-                                        sql.chat_leave_fed(chat)
-                                        LOGGER.info("Chat {} has leave fed {} because bot is kicked".format(chat, fedinfo['fname']))
-                                        continue
-                                failed += 1
-                                LOGGER.warning("Couldn't send broadcast to {}".format(str(chat)))
+                text = "*New broadcast from Fed {}*\n".format(fedinfo['fname']) + text
+                BROADCASTER.start('fed', text, chat.id, fed_id=fed_id, parse_mode="markdown",
+                                  total=len(sql.all_fed_chats(fed_id)))
+                send_message(update.effective_message, "The Federation Broadcast has started, I will report here when it is complete.")
+
+
+def fed_broadcast_chats(bcast, cursor, limit):
+        chats = sorted(str(x) for x in sql.all_fed_chats(bcast['fed_id']))
+        return [x for x in chats if x > cursor][:limit]
+
+
+def remove_fed_broadcast_chat(bcast, chat_id):
+        sql.chat_leave_fed(chat_id)
+        LOGGER.info("Chat {} has leave fed {} because bot is kicked".format(chat_id, bcast['fed_id']))
 
-                send_text = "The Federation Broadcast is complete."
-                if failed >= 1:
-                        send_text += "{} group failed to receive the message, probably because it left from federation.".format(failed)
-                send_message(update.effective_message, send_text)
 
 @run_async
 def fed_ban_list(update, context):
@@ -1205,8 +1040,6 @@ def fed_import_bans(update, context):
                 # if int(int(msg.reply_to_message.document.file_size)/1024) >= 200:
                 #       send_message(update.effective_message, "File ini terlalu besar!")
                 #       return
-                success = 0
-                failed = 0
                 try:
                         file_info = context.bot.get_file(msg.reply_to_message.document.file_id)
                 except BadRequest:
@@ -1214,135 +1047,93 @@ def fed_import_bans(update, context):
                         return
                 fileformat = msg.reply_to_message.document.file_name.split('.')[-1]
                 if fileformat == 'json':
-                        multi_fed_id = []
-                        multi_import_userid = []
-                        multi_import_firstname = []
-                        multi_import_lastname = []
-                        multi_import_username = []
-                        multi_import_reason = []
-                        with BytesIO() as file:
-                                file_info.download(out=file)
-                                file.seek(0)
-                                reading = file.read().decode('UTF-8')
-                                splitting = reading.split('\n')
-                                for x in splitting:
-                                        if x == '':
-                                                continue
-                                        try:
-                                                data = json.loads(x)
-                                        except json.decoder.JSONDecodeError as err:
-                                                failed += 1
-                                                continue
-                                        try:
-                                                import_userid = int(data['user_id']) # Make sure it int
-                                                import_firstname = str(data['first_name'])
-                                                import_lastname = str(data['last_name'])
-                                                import_username = str(data['user_name'])
-                                                import_reason = str(data['reason'])
-                                        except ValueError:
-                                                failed += 1
-                                                continue
-                                        # Checking user
-                                        if int(import_userid) == context.bot.id:
-                                                failed += 1
-                                                continue
-                                        if is_user_fed_owner(fed_id, import_userid) == True:
-                                                failed += 1
-                                                continue
-                                        if is_user_fed_admin(fed_id, import_userid) == True:
-                                                failed += 1
-                                                continue
-                                        if str(import_userid) == str(OWNER_ID):
-                                                failed += 1
-                                                continue
-                                        if int(import_userid) in SUDO_USERS:
-                                                failed += 1
-                                                continue
-                                        if int(import_userid) in WHITELIST_USERS:
-                                                failed += 1
-                                                continue
-                                        multi_fed_id.append(fed_id)
-                                        multi_import_userid.append(str(import_userid))
-                                        multi_import_firstname.append(import_firstname)
-                                        multi_import_lastname.append(import_lastname)
-                                        multi_import_username.append(import_username)
-                                        multi_import_reason.append(import_reason)
-                                        success += 1
-                                sql.multi_fban_user(multi_fed_id, multi_import_userid, multi_import_firstname, multi_import_lastname, multi_import_username, multi_import_reason)
-                        text = "Files were imported successfully. {} people banned.".format(success)
-                        if failed >= 1:
-                                text += " {} failed to import.".format(failed)
-                        get_fedlog = sql.get_fed_log(fed_id)
-                        if get_fedlog:
-                                if eval(get_fedlog):
-                                        teks = "Fed *{}* has successfully imported data. {} banned.".format(getfed['fname'], success)
-                                        if failed >= 1:
-                                                teks += " {} failed to import.".format(failed)
-                                        context.bot.send_message(get_fedlog, teks, parse_mode="markdown")
+                        parse_rows = fban_json_rows
                 elif fileformat == 'csv':
-                        multi_fed_id = []
-                        multi_import_userid = []
-                        multi_import_firstname = []
-                        multi_import_lastname = []
-                        multi_import_username = []
-                        multi_import_reason = []
-                        file_info.download("fban_{}.csv".format(msg.reply_to_message.document.file_id))
-                        with open("fban_{}.csv".format(msg.reply_to_message.document.file_id), 'r', encoding="utf8") as csvFile:
-                                reader = csv.reader(csvFile)
-                                for data in reader:
-                                        try:
-                                                import_userid = int(data[0]) # Make sure it int
-                                                import_firstname = str(data[1])
-                                                import_lastname = str(data[2])
-                                                import_username = str(data[3])
-                                                import_reason = str(data[4])
-                                        except ValueError:
-                                                failed += 1
-                                                continue
-                                        # Checking user
-                                        if int(import_userid) == context.bot.id:
-                                                failed += 1
-                                                continue
-                                        if is_user_fed_owner(fed_id, import_userid) == True:
-                                                failed += 1
-                                                continue
-                                        if is_user_fed_admin(fed_id, import_userid) == True:
-                                                failed += 1
-                                                continue
-                                        if str(import_userid) == str(OWNER_ID):
-                                                failed += 1
-                                                continue
-                                        if int(import_userid) in SUDO_USERS:
-                                                failed += 1
-                                                continue
-                                        if int(import_userid) in WHITELIST_USERS:
-                                                failed += 1
-                                                continue
-                                        multi_fed_id.append(fed_id)
-                                        multi_import_userid.append(str(import_userid))
-                                        multi_import_firstname.append(import_firstname)
-                                        multi_import_lastname.append(import_lastname)
-                                        multi_import_username.append(import_username)
-                                        multi_import_reason.append(import_reason)
-                                        success += 1
-                                        # t = ThreadWithReturnValue(target=sql.fban_user, args=(fed_id, str(import_userid), import_firstname, import_lastname, import_username, import_reason,))
-                                        # t.start()
-                                sql.multi_fban_user(multi_fed_id, multi_import_userid, multi_import_firstname, multi_import_lastname, multi_import_username, multi_import_reason)
-                        csvFile.close()
-                        os.remove("fban_{}.csv".format(msg.reply_to_message.document.file_id))
-                        text = "Files were imported successfully. {} people banned.".format(success)
-                        if failed >= 1:
-                                text += " {} failed to import.".format(failed)
-                        get_fedlog = sql.get_fed_log(fed_id)
-                        if get_fedlog:
-                                teks = "Fed *{}* has successfully imported data. {} banned.".format(getfed['fname'], success)
-                                if failed >= 1:
-                                        teks += " {} failed to import.".format(failed)
-                                context.bot.send_message(get_fedlog, teks, parse_mode="markdown")
+                        parse_rows = fban_csv_rows
                 else:
                         send_message(update.effective_message, "This file is not supported.")
                         return
-                send_message(update.effective_message, text)
+
+                status = send_message(update.effective_message, "Importing fed bans...")
+
+                def progress(done):
+                        if not status:
+                                return
+                        try:
+                                status.edit_text("Importing fed bans... {} imported so far.".format(done))
+                        except BadRequest:
+                                pass
+
+                # Stream the file from disk through the parser and the checks into chunked upserts; only the
+                # current chunk is held, the federation's ban cache is reloaded from the database at the end
+                failed = [0]
+                protected = fban_protected_users(fed_id, context.bot.id)
+                with tempfile.TemporaryFile() as file:
+                        file_info.download(out=file)
+                        file.seek(0)
+                        with io.TextIOWrapper(file, encoding='utf-8', errors='replace', newline='') as reader:
+                                rows = fban_import_filter(parse_rows(reader, failed), protected, failed)
+                                try:
+                                        success = sql.import_fbans(fed_id, rows, progress=progress)
+                                except Exception:
+                                        LOGGER.exception("Importing fed bans for %s failed", fed_id)
+                                        send_message(update.effective_message, "Importing failed, nothing was changed. Please check the file and try again.")
+                                        return
+
+                text = "Files were imported successfully. {} people banned.".format(success)
+                if failed[0] >= 1:
+                        text += " {} failed to import.".format(failed[0])
+                get_fedlog = sql.get_fed_log(fed_id)
+                if get_fedlog:
+                        teks = "Fed *{}* has successfully imported data. {} banned.".format(getfed['fname'], success)
+                        if failed[0] >= 1:
+                                teks += " {} failed to import.".format(failed[0])
+                        context.bot.send_message(get_fedlog, teks, parse_mode="markdown")
+                if status:
+                        status.edit_text(text)
+                else:
+                        send_message(update.effective_message, text)
+
+
+def fban_json_rows(lines, failed):
+        for line in lines:
+                if not line.strip():
+                        continue
+                try:
+                        data = json.loads(line)
+                        row = (int(data['user_id']), str(data['first_name']), str(data['last_name']),
+                               str(data['user_name']), str(data['reason']))
+                except (ValueError, KeyError, TypeError):
+                        failed[0] += 1
+                        continue
+                yield row
+
+
+def fban_csv_rows(lines, failed):
+        for data in csv.reader(lines):
+                try:
+                        row = (int(data[0]), str(data[1]), str(data[2]), str(data[3]), str(data[4]))
+                except (ValueError, IndexError):
+                        failed[0] += 1
+                        continue
+                yield row
+
+
+def fban_protected_users(fed_id, bot_id):
+        # Everyone an import may never ban, collected once instead of checked per row
+        protected = {bot_id, int(OWNER_ID)}
+        protected.update(int(x) for x in sql.all_fed_users(fed_id) or [])
+        protected.update(SUDO_USERS)
+        protected.update(WHITELIST_USERS)
+        return protected
+
+
+def fban_import_filter(rows, protected, failed):
+        for row in rows:
+                if row[0] in protected:
+                        failed[0] += 1
+                        continue
+                yield row
 
 
 @run_async
@@ -1613,27 +1404,118 @@ def get_myfeds_list(update, context):
 
 
 def is_user_fed_admin(fed_id, user_id):
-        fed_admins = sql.all_fed_users(fed_id)
-        if fed_admins == False:
-                return False
-        if int(user_id) in fed_admins or int(user_id) == OWNER_ID:
-                return True
-        else:
+        if sql.get_fed_info(fed_id) == False:
                 return False
+        return int(user_id) == OWNER_ID or sql.is_user_fed_admin(fed_id, user_id)
 
 
 def is_user_fed_owner(fed_id, user_id):
-        getsql = sql.get_fed_info(fed_id)
-        if getsql == False:
+        if sql.get_fed_info(fed_id) == False:
                 return False
-        getfedowner = eval(getsql['fusers'])
-        if getfedowner == None or getfedowner == False:
-                return False
-        getfedowner = getfedowner['owner']
-        if str(user_id) == getfedowner or int(user_id) == OWNER_ID:
-                return True
+        return int(user_id) == OWNER_ID or sql.is_user_fed_owner(fed_id, user_id)
+
+
+# Fban fan-out: kicks and unbans over all federation chats are queued in the database and delivered by a
+# repeating job, limited by a global and a per-chat token bucket so big federations don't hit flood limits.
+FANOUT_GLOBAL_BUCKET = TokenBucket(rate=20, capacity=30)
+FANOUT_CHAT_BUCKETS = KeyedTokenBuckets(rate=1, capacity=3)
+FANOUT_MAX_ATTEMPTS = 5
+FANOUT_LOCK = threading.Lock()
+
+
+def queue_fed_action(fed_id, user_id, action, report_chat):
+        # queue `action` ('ban' or 'unban') for every chat of the federation and of its subscriber federations
+        chats = [(fed_id, fedschat) for fedschat in sql.all_fed_chats(fed_id)]
+        for fedsid in sql.get_subscriber(fed_id):
+                chats.extend((fedsid, fedschat) for fedschat in sql.all_fed_chats(fedsid))
+        return fanout_sql.add_batch(str(uuid.uuid4()), fed_id, user_id, action, report_chat, chats)
+
+
+def fed_action_in_chat(bot, job, batch):
+        chat_id = int(job.chat_id)
+        user_id = int(batch.user_id)
+        if batch.action == 'ban':
+                bot.kick_chat_member(chat_id, user_id)
         else:
-                return False
+                member = bot.get_chat_member(chat_id, user_id)
+                if member.status == 'kicked':
+                        bot.unban_chat_member(chat_id, user_id)
+
+
+def drop_fed_chat(bot, job, batch):
+        # the bot was removed from the chat: take it out of the federation, or unsubscribe its federation
+        try:
+                bot.getChat(int(job.chat_id))
+        except Unauthorized:
+                if job.fed_id == batch.fed_id:
+                        sql.chat_leave_fed(job.chat_id)
+                        LOGGER.info("Chat {} has leave fed {} because bot is kicked".format(job.chat_id, job.fed_id))
+                else:
+                        sql.unsubs_fed(batch.fed_id, job.fed_id)
+                        LOGGER.info("Chat {} has unsub fed {} because bot is kicked".format(job.chat_id, batch.fed_id))
+        except TelegramError:
+                pass
+
+
+def report_fed_action(bot, finished):
+        if not finished or not finished['report_chat']:
+                return
+        if finished['action'] == 'ban':
+                text = "Fedban of <code>{}</code> finished: removed from {} of {} chats."
+        else:
+                text = "Un-fedban of <code>{}</code> finished: unbanned in {} of {} chats."
+        text = text.format(finished['user_id'], finished['done'], finished['total'])
+        if finished['failed']:
+                text += " {} chats failed.".format(finished['failed'])
+        try:
+                bot.send_message(int(finished['report_chat']), text, parse_mode="HTML")
+        except TelegramError as excp:
+                LOGGER.warning("Unable to report fed action to {} because: {}".format(finished['report_chat'], excp.message))
+
+
+def process_fed_queue(context):
+        if not fanout_sql.has_pending() or not FANOUT_LOCK.acquire(blocking=False):
+                return
+        try:
+                for job, batch in fanout_sql.get_due_jobs(limit=100):
+                        # the global bucket is checked first so a chat's token isn't spent on a job that can't go out;
+                        # only this job, under FANOUT_LOCK, takes from it
+                        if FANOUT_GLOBAL_BUCKET.wait_time() > 0:
+                                break
+                        if not FANOUT_CHAT_BUCKETS.try_acquire(job.chat_id):
+                                continue
+                        FANOUT_GLOBAL_BUCKET.try_acquire()
+
+                        ok = True
+                        try:
+                                fed_action_in_chat(context.bot, job, batch)
+                        except RetryAfter as excp:
+                                FANOUT_GLOBAL_BUCKET.pause(excp.retry_after)
+                                fanout_sql.retry_job(job.id, excp.retry_after)
+                                break
+                        except BadRequest as excp:
+                                if excp.message == "User_id_invalid":
+                                        report_fed_action(context.bot, fanout_sql.cancel_batch(job.batch_id))
+                                        continue
+                                if excp.message in FBAN_ERRORS or excp.message in UNFBAN_ERRORS:
+                                        drop_fed_chat(context.bot, job, batch)
+                                else:
+                                        LOGGER.warning("Unable to fban on {} because: {}".format(job.chat_id, excp.message))
+                                ok = False
+                        except Unauthorized:
+                                drop_fed_chat(context.bot, job, batch)
+                                ok = False
+                        except TelegramError as excp:
+                                # network trouble, back off exponentially and give up after a few attempts
+                                if job.attempts + 1 < FANOUT_MAX_ATTEMPTS:
+                                        fanout_sql.retry_job(job.id, 2 ** (job.attempts + 1))
+                                        continue
+                                LOGGER.warning("Giving up fban on {} because: {}".format(job.chat_id, excp.message))
+                                ok = False
+
+                        report_fed_action(context.bot, fanout_sql.finish_job(job.id, ok))
+        finally:
+                FANOUT_LOCK.release()
 
 
 @run_async
@@ -1651,10 +1533,14 @@ def welcome_fed(update, context):
                 return False
 
 
+job = updater.job_queue
+
+job_fed_queue = job.run_repeating(process_fed_queue, interval=1, first=1)
+job_fed_queue.enabled = True
+
+
 def __stats__():
-        all_fbanned = sql.get_all_fban_users_global()
-        all_feds = sql.get_all_feds_users_global()
-        return "{} users has fbanned, on {} federation".format(len(all_fbanned), len(all_feds))
+        return "{} users has fbanned, on {} federation".format(sql.num_fbans(), sql.num_feds())
 
 
 def __user_info__(user_id, chat_id):
@@ -1793,3 +1679,5 @@ dispatcher.add_handler(MY_SUB_FED)
 dispatcher.add_handler(MY_FEDS_LIST)
 
 dispatcher.add_handler(DELETEBTN_FED_HANDLER)
+
+BROADCASTER.register_target('fed', fed_broadcast_chats, remove_fed_broadcast_chat)
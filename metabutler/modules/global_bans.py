@@ -4,16 +4,18 @@ from typing import Optional, List
 
 from telegram import Message, Update, Bot, User, Chat, ParseMode, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest, TelegramError
-from telegram.ext import run_async, CommandHandler, MessageHandler, Filters, CallbackQueryHandler
+from telegram.ext import CommandHandler, MessageHandler, Filters, CallbackQueryHandler
 from telegram.utils.helpers import mention_html, escape_markdown
 
 import metabutler.modules.sql.global_bans_sql as sql
 from metabutler import dispatcher, OWNER_ID, SUDO_USERS, SUPPORT_USERS, STRICT_GBAN, GBAN_LOGS
-from metabutler.modules.helper_funcs.chat_status import user_admin, is_user_admin
+from metabutler.modules.helper_funcs import pipeline
+from metabutler.modules.helper_funcs.chat_status import user_admin, is_user_admin, bot_can_restrict
 from metabutler.modules.helper_funcs.extraction import extract_user, extract_user_and_text
 from metabutler.modules.helper_funcs.filters import CustomFilters
 from metabutler.modules.helper_funcs.misc import send_to_list
 from metabutler.modules.sql.users_sql import get_all_chats
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.helper_funcs.alternate import send_message
 
@@ -272,6 +274,7 @@ def gbanlist(update, context):
 def check_and_ban(update, user_id, should_message=True):
     if sql.is_user_gbanned(user_id):
         update.effective_chat.kick_member(user_id)
+        pipeline.halt()
         if should_message:
             send_message(update.effective_message, "This is a bad person, they shouldn't be here!")
 
@@ -279,7 +282,7 @@ def check_and_ban(update, user_id, should_message=True):
 @run_async
 def enforce_gban(update, context):
     # Not using @restrict handler to avoid spamming - just ignore if cant gban.
-    if sql.does_chat_gban(update.effective_chat.id) and update.effective_chat.get_member(context.bot.id).can_restrict_members:
+    if sql.does_chat_gban(update.effective_chat.id) and bot_can_restrict(update.effective_chat, context.bot.id):
         user = update.effective_user  # type: Optional[User]
         chat = update.effective_chat  # type: Optional[Chat]
         msg = update.effective_message  # type: Optional[Message]
@@ -0,0 +1,137 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.error import BadRequest, RetryAfter, TelegramError, Unauthorized
+
+from metabutler import updater, LOGGER, BROADCAST_RATE, BROADCAST_CONCURRENCY
+from metabutler.modules.helper_funcs.ratelimit import TokenBucket, blocking_sends
+import metabutler.modules.sql.broadcast_sql as sql
+
+# errors meaning the bot can never reach the chat again, the chat is dropped from the target list. A bot that is
+# only muted or restricted ("Have no rights to send a message") is still in the chat and just counts as failed.
+DEAD_CHAT_ERRORS = {
+    "Chat not found",
+    "Peer_id_invalid",
+    "Group chat was deactivated",
+    "Channel_private",
+}
+
+SEND_ATTEMPTS = 3
+
+
+class BroadcastEngine(object):
+    """
+    Sends a message to a list of chats at a global rate with a bounded number of requests in flight.
+
+    Targets are walked in chat id order one batch per tick; the cursor is saved after each batch so a restarted
+    bot resumes where it stopped. Each kind of broadcast registers how to list its chats and how to forget a dead one.
+    """
+
+    def __init__(self, rate, concurrency):
+        self.bucket = TokenBucket(rate, rate)
+        self.batch_size = max(int(rate), 1)
+        self.executor = ThreadPoolExecutor(max_workers=max(int(concurrency), 1))
+        self.targets = {}
+        self.lock = threading.Lock()
+
+    def register_target(self, kind, list_chats, remove_chat):
+        # list_chats(bcast, cursor, limit) -> chat ids after cursor in id order, remove_chat(bcast, chat_id)
+        self.targets[kind] = (list_chats, remove_chat)
+
+    def start(self, kind, text, report_chat, fed_id=None, parse_mode=None, total=0):
+        return sql.new_broadcast(kind, fed_id, text, parse_mode, report_chat, total)
+
+    def send(self, bot, bcast, chat_id):
+        # returns 'sent', 'failed' or 'dead'
+        for _ in range(SEND_ATTEMPTS):
+            self.bucket.acquire()
+            try:
+                with blocking_sends():
+                    bot.send_message(int(chat_id), bcast['text'], parse_mode=bcast['parse_mode'])
+                return 'sent'
+            except RetryAfter as excp:
+                self.bucket.pause(excp.retry_after)
+            except Unauthorized:
+                return 'dead'
+            except BadRequest as excp:
+                if excp.message in DEAD_CHAT_ERRORS:
+                    return 'dead'
+                LOGGER.warning("Couldn't send broadcast to %s: %s", str(chat_id), excp.message)
+                return 'failed'
+            except TelegramError as excp:
+                LOGGER.warning("Couldn't send broadcast to %s: %s", str(chat_id), excp.message)
+                return 'failed'
+        return 'failed'
+
+    def run_batch(self, bot, bcast):
+        list_chats, remove_chat = self.targets[bcast['kind']]
+        chats = list_chats(bcast, bcast['cursor'], self.batch_size)
+        if not chats:
+            sql.save_progress(bcast['id'], bcast['cursor'], bcast['sent'], bcast['failed'], bcast['removed'],
+                              finished=True)
+            self.report(bot, bcast)
+            return
+
+        cursor, sent, failed, removed = bcast['cursor'], bcast['sent'], bcast['failed'], bcast['removed']
+        results = self.executor.map(lambda chat_id: self.send(bot, bcast, chat_id), chats)
+        try:
+            for chat_id, result in zip(chats, results):
+                # the chat got its message (or never will), never send it again even if the rest of the batch fails
+                cursor = str(chat_id)
+                if result == 'sent':
+                    sent += 1
+                    continue
+                failed += 1
+                if result == 'dead':
+                    removed += 1
+                    remove_chat(bcast, chat_id)
+        finally:
+            sql.save_progress(bcast['id'], cursor, sent, failed, removed)
+
+    def tick(self, context):
+        if not sql.RUNNING_BROADCASTS or not self.lock.acquire(blocking=False):
+            return
+        try:
+            for bcast in sql.get_running_broadcasts():
+                if bcast['kind'] not in self.targets:
+                    continue
+                try:
+                    self.run_batch(context.bot, bcast)
+                except Exception:
+                    LOGGER.exception("Broadcast %s failed, retrying on the next tick", bcast['id'])
+        finally:
+            self.lock.release()
+
+    def report(self, bot, bcast):
+        if not bcast['report_chat']:
+            return
+        text = "Broadcast complete. Sent to {} chats.".format(bcast['sent'])
+        if bcast['failed']:
+            text += " {} chats failed to receive the message".format(bcast['failed'])
+            if bcast['removed']:
+                text += ", {} of them were removed because I was kicked".format(bcast['removed'])
+            text += "."
+        try:
+            bot.send_message(int(bcast['report_chat']), text)
+        except TelegramError:
+            LOGGER.warning("Couldn't report broadcast %s to %s", bcast['id'], bcast['report_chat'])
+
+    def status(self):
+        running = sql.get_running_broadcasts()
+        if not running:
+            return "No broadcast is running."
+        lines = []
+        for bcast in running:
+            done = bcast['sent'] + bcast['failed']
+            lines.append("#{} to {}{}: {}/{} done, {} failed, {} removed".format(
+                bcast['id'], bcast['kind'], " " + bcast['fed_id'] if bcast['fed_id'] else "", done, bcast['total'],
+                bcast['failed'], bcast['removed']))
+        return "\n".join(lines)
+
+
+BROADCASTER = BroadcastEngine(BROADCAST_RATE, BROADCAST_CONCURRENCY)
+
+job = updater.job_queue
+
+job_broadcast = job.run_repeating(BROADCASTER.tick, interval=1, first=1)
+job_broadcast.enabled = True
@@ -1,24 +1,105 @@
 import sys
+import threading
+import time
 import traceback
 
+from collections import OrderedDict
 from functools import wraps
-from typing import Optional
+from typing import Optional, Dict
 
 from telegram import User, Chat, ChatMember, Update, Bot
 from telegram import error
 
 from metabutler import DEL_CMDS, SUDO_USERS, WHITELIST_USERS
+from metabutler.modules.helper_funcs import pipeline
+
+
+class AdminCache(object):
+	# chat_id -> (fetched_at, {user_id: ChatMember}, {user_id: ChatMember or None}) for the chat's administrators
+	# and for the users looked up one by one since, bounded LRU with a TTL
+	def __init__(self, ttl=600, maxsize=2048):
+		self.ttl = ttl
+		self.maxsize = maxsize
+		self.chats = OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, chat: Chat) -> Dict[int, ChatMember]:
+		return self.__entry(chat)[1]
+
+	def get_member(self, chat: Chat, user_id: int) -> Optional[ChatMember]:
+		# getChatAdministrators leaves out other bots, so a user missing from it is asked for on its own
+		_, admins, others = self.__entry(chat)
+		if user_id in admins:
+			return admins[user_id]
+		with self.lock:
+			if user_id in others:
+				return others[user_id]
 
+		try:
+			member = chat.get_member(user_id)
+		except error.BadRequest:
+			member = None
+		if member and member.status not in ('administrator', 'creator'):
+			member = None
+		with self.lock:
+			others[user_id] = member
+		return member
+
+	def __entry(self, chat: Chat):
+		now = time.monotonic()
+		with self.lock:
+			cached = self.chats.get(chat.id)
+			if cached and now - cached[0] < self.ttl:
+				self.chats.move_to_end(chat.id)
+				self.hits += 1
+				return cached
+			self.misses += 1
+
+		cached = (now, {member.user.id: member for member in chat.get_administrators()}, {})
+		with self.lock:
+			self.chats[chat.id] = cached
+			self.chats.move_to_end(chat.id)
+			while len(self.chats) > self.maxsize:
+				self.chats.popitem(last=False)
+		return cached
+
+	def invalidate(self, chat_id):
+		with self.lock:
+			self.chats.pop(int(chat_id), None)
+
+	def stats(self):
+		return "{} cached admin lists, {} hits, {} misses.".format(len(self.chats), self.hits, self.misses)
+
+
+ADMIN_CACHE = AdminCache()
+
+
+def get_admin_member(chat: Chat, user_id: int) -> Optional[ChatMember]:
+	# private chats have no administrators, getChatAdministrators fails there
+	if chat.type == 'private':
+		return None
+	return ADMIN_CACHE.get_member(chat, user_id)
+
+
+def invalidate_admin_cache(chat_id):
+	ADMIN_CACHE.invalidate(chat_id)
+
+
+def member_has_right(chat: Chat, user_id: int, right: str) -> bool:
+	member = get_admin_member(chat, user_id)
+	return bool(member and getattr(member, right))
 
 
 def can_delete(chat: Chat, bot_id: int) -> bool:
-	return chat.get_member(bot_id).can_delete_messages
+	return member_has_right(chat, bot_id, 'can_delete_messages')
 
 def user_can_delete(chat: Chat, user: User, bot_id: int) -> bool:
-	return chat.get_member(bot_id).can_delete_messages and chat.get_member(user.id).can_delete_messages
+	return member_has_right(chat, bot_id, 'can_delete_messages') and member_has_right(chat, user.id, 'can_delete_messages')
 
 def bot_can_restrict(chat: Chat, bot_id: int) -> bool:
-	return chat.get_member(bot_id).can_restrict_members
+	return member_has_right(chat, bot_id, 'can_restrict_members')
 
 
 def is_user_ban_protected(chat: Chat, user_id: int, member: ChatMember = None) -> bool:
@@ -29,7 +110,7 @@ def is_user_ban_protected(chat: Chat, user_id: int, member: ChatMember = None) -
 		return True
 
 	if not member:
-		member = chat.get_member(user_id)
+		return get_admin_member(chat, user_id) is not None
 	return member.status in ('administrator', 'creator')
 
 
@@ -41,7 +122,7 @@ def is_user_admin(chat: Chat, user_id: int, member: ChatMember = None) -> bool:
 
 	try:
 		if not member:
-			member = chat.get_member(user_id)
+			return pipeline.memoize(('admin', chat.id, user_id), lambda: get_admin_member(chat, user_id) is not None)
 		return member.status in ('administrator', 'creator')
 	except:
 		return False
@@ -53,7 +134,7 @@ def is_bot_admin(chat: Chat, bot_id: int, bot_member: ChatMember = None) -> bool
 		return True
 
 	if not bot_member:
-		bot_member = chat.get_member(bot_id)
+		return get_admin_member(chat, bot_id) is not None
 	return bot_member.status in ('administrator', 'creator')
 
 
@@ -76,7 +157,7 @@ def bot_can_delete(func):
 def can_pin(func):
 	@wraps(func)
 	def pin_rights(update, context, *args, **kwargs):
-		if update.effective_chat.get_member(context.bot.id).can_pin_messages:
+		if member_has_right(update.effective_chat, context.bot.id, 'can_pin_messages'):
 			return func(update, context, *args, **kwargs)
 		else:
 			update.effective_message.reply_text("I can't pin messages here! Make sure I'm admin and can pin messages.")
@@ -87,7 +168,7 @@ def can_pin(func):
 def can_promote(func):
 	@wraps(func)
 	def promote_rights(update, context, *args, **kwargs):
-		if update.effective_chat.get_member(context.bot.id).can_promote_members:
+		if member_has_right(update.effective_chat, context.bot.id, 'can_promote_members'):
 			return func(update, context, *args, **kwargs)
 		else:
 			update.effective_message.reply_text("I can't promote/demote people here! Make sure I'm admin and can appoint new admins.")
@@ -98,7 +179,7 @@ def can_promote(func):
 def can_restrict(func):
 	@wraps(func)
 	def promote_rights(update, context, *args, **kwargs):
-		if update.effective_chat.get_member(context.bot.id).can_restrict_members:
+		if member_has_right(update.effective_chat, context.bot.id, 'can_restrict_members'):
 			return func(update, context, *args, **kwargs)
 		else:
 			update.effective_message.reply_text("I can't restrict people here! Make sure I'm admin and can appoint new admins.")
@@ -4,6 +4,7 @@ from telegram import Message, MessageEntity
 from telegram.error import BadRequest
 
 from metabutler import LOGGER
+from metabutler.modules.helper_funcs import pipeline
 from metabutler.modules.users import get_user_id
 
 
@@ -83,7 +84,8 @@ def extract_user_and_text(message: Message, args: List[str]) -> (Optional[int],
 
 
 def extract_text(message) -> str:
-    return message.text or message.caption or (message.sticker.emoji if message.sticker else None)
+    return pipeline.memoize(('text', message.chat_id, message.message_id),
+                            lambda: message.text or message.caption or (message.sticker.emoji if message.sticker else None))
 
 
 def extract_unt_fedban(message: Message, args: List[str]) -> (Optional[int], Optional[str]):
@@ -1,5 +1,10 @@
+import threading
+from collections import namedtuple
+
 import telegram.ext as tg
-from telegram import Update
+from telegram import Update, MessageEntity
+
+from metabutler import LOGGER
 
 try:
     from metabutler import CUSTOM_CMD
@@ -11,30 +16,126 @@ if CUSTOM_CMD:
 else:
     CMD_STARTERS = ('/')
 
+# command: lowercased name, target: lowercased bot username it was addressed to (ours when none was given),
+# args: the words after the command, entity: True when Telegram marked it as a bot_command at offset 0,
+# custom: True when the first word starts with one of CMD_STARTERS
+ParsedCommand = namedtuple('ParsedCommand', 'command target args entity custom')
+
+# tg.CommandHandler itself gets replaced by CustomCommandHandler when CUSTOM_CMD is set
+BaseCommandHandler = tg.CommandHandler
+
+_LOCAL = threading.local()
+
+
+def parse_command(update):
+    """
+    Splits the command out of an update, or returns None when it does not start with one. Every command handler
+    asks for the same update in turn on the dispatcher thread, so the last result is kept per thread.
+    """
+    cached = getattr(_LOCAL, 'parsed', None)
+    if cached is not None and cached[0] is update:
+        return cached[1]
+
+    parsed = _parse_command(update)
+    _LOCAL.parsed = (update, parsed)
+    return parsed
+
+
+def _parse_command(update):
+    if not isinstance(update, Update) or not update.effective_message:
+        return None
+    message = update.effective_message
+    text = message.text
+    if not text or len(text) < 2:
+        return None
+
+    entity = bool(message.entities and message.entities[0].type == MessageEntity.BOT_COMMAND
+                  and message.entities[0].offset == 0)
+    fst_word = text.split(None, 1)[0]
+    custom = len(fst_word) > 1 and any(fst_word.startswith(start) for start in CMD_STARTERS)
+    if entity:
+        command = text[1:message.entities[0].length]
+    elif custom:
+        command = fst_word[1:]
+    else:
+        return None
+
+    command = command.split('@')
+    command.append(message.bot.username)  # in case the command was sent without a username
+    return ParsedCommand(command[0].lower(), command[1].lower(), text.split()[1:], entity, custom)
+
 
-class CustomCommandHandler(tg.CommandHandler):
+class CustomCommandHandler(BaseCommandHandler):
     def __init__(self, command, callback, **kwargs):
         if "admin_ok" in kwargs:
             del kwargs["admin_ok"]
         super().__init__(command, callback, **kwargs)
 
     def check_update(self, update):
-        if isinstance(update, Update) and update.effective_message:
-            message = update.effective_message
-
-            if message.text and len(message.text) > 1:
-                fst_word = message.text.split(None, 1)[0]
-                if len(fst_word) > 1 and any(fst_word.startswith(start) for start in CMD_STARTERS):
-                    args = message.text.split()[1:]
-                    command = fst_word[1:].split('@')
-                    command.append(message.bot.username)  # in case the command was sent without a username
-
-                    if not (command[0].lower() in self.command
-                            and command[1].lower() == message.bot.username.lower()):
-                        return None
-
-                    filter_result = self.filters(update)
-                    if filter_result:
-                        return args, filter_result
-                    else:
-                        return False
+        parsed = parse_command(update)
+        if parsed is None or not parsed.custom:
+            return None
+
+        if not (parsed.command in self.command
+                and parsed.target == update.effective_message.bot.username.lower()):
+            return None
+
+        filter_result = self.filters(update)
+        if filter_result:
+            return parsed.args, filter_result
+        else:
+            return False
+
+
+class CommandRouter(tg.Handler):
+    """
+    Stands in for a run of command handlers of one group. The update is parsed once and only the handlers
+    registered for that command are checked, in their original order, instead of every handler in the group.
+    """
+
+    def __init__(self, handlers):
+        super().__init__(None)
+        self.handlers = handlers
+        self.index = {}
+        for handler in handlers:
+            for command in handler.command:
+                self.index.setdefault(command.lower(), []).append(handler)
+
+    def check_update(self, update):
+        parsed = parse_command(update)
+        if parsed is None:
+            return None
+
+        for handler in self.index.get(parsed.command, ()):
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                return handler, check
+        return None
+
+    def handle_update(self, update, dispatcher, check_result, context=None):
+        handler, check = check_result
+        return handler.handle_update(update, dispatcher, check, context)
+
+
+def install_router(dispatcher):
+    # Only consecutive command handlers are merged, so a message handler registered between two of them
+    # still gets to see commands in the same order as before.
+    routed = 0
+    for group, handlers in list(dispatcher.handlers.items()):
+        merged = []
+        run = []
+        for handler in handlers + [None]:
+            if isinstance(handler, BaseCommandHandler):
+                run.append(handler)
+                continue
+            if len(run) > 1:
+                merged.append(CommandRouter(run))
+                routed += len(run)
+            else:
+                merged.extend(run)
+            run = []
+            if handler is not None:
+                merged.append(handler)
+        dispatcher.handlers[group] = merged
+
+    LOGGER.info("Routing %s command handlers by command name.", routed)
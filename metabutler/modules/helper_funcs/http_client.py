@@ -0,0 +1,172 @@
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metabutler import updater, LOGGER, HTTP_TIMEOUT, HTTP_CACHE_FILE
+
+POOL_SIZE = 16  # keep-alive connections per host
+FETCH_WORKERS = 8  # threads behind submit()
+CACHE_SIZE = 512  # responses kept in memory
+CACHE_SAVE_INTERVAL = 300  # seconds between two writes of HTTP_CACHE_FILE
+CACHEABLE_STATUS = (200, 404)  # a missing device is as worth remembering as a found one
+
+# connect timeout, read timeout
+TIMEOUT = (3.05, HTTP_TIMEOUT)
+
+
+class HttpResponse(object):
+    """
+    What the lookup commands use of a requests.Response. Cached entries are shared between threads, so the
+    decoded json is memoized and must not be modified.
+    """
+
+    def __init__(self, url, status_code, content, encoding=None, expires=0.0):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding or "utf-8"
+        self.expires = expires
+        self._json = None
+
+    @classmethod
+    def from_response(cls, response, ttl=0):
+        return cls(response.url, response.status_code, response.content, response.encoding,
+                   time.time() + ttl if ttl else 0.0)
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        if self._json is None:
+            self._json = json.loads(self.text)
+        return self._json
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError("{} error for url: {}".format(self.status_code, self.url))
+
+    def as_dict(self):
+        return {'url': self.url, 'status': self.status_code, 'encoding': self.encoding, 'expires': self.expires,
+                'content': base64.b64encode(self.content).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['url'], data['status'], base64.b64decode(data['content']), data['encoding'],
+                   data['expires'])
+
+
+class HttpClient(object):
+    """
+    One pooled requests session for every lookup command, with strict timeouts, a couple of retries on
+    connection errors and an LRU of responses that live for the TTL given by the caller.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE,
+                              max_retries=Retry(total=2, connect=2, read=1, backoff_factor=0.3,
+                                                status_forcelist=(502, 503, 504), raise_on_status=False))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = "Metabutler"
+        self.executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+        self.cache = OrderedDict()  # url -> HttpResponse
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, url):
+        with self.lock:
+            response = self.cache.get(url)
+            if response is None:
+                return None
+            if response.expires < time.time():
+                del self.cache[url]
+                return None
+            self.cache.move_to_end(url)
+            self.hits += 1
+            return response
+
+    def store(self, url, response):
+        with self.lock:
+            self.cache[url] = response
+            self.cache.move_to_end(url)
+            while len(self.cache) > CACHE_SIZE:
+                self.cache.popitem(last=False)
+
+    def get(self, url, ttl=0, timeout=TIMEOUT, **kwargs):
+        # ttl in seconds, 0 always goes to the network
+        if ttl:
+            response = self.cached(url)
+            if response is not None:
+                return response
+            with self.lock:
+                self.misses += 1
+
+        response = HttpResponse.from_response(self.session.get(url, timeout=timeout, **kwargs), ttl)
+        if ttl and response.status_code in CACHEABLE_STATUS:
+            self.store(url, response)
+        return response
+
+    def post(self, url, timeout=TIMEOUT, **kwargs):
+        return HttpResponse.from_response(self.session.post(url, timeout=timeout, **kwargs))
+
+    def submit(self, url, ttl=0, **kwargs):
+        # non-blocking get, returns a Future; lets a handler fetch several urls at once
+        return self.executor.submit(self.get, url, ttl, **kwargs)
+
+    def save(self, path):
+        now = time.time()
+        with self.lock:
+            entries = [dict(response.as_dict(), key=url) for url, response in self.cache.items()
+                       if response.expires > now]
+        temp = path + ".tmp"
+        with open(temp, 'w') as output:
+            json.dump(entries, output)
+        os.replace(temp, path)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as source:
+                entries = json.load(source)
+        except (OSError, ValueError):
+            LOGGER.warning("Could not read the HTTP cache from %s", path)
+            return
+        now = time.time()
+        for data in entries:
+            if data['expires'] > now:
+                self.store(data['key'], HttpResponse.from_dict(data))
+
+    def stats(self):
+        with self.lock:
+            return "HTTP cache: {} responses, {} hits, {} misses".format(len(self.cache), self.hits, self.misses)
+
+
+HTTP = HttpClient()
+
+
+def save_cache(context):
+    try:
+        HTTP.save(HTTP_CACHE_FILE)
+    except OSError:
+        LOGGER.exception("Writing the HTTP cache to %s failed", HTTP_CACHE_FILE)
+
+
+if HTTP_CACHE_FILE:
+    HTTP.load(HTTP_CACHE_FILE)
+
+    job = updater.job_queue
+
+    job_http_cache = job.run_repeating(save_cache, interval=CACHE_SAVE_INTERVAL, first=CACHE_SAVE_INTERVAL)
+    job_http_cache.enabled = True
@@ -131,11 +131,12 @@ def build_keyboard_alternate(buttons):
 def build_keyboard_parser(bot, chat_id, buttons):
     keyb = []
     for btn in buttons:
-        if btn.url == "{rules}":
-            btn.url = "http://t.me/{}?start={}".format(bot.username, chat_id)
+        url = btn.url
+        if url == "{rules}":
+            url = "http://t.me/{}?start={}".format(bot.username, chat_id)
         if btn.same_line and keyb:
-            keyb[-1].append(InlineKeyboardButton(btn.name, url=btn.url))
+            keyb[-1].append(InlineKeyboardButton(btn.name, url=url))
         else:
-            keyb.append([InlineKeyboardButton(btn.name, url=btn.url)])
+            keyb.append([InlineKeyboardButton(btn.name, url=url)])
 
     return keyb
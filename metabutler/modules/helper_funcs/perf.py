@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+from telegram.ext.dispatcher import run_async, DispatcherHandlerStop
+from telegram.utils.request import Request
+
+from metabutler import LOGGER
+from metabutler.modules.helper_funcs import pipeline
+from metabutler.modules.helper_funcs.alternate import send_message
+
+# upper bounds (ms) of the execution time histogram buckets, the last bucket catches everything slower
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Every thread only ever writes its own counters, so the hot path takes no lock; readers merge all threads.
+_LOCAL = threading.local()
+_THREAD_STATS = []
+_REGISTRY_LOCK = threading.Lock()
+
+
+class HandlerStats(object):
+    __slots__ = ('calls', 'errors', 'queue_wait', 'exec_time', 'max_exec', 'db_time', 'db_calls', 'api_time',
+                 'api_calls', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.queue_wait = 0.0
+        self.exec_time = 0.0
+        self.max_exec = 0.0
+        self.db_time = 0.0
+        self.db_calls = 0
+        self.api_time = 0.0
+        self.api_calls = 0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+
+    def merge(self, other):
+        for name in self.__slots__:
+            if name == 'histogram':
+                self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+            elif name == 'max_exec':
+                self.max_exec = max(self.max_exec, other.max_exec)
+            else:
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def percentile(self, fraction):
+        # upper bound of the bucket holding the given fraction of calls, None when it is the open-ended one
+        wanted = self.calls * fraction
+        seen = 0
+        for bound, count in zip(BUCKETS_MS + (None,), self.histogram):
+            seen += count
+            if seen >= wanted:
+                return bound
+        return None
+
+    def as_dict(self):
+        calls = self.calls or 1
+        return {'calls': self.calls, 'errors': self.errors,
+                'avg_queue_ms': round(self.queue_wait / calls * 1000, 2),
+                'avg_exec_ms': round(self.exec_time / calls * 1000, 2),
+                'max_exec_ms': round(self.max_exec * 1000, 2),
+                'total_exec_s': round(self.exec_time, 3),
+                'db_ms': round(self.db_time * 1000, 2), 'db_calls': self.db_calls,
+                'api_ms': round(self.api_time * 1000, 2), 'api_calls': self.api_calls,
+                'histogram_ms': dict(zip([str(b) for b in BUCKETS_MS] + ['inf'], self.histogram))}
+
+
+def _stats_for(key):
+    stats = getattr(_LOCAL, 'stats', None)
+    if stats is None:
+        stats = _LOCAL.stats = {}
+        with _REGISTRY_LOCK:
+            _THREAD_STATS.append(stats)
+    handler_stats = stats.get(key)
+    if handler_stats is None:
+        handler_stats = stats[key] = HandlerStats()
+    return handler_stats
+
+
+def timed(callback, key):
+    def run(update, context, *args, _perf_queued=None, **kwargs):
+        stats = _stats_for(key)
+        start = time.perf_counter()
+        if _perf_queued is not None:
+            stats.queue_wait += start - _perf_queued
+        previous = getattr(_LOCAL, 'current', None)
+        _LOCAL.current = stats
+        try:
+            return callback(update, context, *args, **kwargs)
+        except DispatcherHandlerStop:
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _LOCAL.current = previous
+            stats.calls += 1
+            stats.exec_time += elapsed
+            if elapsed > stats.max_exec:
+                stats.max_exec = elapsed
+            stats.histogram[bisect_left(BUCKETS_MS, elapsed * 1000)] += 1
+
+    run.__name__ = getattr(callback, '__name__', 'callback')
+    run.__module__ = getattr(callback, '__module__', None)
+    return run
+
+
+def instrument_callback(callback, key):
+    inner = pipeline.unwrap_async(callback)
+    if inner is callback:
+        wrapped = timed(callback, key)
+        wrapped.perf_key = key
+        return wrapped
+
+    # @run_async handler: stamp the time it is queued, measure inside the worker
+    timed_inner = timed(inner, key)
+    async_inner = run_async(timed_inner)
+
+    def queued(update, context, *args, **kwargs):
+        return async_inner(update, context, *args, _perf_queued=time.perf_counter(), **kwargs)
+
+    queued.__name__ = timed_inner.__name__
+    queued.__module__ = timed_inner.__module__
+    queued.run_sync = timed_inner  # the moderation pipeline already runs in a worker
+    queued.perf_key = key
+    return queued
+
+
+def handler_name(callback):
+    module = (getattr(callback, '__module__', None) or "?").rsplit('.', 1)[-1]
+    return "{}.{}".format(module, getattr(callback, '__name__', type(callback).__name__))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._perf_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_LOCAL, 'current', None)
+    if stats is not None:
+        stats.db_time += time.perf_counter() - context._perf_start
+        stats.db_calls += 1
+
+
+def _timed_request_wrapper(original):
+    def request_wrapper(self, *args, **kwargs):
+        stats = getattr(_LOCAL, 'current', None)
+        if stats is None:
+            return original(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            stats.api_time += time.perf_counter() - start
+            stats.api_calls += 1
+
+    return request_wrapper
+
+
+def install_perf(dispatcher, engine):
+    # wrap every registered handler, then hook the database engine and the Bot API request layer
+    count = 0
+    for group, handlers in dispatcher.handlers.items():
+        for handler in handlers:
+            callback = getattr(handler, 'callback', None)
+            if not callable(callback) or hasattr(callback, 'perf_key'):
+                continue
+            handler.callback = instrument_callback(callback, (handler_name(callback), group))
+            count += 1
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    Request._request_wrapper = _timed_request_wrapper(Request._request_wrapper)
+    LOGGER.info("Collecting performance stats for %s handlers.", count)
+
+
+def snapshot():
+    # merged view of every thread: {(handler, group): HandlerStats}
+    with _REGISTRY_LOCK:
+        threads = list(_THREAD_STATS)
+    merged = {}
+    for stats in threads:
+        for key, handler_stats in list(stats.items()):
+            merged.setdefault(key, HandlerStats()).merge(handler_stats)
+    return merged
+
+
+def by_group(merged):
+    groups = {}
+    for (name, group), handler_stats in merged.items():
+        groups.setdefault(group, HandlerStats()).merge(handler_stats)
+    return groups
+
+
+def perf_report(limit=15):
+    merged = snapshot()
+    if not merged:
+        return "No handler has run yet."
+
+    text = "<b>Slowest handlers by total time:</b>\n"
+    for (name, group), stats in sorted(merged.items(), key=lambda item: -item[1].exec_time)[:limit]:
+        calls = stats.calls or 1
+        p95 = stats.percentile(0.95)
+        text += "<code>{}</code> [{}]: {} calls, {:.1f}ms avg, p95 {}, queue {:.1f}ms, db {:.1f}ms, api {:.1f}ms\n".format(
+            name, group, stats.calls, stats.exec_time / calls * 1000, "<{}ms".format(p95) if p95 else ">5s",
+            stats.queue_wait / calls * 1000, stats.db_time / calls * 1000, stats.api_time / calls * 1000)
+
+    text += "\n<b>Per group:</b>\n"
+    for group, stats in sorted(by_group(merged).items()):
+        text += "[{}]: {} calls, {:.1f}s total\n".format(group, stats.calls, stats.exec_time)
+    return text
+
+
+def perf_command(update, context):
+    send_message(update.effective_message, perf_report(), parse_mode="HTML")
+
+
+def dump_perf(path):
+    merged = snapshot()
+    data = {'time': int(time.time()),
+            'handlers': {"{} [{}]".format(name, group): stats.as_dict() for (name, group), stats in merged.items()},
+            'groups': {str(group): stats.as_dict() for group, stats in by_group(merged).items()}}
+    temp = path + ".tmp"
+    with open(temp, 'w') as output:
+        json.dump(data, output, indent=1, sort_keys=True)
+    os.replace(temp, path)
+
+
+def dump_perf_job(path):
+    def job(context):
+        try:
+            dump_perf(path)
+        except OSError:
+            LOGGER.exception("Writing performance stats to %s failed", path)
+
+    return job
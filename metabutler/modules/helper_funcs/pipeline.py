@@ -0,0 +1,123 @@
+import threading
+from typing import List, Tuple
+
+from telegram import Update
+from telegram.ext import Handler, CallbackContext
+from telegram.ext.dispatcher import run_async as dispatcher_run_async, DispatcherHandlerStop
+
+from metabutler import LOGGER
+
+# Handler groups of the per-message moderation checks, in the order they run:
+# locks, lock restrictions, antiflood, users, reporting, gban, afk, afk replies, warn filters, filters,
+# blacklist and blue text cleaner.
+PIPELINE_GROUPS = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 15)
+
+# users and afk only record who spoke, they still run after a stage called halt() so a deleted message is counted
+# like before the pipeline existed. AFK replies (group 8) are skipped then, there is nothing left to reply to.
+UNHALTED_GROUPS = (4, 7)
+
+_LOCAL = threading.local()
+
+
+class PipelineState(object):
+    # per-update scratch space shared by every stage of one pipeline run
+    def __init__(self, update):
+        self.update = update
+        self.stopped = False
+        self.values = {}
+
+    def get(self, key, loader):
+        if key not in self.values:
+            self.values[key] = loader()
+        return self.values[key]
+
+
+def current():
+    # the state of the pipeline running in this thread, or None outside of pipeline mode
+    return getattr(_LOCAL, 'state', None)
+
+
+def memoize(key, loader):
+    state = current()
+    if state is None:
+        return loader()
+    return state.get(key, loader)
+
+
+def halt():
+    # called by a stage once it deleted the message or removed the sender; later stages are skipped, except
+    # UNHALTED_GROUPS
+    state = current()
+    if state is not None:
+        state.stopped = True
+
+
+def run_async(func):
+    # telegram's @run_async, keeping the plain callback as run_sync for callers that are already in a worker
+    async_func = dispatcher_run_async(func)
+    async_func.run_sync = func
+    return async_func
+
+
+def unwrap_async(callback):
+    return getattr(callback, 'run_sync', callback)
+
+
+class ModerationPipeline(Handler):
+    def __init__(self, stages: List[Tuple[int, List[Handler]]]):
+        super().__init__(self.run_stages)
+        self.stages = stages
+
+    def check_update(self, update):
+        if not isinstance(update, Update) or not update.effective_message:
+            return None
+
+        matched = []
+        for group, handlers in self.stages:
+            # same rule as the dispatcher: only the first matching handler of a group runs
+            for handler in handlers:
+                check = handler.check_update(update)
+                if check is not None and check is not False:
+                    matched.append((group, handler, check))
+                    break
+        return matched or None
+
+    def handle_update(self, update, dispatcher, check_result, context=None):
+        return dispatcher.run_async(self.run_stages, update, dispatcher, check_result)
+
+    def run_stages(self, update, dispatcher, matched):
+        _LOCAL.state = PipelineState(update)
+        try:
+            for group, handler, check in matched:
+                if _LOCAL.state.stopped and group not in UNHALTED_GROUPS:
+                    continue
+                context = CallbackContext.from_update(update, dispatcher)
+                handler.collect_additional_context(context, update, dispatcher, check)
+                try:
+                    unwrap_async(handler.callback)(update, context)
+                except DispatcherHandlerStop:
+                    break
+                except Exception:
+                    LOGGER.exception("Moderation pipeline stage in group %s failed", group)
+        finally:
+            _LOCAL.state = None
+
+
+def install_pipeline(dispatcher, groups=PIPELINE_GROUPS):
+    # move the handlers of the moderation groups into one handler, registered at the first of those groups
+    stages = []
+    for group in groups:
+        handlers = list(dispatcher.handlers.get(group, []))
+        if not handlers:
+            continue
+        for handler in handlers:
+            dispatcher.remove_handler(handler, group)
+        stages.append((group, handlers))
+
+    if not stages:
+        return None
+
+    pipeline = ModerationPipeline(stages)
+    dispatcher.add_handler(pipeline, stages[0][0])
+    LOGGER.info("Moderation pipeline running groups %s as one job.", str([group for group, _ in stages]))
+    return pipeline
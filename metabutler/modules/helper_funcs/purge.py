@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.error import BadRequest, RetryAfter, InvalidToken, NetworkError
+
+from metabutler import updater, LOGGER
+from metabutler.modules.helper_funcs.ratelimit import TokenBucket
+
+CHUNK_SIZE = 100  # deleteMessages takes at most 100 ids per call
+PURGE_WORKERS = 4  # chunks deleted at the same time, over all purges
+DELETE_RATE = 20  # delete calls per second, over all purges
+BACKGROUND_OVER = CHUNK_SIZE  # bigger purges answer right away and report progress by editing one message
+PROGRESS_EVERY = 3  # seconds between two progress edits
+GONE_PER_CHAT = 5000  # deleted or missing ids remembered per chat
+GONE_CHATS = 256
+CHUNK_ATTEMPTS = 3  # tries of one deleteMessages call that timed out or hit a network error
+
+CANT_DELETE_TEXT = "Cannot delete all messages. The messages may be too old, I might not have delete rights, " \
+                   "or this might not be a supergroup."
+
+
+class Purge(object):
+    def __init__(self, chat_id, message_ids, status=None):
+        self.chat_id = chat_id
+        self.message_ids = message_ids
+        self.status = status  # message edited with the progress, None for a purge the caller waits for
+        self.deleted = 0
+        self.missing = 0
+        self.forbidden = 0
+        self.pending = 0
+        self.reported = time.monotonic()
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def progress_text(self):
+        return "Purging... {}/{} messages deleted.".format(self.deleted, len(self.message_ids))
+
+    def result_text(self):
+        text = "Purge complete, deleted {} messages.".format(self.deleted)
+        if self.forbidden:
+            text += "\n" + CANT_DELETE_TEXT
+        return text
+
+
+class PurgeEngine(object):
+    """
+    Deletes a range of messages in chunks of CHUNK_SIZE on a small thread pool, at DELETE_RATE calls per second.
+
+    Chunks go through deleteMessages; if the Bot API server does not know that method the engine falls back to one
+    deleteMessage per id. Ids that were deleted or reported missing are remembered per chat and skipped next time.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=PURGE_WORKERS)
+        self.bucket = TokenBucket(DELETE_RATE, DELETE_RATE)
+        self.batch = True
+        self.gone = OrderedDict()  # chat_id -> set of message ids that are no longer there
+        self.lock = threading.Lock()
+
+    def known_gone(self, chat_id):
+        with self.lock:
+            return set(self.gone.get(chat_id, ()))
+
+    def mark_gone(self, chat_id, message_ids):
+        with self.lock:
+            gone = self.gone.get(chat_id)
+            if gone is None:
+                gone = self.gone[chat_id] = set()
+                while len(self.gone) > GONE_CHATS:
+                    self.gone.popitem(last=False)
+            else:
+                self.gone.move_to_end(chat_id)
+            gone.update(message_ids)
+            if len(gone) > GONE_PER_CHAT:
+                # ids only grow, the oldest ones are the least likely to be purged again
+                for message_id in sorted(gone)[:len(gone) - GONE_PER_CHAT]:
+                    gone.discard(message_id)
+
+    def prepare(self, chat_id, first_id, last_id, status=None):
+        gone = self.known_gone(chat_id)
+        message_ids = [m_id for m_id in range(last_id, first_id - 1, -1) if m_id not in gone]
+        purge = Purge(chat_id, message_ids, status)
+        chunks = [message_ids[i:i + CHUNK_SIZE] for i in range(0, len(message_ids), CHUNK_SIZE)]
+        return purge, chunks
+
+    def run(self, bot, chat_id, first_id, last_id):
+        # small purges, deleted on the calling thread so they never queue behind a big background purge
+        purge, chunks = self.prepare(chat_id, first_id, last_id)
+        for chunk in chunks:
+            try:
+                deleted, missing, forbidden = self.delete_chunk(bot, chat_id, chunk)
+            except Exception:
+                LOGGER.exception("Error while purging chat messages.")
+                continue
+            purge.deleted += deleted
+            purge.missing += missing
+            purge.forbidden += forbidden
+        purge.done.set()
+        return purge
+
+    def start(self, bot, chat_id, first_id, last_id, status=None):
+        purge, chunks = self.prepare(chat_id, first_id, last_id, status)
+        if not chunks:
+            self.finish(bot, purge)
+            return purge
+
+        purge.pending = len(chunks)
+        for chunk in chunks:
+            self.executor.submit(self.run_chunk, bot, purge, chunk)
+        return purge
+
+    def run_chunk(self, bot, purge, chunk):
+        try:
+            deleted, missing, forbidden = self.delete_chunk(bot, purge.chat_id, chunk)
+        except Exception:
+            LOGGER.exception("Error while purging chat messages.")
+            deleted, missing, forbidden = 0, 0, 0
+
+        with purge.lock:
+            purge.deleted += deleted
+            purge.missing += missing
+            purge.forbidden += forbidden
+            purge.pending -= 1
+            finished = purge.pending == 0
+            report = not finished and purge.status and time.monotonic() - purge.reported > PROGRESS_EVERY
+            if report:
+                purge.reported = time.monotonic()
+
+        if finished:
+            self.finish(bot, purge)
+        elif report:
+            try:
+                purge.status.edit_text(purge.progress_text())
+            except BadRequest:
+                pass
+
+    def delete_chunk(self, bot, chat_id, chunk):
+        # returns (deleted, missing, forbidden)
+        attempts = 0
+        while self.batch:
+            self.bucket.acquire()
+            try:
+                bot.request.post("{}/deleteMessages".format(bot.base_url),
+                                 {'chat_id': chat_id, 'message_ids': chunk})
+                # missing ids are skipped silently by deleteMessages, so they count as deleted here
+                self.mark_gone(chat_id, chunk)
+                return len(chunk), 0, 0
+            except RetryAfter as excp:
+                self.bucket.pause(excp.retry_after)
+            except BadRequest:
+                # nothing in the chunk could be deleted, find out why message by message
+                break
+            except InvalidToken as excp:
+                # the Bot API answers an unknown method with 404, which is raised as InvalidToken
+                LOGGER.warning("deleteMessages is not available (%s), purging one message at a time", excp.message)
+                self.batch = False
+            except NetworkError:
+                # includes TimedOut; ids that were deleted already are skipped by the next try
+                attempts += 1
+                if attempts >= CHUNK_ATTEMPTS:
+                    raise
+
+        deleted, missing, forbidden = 0, 0, 0
+        gone = []
+        for m_id in chunk:
+            while True:
+                self.bucket.acquire()
+                try:
+                    bot.delete_message(chat_id, m_id)
+                    deleted += 1
+                    gone.append(m_id)
+                except RetryAfter as excp:
+                    self.bucket.pause(excp.retry_after)
+                    continue
+                except BadRequest as err:
+                    if err.message == "Message to delete not found":
+                        missing += 1
+                        gone.append(m_id)
+                    elif err.message == "Message can't be deleted":
+                        forbidden += 1
+                    else:
+                        LOGGER.exception("Error while purging chat messages.")
+                break
+
+        self.mark_gone(chat_id, gone)
+        return deleted, missing, forbidden
+
+    def finish(self, bot, purge):
+        purge.done.set()
+        if not purge.status:
+            return
+        try:
+            purge.status.edit_text(purge.result_text())
+        except BadRequest:
+            return
+        if not purge.forbidden:
+            updater.job_queue.run_once(lambda context: delete_quietly(purge.status), 5)
+
+
+def delete_quietly(message):
+    try:
+        message.delete()
+    except BadRequest:
+        pass
+
+
+PURGE_ENGINE = PurgeEngine()
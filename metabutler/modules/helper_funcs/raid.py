@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import deque
+
+from telegram import ChatPermissions, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import BadRequest, RetryAfter, TelegramError, Unauthorized
+
+from metabutler import updater, LOGGER
+import metabutler.modules.sql.welcome_sql as sql
+from metabutler.modules.helper_funcs.ratelimit import TokenBucket
+
+RAID_JOINS = 10  # joins within RAID_WINDOW seconds that switch a chat into raid mode
+RAID_WINDOW = 60
+RAID_QUIET = 120  # raid mode ends once nobody joined for this long
+RESTRICT_RATE = 10  # restrictions per second over all raided chats
+
+
+class Raid(object):
+	def __init__(self, chat_id, now):
+		self.chat_id = chat_id
+		self.started = now
+		self.last_join = now
+		self.joined = 0
+		self.restricted = 0
+		self.secured = False  # welcome security was on, so joins get muted and the button is offered
+		self.queue = deque()
+		self.message_id = None
+
+
+class RaidGuard(object):
+	"""
+	Counts joins per chat over a sliding window. Past RAID_JOINS joins the chat is in raid mode: new_member stops
+	welcoming people one by one, mutes go through a paced queue written to the database in batches, and one summary
+	message is kept up to date instead.
+	"""
+
+	def __init__(self):
+		self.joins = {}  # chat_id -> deque of (time, joins), oldest first
+		self.totals = {}  # chat_id -> joins inside the window
+		self.raids = {}  # chat_id -> Raid
+		self.bucket = TokenBucket(RESTRICT_RATE, RESTRICT_RATE)
+		self.lock = threading.Lock()
+
+	def register_joins(self, chat_id, count):
+		# returns (raid, started) when the chat is in raid mode, (None, False) otherwise
+		now = time.time()
+		with self.lock:
+			window = self.joins.setdefault(chat_id, deque())
+			window.append((now, count))
+			total = self.totals.get(chat_id, 0) + count
+			while window and window[0][0] < now - RAID_WINDOW:
+				total -= window.popleft()[1]
+			self.totals[chat_id] = total
+
+			raid = self.raids.get(chat_id)
+			started = False
+			if raid is None and total >= RAID_JOINS:
+				raid = self.raids[chat_id] = Raid(chat_id, now)
+				raid.joined = total - count
+				started = True
+			if raid is not None:
+				raid.last_join = now
+				raid.joined += count
+			return raid, started
+
+	def queue_restrict(self, raid, user_id):
+		with self.lock:
+			raid.queue.append(user_id)
+
+	def drain(self, bot, raid):
+		muted = []
+		try:
+			while raid.queue and self.bucket.try_acquire():
+				user_id = raid.queue.popleft()
+				try:
+					bot.restrict_chat_member(raid.chat_id, user_id,
+											 permissions=ChatPermissions(can_send_messages=False))
+					muted.append(user_id)
+				except RetryAfter as excp:
+					raid.queue.appendleft(user_id)
+					self.bucket.pause(excp.retry_after)
+					break
+				except BadRequest as excp:
+					LOGGER.warning("Couldn't mute %s during raid in %s: %s", user_id, raid.chat_id, excp.message)
+				except Unauthorized as excp:
+					# kicked out of the chat, nobody left in the queue can be muted
+					LOGGER.warning("Stopped muting during raid in %s: %s", raid.chat_id, excp.message)
+					raid.queue.clear()
+					break
+				except TelegramError as excp:
+					# timeouts and network errors: the user is tried again on the next tick
+					LOGGER.warning("Couldn't mute %s during raid in %s: %s", user_id, raid.chat_id, excp.message)
+					raid.queue.appendleft(user_id)
+					break
+		finally:
+			# the ones already muted must be in the userlist, or the verify button won't unmute them
+			if muted:
+				sql.add_many_to_userlist(raid.chat_id, muted, False)
+				raid.restricted += len(muted)
+
+	def tick(self, context):
+		now = time.time()
+		with self.lock:
+			raids = list(self.raids.values())
+			# forget join windows of chats that went quiet
+			for chat_id in [chat_id for chat_id, window in self.joins.items()
+							if not window or window[-1][0] < now - RAID_WINDOW]:
+				del self.joins[chat_id]
+				self.totals.pop(chat_id, None)
+
+		for raid in raids:
+			try:
+				self.drain(context.bot, raid)
+				if not raid.queue and now - raid.last_join > RAID_QUIET:
+					with self.lock:
+						self.raids.pop(raid.chat_id, None)
+					self.report(context.bot, raid, finished=True)
+			except TelegramError as excp:
+				LOGGER.warning("Raid handling in %s failed: %s", raid.chat_id, excp.message)
+
+	def report(self, bot, raid, finished=False):
+		if finished:
+			text = "Raid is over: {} members joined, {} of them were muted. Welcome messages are back on.".format(
+				raid.joined, raid.restricted)
+		else:
+			text = "Raid detected! {} members joined in the last minute, I will stop welcoming them one by one " \
+				   "until it calms down.".format(raid.joined)
+		keyboard = None
+		if raid.secured:
+			text += "\nNew members are muted, press the button below to get unmuted."
+			keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(text="I'm not a bot",
+																	 callback_data="raid_verify")]])
+		if raid.message_id is None:
+			sent = bot.send_message(raid.chat_id, text, reply_markup=keyboard)
+			raid.message_id = sent.message_id
+		else:
+			try:
+				bot.edit_message_text(text, chat_id=raid.chat_id, message_id=raid.message_id, reply_markup=keyboard)
+			except BadRequest:
+				bot.send_message(raid.chat_id, text, reply_markup=keyboard)
+
+
+RAID_GUARD = RaidGuard()
+
+job = updater.job_queue
+
+job_raid = job.run_repeating(RAID_GUARD.tick, interval=1, first=1)
+job_raid.enabled = True
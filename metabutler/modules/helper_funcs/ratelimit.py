@@ -0,0 +1,201 @@
+import threading
+import time
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+
+from telegram.error import RetryAfter
+from telegram.utils.request import Request
+
+from metabutler import LOGGER
+
+
+class TokenBucket(object):
+    # classic token bucket: `rate` tokens per second, never more than `capacity` saved up
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.stamp = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def try_acquire(self, tokens=1):
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return False
+            self._refill(now)
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens=1):
+        # seconds until `tokens` are available, 0 if they are right now
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            missing = max(0.0, (tokens - self.tokens) / self.rate)
+            return max(missing, self.paused_until - now)
+
+    def acquire(self, tokens=1):
+        # blocking version, only for worker threads
+        while not self.try_acquire(tokens):
+            time.sleep(max(self.wait_time(tokens), 0.01))
+
+    def pause(self, seconds):
+        # Telegram told us to back off (RetryAfter), hand out nothing until then
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+class KeyedTokenBuckets(object):
+    # one bucket per key (chat id), idle buckets are dropped once more than `maxsize` keys were seen
+    def __init__(self, rate, capacity, maxsize=4096):
+        self.rate = rate
+        self.capacity = capacity
+        self.maxsize = maxsize
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.rate, self.capacity)
+                while len(self.buckets) > self.maxsize:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+            return bucket
+
+    def try_acquire(self, key, tokens=1):
+        return self.get(key).try_acquire(tokens)
+
+
+# Telegram's documented limits: ~30 messages per second overall, about one per second in a private chat and
+# 20 per minute in a group.
+GLOBAL_SEND_RATE = 30
+PRIVATE_SEND_RATE, PRIVATE_SEND_BURST = 1, 3
+GROUP_SEND_RATE, GROUP_SEND_BURST = 20 / 60, 20
+
+RETRY_ATTEMPTS = 3
+MAX_RETRY_AFTER = 30  # longer back-offs are raised to the caller instead of sleeping through them
+
+_LOCAL = threading.local()
+
+
+@contextmanager
+def blocking_sends():
+    # for background engines: sends made inside wait for the chat's bucket and sleep through flood waits
+    previous = getattr(_LOCAL, 'blocking', False)
+    _LOCAL.blocking = True
+    try:
+        yield
+    finally:
+        _LOCAL.blocking = previous
+
+# methods that post something into a chat and count towards the send limits
+SEND_METHODS = {'forwardMessage', 'copyMessage', 'editMessageText', 'editMessageCaption', 'editMessageMedia',
+                'editMessageReplyMarkup', 'stopPoll'}
+
+
+class ApiStats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.throttled = 0
+        self.throttle_wait = 0.0
+        self.over_chat_limit = 0
+        self.retry_after = 0
+
+    def record(self, method, waited=0.0):
+        with self.lock:
+            self.calls[method] += 1
+            if waited:
+                self.throttled += 1
+                self.throttle_wait += waited
+
+    def record_over_chat_limit(self):
+        with self.lock:
+            self.over_chat_limit += 1
+
+    def record_retry(self):
+        with self.lock:
+            self.retry_after += 1
+
+    def __str__(self):
+        with self.lock:
+            top = ", ".join("{} {}".format(method, count) for method, count in self.calls.most_common(8))
+            return "Bot API: {} calls ({}), {} throttled for {:.1f}s, {} over a chat's limit, {} flood waits".format(
+                sum(self.calls.values()), top or "none", self.throttled, self.throttle_wait, self.over_chat_limit,
+                self.retry_after)
+
+
+API_STATS = ApiStats()
+
+
+class ThrottledRequest(Request):
+    """
+    Request object handed to the Bot, so every Bot API call of every module goes through it.
+
+    Sends wait for the global token bucket, which only ever takes milliseconds. The chat's bucket only holds back
+    sends made inside blocking_sends(), i.e. from the background engines: a dispatcher worker never sits out a
+    busy group's 20 per minute, it sends anyway and the overrun is counted. The same goes for flood waits, a
+    RetryAfter is raised to a worker right away while a background engine pauses the bucket and tries again.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.global_bucket = TokenBucket(GLOBAL_SEND_RATE, GLOBAL_SEND_RATE)
+        self.private_buckets = KeyedTokenBuckets(PRIVATE_SEND_RATE, PRIVATE_SEND_BURST)
+        self.group_buckets = KeyedTokenBuckets(GROUP_SEND_RATE, GROUP_SEND_BURST)
+
+    def chat_bucket(self, chat_id):
+        chat_id = str(chat_id)
+        if chat_id.startswith(('-', '@')):
+            return self.group_buckets.get(chat_id)
+        return self.private_buckets.get(chat_id)
+
+    def post(self, url, data, timeout=None):
+        method = url.rsplit('/', 1)[-1]
+        chat_id = data.get('chat_id') if isinstance(data, dict) else None
+        buckets = []
+        if chat_id is not None and (method.startswith('send') or method in SEND_METHODS):
+            buckets = [self.chat_bucket(chat_id), self.global_bucket]
+
+        blocking = getattr(_LOCAL, 'blocking', False)
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            if buckets:
+                chat_bucket, global_bucket = buckets
+                if blocking:
+                    chat_bucket.acquire()
+                elif not chat_bucket.try_acquire():
+                    API_STATS.record_over_chat_limit()
+                global_bucket.acquire()
+            API_STATS.record(method, time.monotonic() - start if buckets else 0.0)
+            try:
+                return super().post(url, data, timeout=timeout)
+            except RetryAfter as excp:
+                API_STATS.record_retry()
+                attempt += 1
+                if not blocking or attempt >= RETRY_ATTEMPTS or excp.retry_after > MAX_RETRY_AFTER:
+                    if buckets:
+                        buckets[0].pause(excp.retry_after)
+                    raise
+                LOGGER.warning("%s flood wait of %ss (chat %s), retrying", method, excp.retry_after, chat_id)
+                if buckets:
+                    buckets[0].pause(excp.retry_after)
+                else:
+                    time.sleep(excp.retry_after)
+
+
+def api_stats():
+    return str(API_STATS)
@@ -0,0 +1,72 @@
+import re
+import threading
+from typing import Iterable, Optional
+
+
+def trigger_priority(trigger: str):
+	# longest triggers win, ties broken alphabetically - same order the sql modules keep their lists in
+	return -len(trigger), trigger
+
+
+class TriggerMatcher(object):
+	"""
+	Matches every trigger of a chat with one compiled regex.
+
+	Each trigger gets its own capture group, in priority order, inside a zero-width lookahead. Scanning the text
+	once with finditer then reports, for every position, the highest priority trigger starting there; the lowest
+	group index seen is the trigger the old per-trigger loop would have picked.
+	"""
+
+	def __init__(self, triggers: Iterable[str]):
+		self.triggers = sorted(set(triggers), key=trigger_priority)
+		if self.triggers:
+			alternatives = "|".join("({})".format(re.escape(trigger)) for trigger in self.triggers)
+			pattern = r"(?=(?<!\w)(?:" + alternatives + r")(?!\w))"
+			self.regex = re.compile(pattern, flags=re.IGNORECASE)
+		else:
+			self.regex = None
+
+	def search(self, text: str) -> Optional[str]:
+		if not self.regex or not text:
+			return None
+
+		best = None
+		for match in self.regex.finditer(text):
+			if best is None or match.lastindex < best:
+				best = match.lastindex
+				if best == 1:  # top priority trigger, nothing can beat it
+					break
+
+		if best is None:
+			return None
+		return self.triggers[best - 1]
+
+
+class TriggerMatcherCache(object):
+	"""Per-chat cache of compiled matchers, rebuilt lazily after the owning sql module invalidates a chat."""
+
+	def __init__(self, get_triggers):
+		self.get_triggers = get_triggers
+		self.matchers = {}  # chat_id -> TriggerMatcher
+		self.lock = threading.RLock()
+
+	def get(self, chat_id) -> TriggerMatcher:
+		matcher = self.matchers.get(str(chat_id))
+		if matcher is None:
+			with self.lock:
+				matcher = self.matchers.get(str(chat_id))
+				if matcher is None:
+					matcher = TriggerMatcher(self.get_triggers(chat_id))
+					self.matchers[str(chat_id)] = matcher
+		return matcher
+
+	def search(self, chat_id, text: str) -> Optional[str]:
+		return self.get(chat_id).search(text)
+
+	def invalidate(self, chat_id):
+		with self.lock:
+			self.matchers.pop(str(chat_id), None)
+
+	def clear(self):
+		with self.lock:
+			self.matchers.clear()
@@ -1,43 +1,98 @@
+import heapq
 import random
 import re
+import threading
 import time
 
 from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto, ChatPermissions
-from telegram.ext import CommandHandler, CallbackQueryHandler, Filters, run_async
+from telegram.ext import CommandHandler, CallbackQueryHandler, Filters
 from telegram.error import BadRequest
 from telegram.utils.helpers import mention_markdown
 
 from metabutler import dispatcher, updater, IS_DEBUG
 import metabutler.modules.sql.welcome_sql as sql
 from metabutler.modules.connection import connected
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.helper_funcs.alternate import send_message, send_message_raw
 from metabutler.modules.helper_funcs.chat_status import user_admin
 from metabutler.modules.helper_funcs.string_handling import make_time, extract_time_int
 
-def welcome_timeout(context):
-	for cht in sql.get_all_chat_timeout():
-		user_id = cht.user_id
-		chat_id = cht.chat_id
-		if int(time.time()) >= int(cht.timeout_int):
-			getcur, extra_verify, cur_value, timeout, timeout_mode, cust_text = sql.welcome_security(chat_id)
+class TimeoutScheduler(object):
+	"""
+	Min-heap of pending verification deadlines. Only one job queue wake-up is pending at a time, for the earliest
+	deadline; entries whose user verified or got a new deadline meanwhile are skipped when they come up.
+	"""
+
+	def __init__(self, job_queue):
+		self.job_queue = job_queue
+		self.heap = []
+		self.wakeup = None  # deadline of the pending wake-up
+		self.lock = threading.Lock()
+
+	def _wake_at(self, deadline):
+		self.wakeup = deadline
+		self.job_queue.run_once(self.fire, max(deadline - time.time(), 0), context=deadline)
+
+	def schedule(self, chat_id, user_id, deadline):
+		with self.lock:
+			heapq.heappush(self.heap, (deadline, str(chat_id), user_id))
+			if self.wakeup is None or deadline < self.wakeup:
+				self._wake_at(deadline)
+
+	def seed(self):
+		# pending verifications from the database, already in deadline order
+		with self.lock:
+			self.heap = [(int(cht.timeout_int), cht.chat_id, cht.user_id) for cht in sql.get_all_chat_timeout()]
+			heapq.heapify(self.heap)
+			if self.heap:
+				self._wake_at(self.heap[0][0])
+
+	def pop_due(self, fired_at):
+		now = int(time.time())
+		due = []
+		with self.lock:
+			while self.heap and self.heap[0][0] <= now:
+				due.append(heapq.heappop(self.heap))
+			# an outdated wake-up (an earlier deadline was scheduled after it) leaves the pending one alone
+			if fired_at == self.wakeup:
+				self.wakeup = None
+				if self.heap:
+					self._wake_at(self.heap[0][0])
+		return due
+
+	def fire(self, context):
+		expired = {}
+		for deadline, chat_id, user_id in self.pop_due(context.job.context):
+			if sql.get_timeout(chat_id, user_id) == deadline:
+				expired.setdefault(chat_id, []).append(user_id)
+		if expired:
+			remove_unverified(context.bot, expired)
+
+
+def remove_unverified(bot, expired):
+	# expired: chat_id -> user ids; the chat settings are read once per chat and the rows deleted in one go
+	done = []
+	for chat_id, user_ids in expired.items():
+		getcur, extra_verify, cur_value, timeout, timeout_mode, cust_text = sql.welcome_security(chat_id)
+		for user_id in user_ids:
 			if timeout_mode == 1:
 				try:
-					context.bot.unbanChatMember(chat_id, user_id)
-					# send_message_raw(chat_id, tl(user_id, "Verifikasi gagal!\n{} telah di tendang!").format(mention_markdown(user_id, context.bot.getChatMember(chat_id, user_id).user.first_name)), parse_mode="markdown")
+					bot.unbanChatMember(chat_id, user_id)
 				except Exception as err:
 					pass
-					# send_message_raw(chat_id, tl(user_id, "Verifikasi gagal!\nTetapi gagal menendang {}: {}").format(mention_markdown(user_id, context.bot.getChatMember(chat_id, user_id).user.first_name), str(err)), parse_mode="markdown")
 			elif timeout_mode == 2:
 				try:
-					context.bot.kickChatMember(chat_id, user_id)
-					# send_message_raw(chat_id, tl(user_id, "Verifikasi gagal!\n{} telah di banned!").format(mention_markdown(user_id, context.bot.getChatMember(chat_id, user_id).user.first_name)), parse_mode="markdown")
+					bot.kickChatMember(chat_id, user_id)
 				except Exception as err:
 					pass
-					# send_message_raw(chat_id, tl(user_id, "Verifikasi gagal!\nTetapi gagal membanned {}: {}").format(mention_markdown(user_id, context.bot.getChatMember(chat_id, user_id).user.first_name), str(err)), parse_mode="markdown")
-			sql.rm_from_timeout(chat_id, user_id)
+			done.append((chat_id, user_id))
+	sql.rm_timeouts(done)
 
 
+def schedule_timeout(chat_id, user_id, timeout):
+	WELCOME_TIMEOUTS.schedule(chat_id, user_id, sql.add_to_timeout(chat_id, user_id, timeout))
+
 
 @run_async
 @user_admin
@@ -146,10 +201,8 @@ def timeout_mode(update, context):
 
 
 
-job = updater.job_queue
-
-job_timeout_set = job.run_repeating(welcome_timeout, interval=10, first=1)
-job_timeout_set.enabled = True
+WELCOME_TIMEOUTS = TimeoutScheduler(updater.job_queue)
+WELCOME_TIMEOUTS.seed()
 
 
 WELCVERIFY_HANDLER = CommandHandler("welcomeverify", set_verify_welcome, pass_args=True, filters=Filters.group)
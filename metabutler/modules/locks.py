@@ -6,7 +6,6 @@ from telegram import Message, Chat, Update, Bot, ParseMode, User, MessageEntity
 from telegram import TelegramError, ChatPermissions
 from telegram.error import BadRequest
 from telegram.ext import CommandHandler, MessageHandler, Filters
-from telegram.ext.dispatcher import run_async
 from telegram.utils.helpers import mention_html
 
 from alphabet_detector import AlphabetDetector
@@ -14,8 +13,10 @@ from alphabet_detector import AlphabetDetector
 import metabutler.modules.sql.locks_sql as sql
 from metabutler import dispatcher, SUDO_USERS, LOGGER
 from metabutler.modules.disable import DisableAbleCommandHandler
+from metabutler.modules.helper_funcs.pipeline import run_async
 from metabutler.modules.helper_funcs.chat_status import can_delete, is_user_admin, user_not_admin, user_admin, \
-	bot_can_delete, is_bot_admin
+	is_bot_admin
+from metabutler.modules.helper_funcs import pipeline
 from metabutler.modules.helper_funcs.filters import CustomFilters
 from metabutler.modules.log_channel import loggable
 from metabutler.modules.sql import users_sql
@@ -266,42 +267,28 @@ def unlock(update, context) -> str:
 def del_lockables(update, context):
 	chat = update.effective_chat  # type: Optional[Chat]
 	message = update.effective_message  # type: Optional[Message]
-	
+
+	# one in-memory lookup for the whole chat, most chats have nothing locked
+	locked = sql.get_lock_mask(chat.id)
+	if not locked or not any(locked & sql.LOCK_BITS[lockable] for lockable in LOCK_TYPES):
+		return
+
+	deletable = None
+
+	def can_delete_here():
+		# only asked once a locked type matched, and at most once per message
+		nonlocal deletable
+		if deletable is None:
+			deletable = can_delete(chat, context.bot.id)
+		return deletable
+
 	for lockable, filter in LOCK_TYPES.items():
-		if lockable == "rtl":
-			if sql.is_locked(chat.id, lockable) and can_delete(chat, context.bot.id):
-				if message.caption:
-					check = ad.detect_alphabet(u'{}'.format(message.caption))
-					if 'ARABIC' in check:
-						try:
-							message.delete()
-						except BadRequest as excp:
-							if excp.message == "Message to delete not found":
-								pass
-							else:
-								LOGGER.exception("ERROR in lockables")
-						getconf = sql.get_lockconf(chat.id)
-						if getconf:
-							warn(update.effective_user, chat, "Send 'RTL Text' which currently locked", message, update.effective_user, conn=False)
-						break
-				if message.text:
-					check = ad.detect_alphabet(u'{}'.format(message.text))
-					if 'ARABIC' in check:
-						try:
-							message.delete()
-						except BadRequest as excp:
-							if excp.message == "Message to delete not found":
-								pass
-							else:
-								LOGGER.exception("ERROR in lockables")
-						getconf = sql.get_lockconf(chat.id)
-						if getconf:
-							warn(update.effective_user, chat, "Send 'RTL Text' which currently locked", message, update.effective_user, conn=False)
-						break
+		if not locked & sql.LOCK_BITS[lockable]:
 			continue
-		if lockable == "button":
-			if sql.is_locked(chat.id, lockable) and can_delete(chat, context.bot.id):
-				if message.reply_markup and message.reply_markup.inline_keyboard:
+		if lockable == "rtl":
+			if message.caption:
+				check = ad.detect_alphabet(u'{}'.format(message.caption))
+				if 'ARABIC' in check and can_delete_here():
 					try:
 						message.delete()
 					except BadRequest as excp:
@@ -311,10 +298,38 @@ def del_lockables(update, context):
 							LOGGER.exception("ERROR in lockables")
 					getconf = sql.get_lockconf(chat.id)
 					if getconf:
-						warn(update.effective_user, chat, "Send 'Button Message' which currently locked", message, update.effective_user, conn=False)
+						warn(update.effective_user, chat, "Send 'RTL Text' which currently locked", message, update.effective_user, conn=False)
 					break
+			if message.text:
+				check = ad.detect_alphabet(u'{}'.format(message.text))
+				if 'ARABIC' in check and can_delete_here():
+					try:
+						message.delete()
+					except BadRequest as excp:
+						if excp.message == "Message to delete not found":
+							pass
+						else:
+							LOGGER.exception("ERROR in lockables")
+					getconf = sql.get_lockconf(chat.id)
+					if getconf:
+						warn(update.effective_user, chat, "Send 'RTL Text' which currently locked", message, update.effective_user, conn=False)
+					break
+			continue
+		if lockable == "button":
+			if message.reply_markup and message.reply_markup.inline_keyboard and can_delete_here():
+				try:
+					message.delete()
+				except BadRequest as excp:
+					if excp.message == "Message to delete not found":
+						pass
+					else:
+						LOGGER.exception("ERROR in lockables")
+				getconf = sql.get_lockconf(chat.id)
+				if getconf:
+					warn(update.effective_user, chat, "Send 'Button Message' which currently locked", message, update.effective_user, conn=False)
+				break
 			continue
-		if filter(update) and sql.is_locked(chat.id, lockable) and can_delete(chat, context.bot.id):
+		if filter(update) and can_delete_here():
 			if lockable == "bots":
 				new_members = update.effective_message.new_chat_members
 				for new_mem in new_members:
@@ -342,6 +357,11 @@ def del_lockables(update, context):
 					warn(update.effective_user, chat, "Send '{}' which currently locked".format(lockable), message, update.effective_user, conn=False)
  
 				break
+	else:
+		return
+
+	# every break above means the message got deleted
+	pipeline.halt()
 
 
 def build_lock_message(chat_id):
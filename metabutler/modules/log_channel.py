@@ -11,12 +11,13 @@ FILENAME = __name__.rsplit(".", 1)[-1]
 if is_module_loaded(FILENAME):
     from telegram import Bot, Update, ParseMode, Message, Chat
     from telegram.error import BadRequest, Unauthorized
-    from telegram.ext import CommandHandler, run_async
+    from telegram.ext import CommandHandler
     from telegram.utils.helpers import escape_markdown
 
     from metabutler import dispatcher, LOGGER
     from metabutler.modules.helper_funcs.chat_status import user_admin
     from metabutler.modules.sql import log_channel_sql as sql
+    from metabutler.modules.helper_funcs.pipeline import run_async
 
 
     def loggable(func):
@@ -10,7 +10,7 @@ import requests
 from telegram.error import BadRequest, Unauthorized
 from telegram import Message, Chat, Update, Bot, MessageEntity, InlineKeyboardMarkup
 from telegram import ParseMode
-from telegram.ext import CommandHandler, run_async, Filters
+from telegram.ext import CommandHandler, Filters
 from telegram.utils.helpers import escape_markdown, mention_html, mention_markdown
 
 from metabutler import dispatcher, OWNER_ID, SUDO_USERS, SUPPORT_USERS, WHITELIST_USERS, BAN_STICKER
@@ -20,8 +20,12 @@ from metabutler.modules.helper_funcs.extraction import extract_user
 from metabutler.modules.helper_funcs.filters import CustomFilters
 from metabutler.modules.helper_funcs.msg_types import get_message_type
 from metabutler.modules.helper_funcs.misc import build_keyboard_alternate
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 import metabutler.modules.sql.feds_sql as feds_sql
+from metabutler.modules.sql import pool_stats
+from metabutler.modules.helper_funcs.ratelimit import api_stats
+from metabutler.modules.helper_funcs.http_client import HTTP
 from metabutler.modules.helper_funcs.alternate import send_message
 
 
@@ -358,7 +362,7 @@ def markdown_help(update, context):
 
 @run_async
 def stats(update, context):
-    send_message(update.effective_message, "Current stats:\n" + "\n".join([mod.__stats__() for mod in STATS]))
+    send_message(update.effective_message, "Current stats:\n" + "\n".join([mod.__stats__() for mod in STATS] + [pool_stats(), api_stats(), HTTP.stats()]))
 
 
 # /ip is for private use
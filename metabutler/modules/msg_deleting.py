@@ -4,12 +4,13 @@ from typing import Optional, List
 from telegram import Message, Chat, Update, Bot, User
 from telegram.error import BadRequest
 from telegram.ext import CommandHandler, Filters
-from telegram.ext.dispatcher import run_async
 from telegram.utils.helpers import mention_html
 
 from metabutler import dispatcher, LOGGER
 from metabutler.modules.helper_funcs.chat_status import user_admin, can_delete
+from metabutler.modules.helper_funcs.purge import PURGE_ENGINE, BACKGROUND_OVER, CANT_DELETE_TEXT, delete_quietly
 from metabutler.modules.log_channel import loggable
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.helper_funcs.alternate import send_message
 
@@ -31,30 +32,27 @@ def purge(update, context):
                 delete_to = message_id + int(args[0])
             else:
                 delete_to = msg.message_id - 1
-            for m_id in range(delete_to, message_id - 1, -1):  # Reverse iteration over message ids
-                try:
-                    context.bot.deleteMessage(chat.id, m_id)
-                except BadRequest as err:
-                    if err.message == "Message can't be deleted":
-                        send_message(update.effective_message, "Cannot delete all messages. The messages may be too old, I might not have delete rights, or this might not be a supergroup.")
-
-                    elif err.message != "Message to delete not found":
-                        LOGGER.exception("Error while purging chat messages.")
 
             try:
                 msg.delete()
             except BadRequest as err:
                 if err.message == "Message can't be deleted":
-                    send_message(update.effective_message, "Cannot delete all messages. The messages may be too old, I might not have delete rights, or this might not be a supergroup.")
+                    send_message(update.effective_message, CANT_DELETE_TEXT)
 
                 elif err.message != "Message to delete not found":
                     LOGGER.exception("Error while purging chat messages.")
 
-            a = send_message(update.effective_message, "Purge complete.")
-            try:
-                a.delete()
-            except BadRequest:
-                pass
+            if delete_to - message_id + 1 > BACKGROUND_OVER:
+                # big purges run on the purge workers, this message is edited with the progress
+                status = context.bot.send_message(chat.id, "Purging {} messages...".format(delete_to - message_id + 1))
+                PURGE_ENGINE.start(context.bot, chat.id, message_id, delete_to, status=status)
+            else:
+                purge_job = PURGE_ENGINE.run(context.bot, chat.id, message_id, delete_to)
+                if purge_job.forbidden:
+                    context.bot.send_message(chat.id, CANT_DELETE_TEXT)
+                else:
+                    delete_quietly(context.bot.send_message(chat.id, "Purge complete."))
+
             return "<b>{}:</b>" \
                    "\n#PURGE" \
                    "\n<b>Admin:</b> {}" \
@@ -97,6 +95,7 @@ __help__ = """
  - /del: deletes the message you replied to
  - /purge: deletes all messages between this and the replied to message.
  - /purge <integer X>: deletes the replied message, and X messages following it.
+Purges of more than 100 messages run in the background, I'll keep you posted on the progress.
 """
 
 __mod_name__ = "Purges"
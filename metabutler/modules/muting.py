@@ -5,7 +5,6 @@ from telegram import Message, Chat, Update, Bot, User, ParseMode
 from telegram import ChatPermissions
 from telegram.error import BadRequest
 from telegram.ext import CommandHandler, Filters
-from telegram.ext.dispatcher import run_async
 from telegram.utils.helpers import mention_html
 
 from metabutler import dispatcher, LOGGER
@@ -14,6 +13,7 @@ from metabutler.modules.helper_funcs.extraction import extract_user, extract_use
 from metabutler.modules.helper_funcs.string_handling import extract_time
 from metabutler.modules.log_channel import loggable
 from metabutler.modules.connection import connected
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.helper_funcs.alternate import send_message
 
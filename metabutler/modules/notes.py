@@ -1,4 +1,5 @@
-import re, ast
+import re, ast, threading
+from collections import OrderedDict
 from io import BytesIO
 from typing import Optional, List
 
@@ -6,7 +7,6 @@ from telegram import MAX_MESSAGE_LENGTH, ParseMode, InlineKeyboardMarkup
 from telegram import Message, Update, Bot
 from telegram.error import BadRequest, Unauthorized
 from telegram.ext import CommandHandler, MessageHandler, Filters
-from telegram.ext.dispatcher import run_async
 from telegram.utils.helpers import escape_markdown, mention_markdown
 
 import metabutler.modules.sql.notes_sql as sql
@@ -16,6 +16,7 @@ from metabutler.modules.helper_funcs.chat_status import user_admin
 from metabutler.modules.helper_funcs.misc import build_keyboard_parser, revert_buttons
 from metabutler.modules.helper_funcs.msg_types import get_note_type
 from metabutler.modules.helper_funcs.string_handling import escape_invalid_curly_brackets
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.connection import connected
 from metabutler.modules.helper_funcs.alternate import send_message
@@ -43,6 +44,31 @@ ENUM_FUNC_MAP = {
 }
 
 
+VALID_WELCOME_FORMATTERS = ['first', 'last', 'fullname', 'username', 'id', 'chatname', 'mention', 'rules']
+
+RENDER_CACHE_SIZE = 1024
+RENDERED_NOTES = OrderedDict()  # (chat_id, name) -> (CachedNote, format template, keyboard)
+RENDER_LOCK = threading.Lock()
+
+
+def render_note(bot, chat_id, note):
+	# the parts of a note that don't depend on who asked, built once per version of the note
+	key = (str(chat_id), note.name)
+	with RENDER_LOCK:
+		rendered = RENDERED_NOTES.get(key)
+		if rendered is not None and rendered[0] is note:
+			RENDERED_NOTES.move_to_end(key)
+			return rendered[1], rendered[2]
+
+	template = escape_invalid_curly_brackets(note.value, VALID_WELCOME_FORMATTERS)
+	keyboard = InlineKeyboardMarkup(build_keyboard_parser(bot, chat_id, note.buttons))
+	with RENDER_LOCK:
+		RENDERED_NOTES[key] = (note, template, keyboard)
+		while len(RENDERED_NOTES) > RENDER_CACHE_SIZE:
+			RENDERED_NOTES.popitem(last=False)
+	return template, keyboard
+
+
 # Do not async
 def get(bot, update, notename, show_none=True, no_format=False):
 	chat = update.effective_chat  # type: Optional[Chat]
@@ -55,7 +81,7 @@ def get(bot, update, notename, show_none=True, no_format=False):
 		chat_id = update.effective_chat.id
 		send_id = chat_id
 
-	note = sql.get_note(chat_id, notename)
+	note = sql.get_cached_note(chat_id, notename)
 	message = update.effective_message  # type: Optional[Message]
 
 	if note:
@@ -85,9 +111,7 @@ def get(bot, update, notename, show_none=True, no_format=False):
 					else:
 						raise
 		else:
-
-			VALID_WELCOME_FORMATTERS = ['first', 'last', 'fullname', 'username', 'id', 'chatname', 'mention', 'rules']
-			valid_format = escape_invalid_curly_brackets(note.value, VALID_WELCOME_FORMATTERS)
+			valid_format, keyboard = render_note(bot, chat_id, note)
 			if valid_format:
 				text = valid_format.format(first=escape_markdown(message.from_user.first_name),
 											  last=escape_markdown(message.from_user.last_name or message.from_user.first_name),
@@ -95,16 +119,12 @@ def get(bot, update, notename, show_none=True, no_format=False):
 			else:
 				text = ""
 
-			keyb = []
 			parseMode = ParseMode.MARKDOWN
-			buttons = sql.get_buttons(chat_id, notename)
+			buttons = note.buttons
 			if no_format:
 				parseMode = None
 				text += revert_buttons(buttons)
-			else:
-				keyb = build_keyboard_parser(bot, chat_id, buttons)
-
-			keyboard = InlineKeyboardMarkup(keyb)
+				keyboard = InlineKeyboardMarkup([])
 
 			try:
 				is_private, is_delete = sql.get_private_note(chat.id)
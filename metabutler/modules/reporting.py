@@ -4,13 +4,14 @@ from typing import Optional, List
 from telegram import Message, Chat, Update, Bot, User, ParseMode, ChatMember
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest, Unauthorized
-from telegram.ext import CommandHandler, MessageHandler, run_async, Filters, CallbackQueryHandler
+from telegram.ext import CommandHandler, MessageHandler, Filters, CallbackQueryHandler
 from telegram.utils.helpers import mention_html, mention_markdown
 
 from metabutler import dispatcher, LOGGER, OWNER_ID, SUDO_USERS, SUPPORT_USERS, STRICT_GBAN
 from metabutler.modules.helper_funcs.chat_status import user_not_admin, user_admin
 from metabutler.modules.log_channel import loggable
 from metabutler.modules.sql import reporting_sql as sql
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.helper_funcs.alternate import send_message
 
@@ -3,7 +3,7 @@ from typing import Optional, List
 from telegram import Message, Update, Bot, User
 from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.error import BadRequest
-from telegram.ext import CommandHandler, run_async, Filters
+from telegram.ext import CommandHandler, Filters
 from telegram.utils.helpers import escape_markdown
 
 import metabutler.modules.sql.rules_sql as sql
@@ -12,6 +12,7 @@ from metabutler.modules.helper_funcs.chat_status import user_admin
 from metabutler.modules.helper_funcs.misc import build_keyboard_alternate
 from metabutler.modules.helper_funcs.string_handling import markdown_parser, button_markdown_parser
 from metabutler.modules.connection import connected
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.helper_funcs.alternate import send_message
 
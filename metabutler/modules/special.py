@@ -18,7 +18,6 @@ import glob
 import math
 import textwrap
 import os
-import requests
 import json
 import gc
 import datetime
@@ -36,7 +35,7 @@ from typing import Optional, List
 from telegram.error import BadRequest, Unauthorized
 from telegram import Message, Chat, Update, Bot, MessageEntity
 from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import CommandHandler, run_async, Filters, MessageHandler
+from telegram.ext import CommandHandler, Filters, MessageHandler
 from telegram.utils.helpers import escape_markdown, mention_html, mention_markdown
 
 from metabutler import dispatcher, OWNER_ID, SUDO_USERS, SUPPORT_USERS, WHITELIST_USERS, LOGGER
@@ -44,11 +43,15 @@ from metabutler.__main__ import STATS, USER_INFO
 from metabutler.modules.disable import DisableAbleCommandHandler
 from metabutler.modules.helper_funcs.extraction import extract_user
 from metabutler.modules.helper_funcs.filters import CustomFilters
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 from metabutler.modules.helper_funcs.alternate import send_message
+from metabutler.modules.helper_funcs.http_client import HTTP
 from telegraph import Telegraph, upload_file
 
 BASE_URL = 'https://del.dog'
+UD_TTL = 60 * 60  # seconds a lookup result is served from the cache
+PASTE_TTL = 24 * 60 * 60  # paste content never changes
 namespaces = {}
 
 
@@ -228,7 +231,7 @@ def wiki(update, context):
 def urbandictionary(update, context):
     message = update.effective_message
     text = message.text[len('/ud '):]
-    results = requests.get(f'http://api.urbandictionary.com/v0/define?term={text}').json()
+    results = HTTP.get(f'http://api.urbandictionary.com/v0/define?term={text}', ttl=UD_TTL).json()
     try:
         reply_text = f'*{text}*\n\n{results["list"][0]["definition"]}\n\n_{results["list"][0]["example"]}_'
     except:
@@ -249,7 +252,7 @@ def paste(update, context):
         send_message(update.effective_message, "What am I supposed to do with this?!")
         return
 
-    r = requests.post(f'{BASE_URL}/documents', data=data.encode('UTF-8'))
+    r = HTTP.post(f'{BASE_URL}/documents', data=data.encode('UTF-8'))
 
     if r.status_code == 404:
         send_message(update.effective_message, 'Failed to reach dogbin')
@@ -287,7 +290,7 @@ def get_paste_content(update, context):
     elif key.startswith(format_normal):
         key = key[len(format_normal):]
 
-    r = requests.get(f'{BASE_URL}/raw/{key}')
+    r = HTTP.get(f'{BASE_URL}/raw/{key}', ttl=PASTE_TTL)
 
     if r.status_code != 200:
         try:
@@ -321,7 +324,7 @@ def get_paste_stats(update, context):
     elif key.startswith(format_normal):
         key = key[len(format_normal):]
 
-    r = requests.get(f'{BASE_URL}/documents/{key}')
+    r = HTTP.get(f'{BASE_URL}/documents/{key}')
 
     if r.status_code != 200:
         try:
@@ -1,16 +1,132 @@
+import threading
+import time
+from contextlib import contextmanager
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import sessionmaker, scoped_session, Session
+from sqlalchemy.pool import QueuePool
+
+from metabutler import DB_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_PRE_PING
+
+
+class PoolStats(object):
+    # how long threads waited to get a connection out of the pool
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def record(self, waited, timed_out=False):
+        with self.lock:
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            if timed_out:
+                self.timeouts += 1
+
+    def __str__(self):
+        with self.lock:
+            average = self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0
+            return "{} db checkouts, {:.1f}ms average wait, {:.1f}ms max wait, {} timeouts".format(
+                self.checkouts, average, self.max_wait * 1000, self.timeouts)
+
+
+POOL_STATS = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        start = time.monotonic()
+        timed_out = True
+        try:
+            conn = super()._do_get()
+            timed_out = False
+            return conn
+        finally:
+            POOL_STATS.record(time.monotonic() - start, timed_out)
+
 
-from metabutler import DB_URI
+class BatchableSession(Session):
+    # inside batched_session() commit() only flushes, so many module calls end up in one transaction
+    batch_depth = 0
+
+    def commit(self):
+        if self.batch_depth:
+            self.flush()
+        else:
+            super().commit()
+
+    def close(self):
+        if not self.batch_depth:
+            super().close()
 
 
 def start() -> scoped_session:
-    engine = create_engine(DB_URI, client_encoding="utf8")
+    engine = create_engine(DB_URI, client_encoding="utf8", poolclass=TimedQueuePool, pool_size=DB_POOL_SIZE,
+                           max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+                           pool_pre_ping=DB_POOL_PRE_PING)
     BASE.metadata.bind = engine
     BASE.metadata.create_all(engine)
-    return scoped_session(sessionmaker(bind=engine, autoflush=False))
+    return scoped_session(sessionmaker(bind=engine, autoflush=False, class_=BatchableSession))
 
 
 BASE = declarative_base()
 SESSION = start()
+
+# Sessions for one unit of work, independent of the thread-local SESSION
+SESSION_FACTORY = sessionmaker(bind=BASE.metadata.bind, autoflush=False, expire_on_commit=False)
+
+
+@contextmanager
+def session_scope():
+    # commits on success, rolls back on error, always gives the connection back to the pool
+    session = SESSION_FACTORY()
+    try:
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+@contextmanager
+def read_session():
+    # for lookups: nothing is committed and no module lock is needed around it. close() alone gives the
+    # connection back (rolled back by the pool) and keeps the rows it loaded usable after the block.
+    session = SESSION_FACTORY()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@contextmanager
+def batched_session():
+    """
+    Runs every SESSION call made by this thread inside one transaction: the modules' own commit() calls only flush,
+    the work is committed once at the end, or rolled back as a whole if anything raised.
+    """
+    session = SESSION()
+    session.batch_depth += 1
+    ok = False
+    try:
+        yield session
+        ok = True
+    finally:
+        session.batch_depth -= 1
+        if not session.batch_depth:
+            if ok:
+                session.commit()
+            else:
+                session.rollback()
+            session.close()
+
+
+def pool_stats():
+    pool = BASE.metadata.bind.pool
+    return "Database pool: {}, {}".format(pool.status(), POOL_STATS)
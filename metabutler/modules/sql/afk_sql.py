@@ -1,8 +1,10 @@
 import threading
+from collections import namedtuple
 
 from sqlalchemy import Column, UnicodeText, Boolean, Integer
 
 from metabutler.modules.sql import BASE, SESSION
+from metabutler.modules.sql.users_sql import Users, watch_usernames
 
 
 class AFK(BASE):
@@ -24,7 +26,12 @@ class AFK(BASE):
 AFK.__table__.create(checkfirst=True)
 INSERTION_LOCK = threading.RLock()
 
-AFK_USERS = {}
+# username and first_name come from the update that set the AFK, or from the users table after a restart
+# (first_name is None then until the first mention looks it up)
+AfkUser = namedtuple('AfkUser', 'reason username first_name')
+
+AFK_USERS = {}  # user_id -> AfkUser
+AFK_BY_USERNAME = {}  # lowercased username -> user_id
 
 
 def is_afk(user_id):
@@ -33,11 +40,27 @@ def is_afk(user_id):
 
 def check_afk_status(user_id):
     if user_id in AFK_USERS:
-        return True, AFK_USERS[user_id]
+        return True, AFK_USERS[user_id].reason
     return False, ""
 
 
-def set_afk(user_id, reason=""):
+def get_afk_user(user_id):
+    return AFK_USERS.get(user_id)
+
+
+def get_afk_by_username(username):
+    # user_id of the AFK user with this @username, None for everybody else; never touches the database
+    return AFK_BY_USERNAME.get(username.lstrip('@').lower())
+
+
+def set_afk_name(user_id, first_name):
+    with INSERTION_LOCK:
+        afk_user = AFK_USERS.get(user_id)
+        if afk_user:
+            AFK_USERS[user_id] = afk_user._replace(first_name=first_name)
+
+
+def set_afk(user_id, reason="", username=None, first_name=None):
     with INSERTION_LOCK:
         curr = SESSION.query(AFK).get(user_id)
         if not curr:
@@ -46,19 +69,21 @@ def set_afk(user_id, reason=""):
             curr.is_afk = True
             curr.reason = reason
 
-        AFK_USERS[user_id] = reason
+        __cache_afk(user_id, AfkUser(reason, username, first_name))
 
         SESSION.add(curr)
         SESSION.commit()
 
 
 def rm_afk(user_id):
+    if user_id not in AFK_USERS:
+        # runs for every group message, most senders are not AFK
+        return False
+
     with INSERTION_LOCK:
         curr = SESSION.query(AFK).get(user_id)
+        __uncache_afk(user_id)
         if curr:
-            if user_id in AFK_USERS:  # sanity check
-                del AFK_USERS[user_id]
-
             SESSION.delete(curr)
             SESSION.commit()
             return True
@@ -67,13 +92,39 @@ def rm_afk(user_id):
         return False
 
 
+def __cache_afk(user_id, afk_user):
+    __uncache_afk(user_id)
+    AFK_USERS[user_id] = afk_user
+    if afk_user.username:
+        AFK_BY_USERNAME[afk_user.username.lower()] = user_id
+
+
+def __uncache_afk(user_id):
+    afk_user = AFK_USERS.pop(user_id, None)
+    if afk_user and afk_user.username and AFK_BY_USERNAME.get(afk_user.username.lower()) == user_id:
+        del AFK_BY_USERNAME[afk_user.username.lower()]
+
+
+def __rename_afk_users(users):
+    # keeps AFK_BY_USERNAME in step when an AFK user changes their @username
+    with INSERTION_LOCK:
+        for user_id, username in users.items():
+            afk_user = AFK_USERS.get(user_id)
+            if afk_user and afk_user.username != username:
+                __cache_afk(user_id, afk_user._replace(username=username))
+
+
 def __load_afk_users():
-    global AFK_USERS
     try:
-        all_afk = SESSION.query(AFK).all()
-        AFK_USERS = {user.user_id: user.reason for user in all_afk if user.is_afk}
+        all_afk = SESSION.query(AFK, Users.username).outerjoin(Users, Users.user_id == AFK.user_id) \
+            .filter(AFK.is_afk == True).all()
+        AFK_USERS.clear()
+        AFK_BY_USERNAME.clear()
+        for user, username in all_afk:
+            __cache_afk(user.user_id, AfkUser(user.reason, username, None))
     finally:
         SESSION.close()
 
 
 __load_afk_users()
+watch_usernames(__rename_afk_users)
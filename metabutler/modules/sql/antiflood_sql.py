@@ -1,4 +1,7 @@
 import threading
+import time
+from array import array
+from collections import OrderedDict
 
 from sqlalchemy import String, Column, Integer, UnicodeText
 
@@ -6,7 +9,12 @@ from metabutler.modules.sql import SESSION, BASE
 
 DEF_COUNT = 0
 DEF_LIMIT = 0
-DEF_OBJ = (None, DEF_COUNT, DEF_LIMIT)
+DEF_WINDOW = 10  # seconds the flood limit counts messages over
+DEF_SETTING = (1, "0")
+
+MAX_TRACKED_USERS = 256  # recent senders remembered per chat
+IDLE_CHAT_TIMEOUT = 600  # chats without messages for this long lose their counters
+SWEEP_INTERVAL = 60
 
 class FloodControl(BASE):
     __tablename__ = "antiflood"
@@ -35,14 +43,84 @@ class FloodSettings(BASE):
     def __repr__(self):
         return "<{} will executing {} for flood.>".format(self.chat_id, self.flood_type)
 
+class FloodWindow(BASE):
+    __tablename__ = "antiflood_window"
+    chat_id = Column(String(14), primary_key=True)
+    seconds = Column(Integer, default=DEF_WINDOW)
+
+    def __init__(self, chat_id, seconds=DEF_WINDOW):
+        self.chat_id = str(chat_id)
+        self.seconds = seconds
+
+    def __repr__(self):
+        return "<{} counts flood over {} seconds>".format(self.chat_id, self.seconds)
+
 
 FloodControl.__table__.create(checkfirst=True)
 FloodSettings.__table__.create(checkfirst=True)
+FloodWindow.__table__.create(checkfirst=True)
 
 INSERTION_FLOOD_LOCK = threading.RLock()
 INSERTION_FLOOD_SETTINGS_LOCK = threading.RLock()
 
-CHAT_FLOOD = {}
+CHAT_FLOOD = {}  # chat_id -> message limit
+CHAT_FLOOD_WINDOW = {}  # chat_id -> seconds
+CHAT_FLOOD_SETTINGS = {}  # chat_id -> (flood_type, value)
+
+
+class FloodTracker(object):
+    """
+    Per (chat, user) sliding window. Every sender gets a ring buffer holding the times of their last `limit`
+    messages; a new message flooded when the oldest of those is still inside the window.
+    """
+
+    def __init__(self):
+        self.chats = {}  # chat_id -> OrderedDict(user_id -> [array of times, next slot]), least recent sender first
+        self.last_seen = {}
+        self.last_sweep = time.monotonic()
+        self.lock = threading.Lock()
+
+    def hit(self, chat_id, user_id, limit, window):
+        now = time.monotonic()
+        with self.lock:
+            users = self.chats.get(chat_id)
+            if users is None:
+                users = self.chats[chat_id] = OrderedDict()
+            self.last_seen[chat_id] = now
+
+            ring = users.get(user_id)
+            if ring is None or len(ring[0]) != limit:
+                ring = users[user_id] = [array('d', [float('-inf')] * limit), 0]
+                if len(users) > MAX_TRACKED_USERS:
+                    users.popitem(last=False)
+            else:
+                users.move_to_end(user_id)
+
+            times, slot = ring
+            flooded = now - times[slot] <= window
+            if flooded:
+                del users[user_id]
+            else:
+                times[slot] = now
+                ring[1] = (slot + 1) % limit
+
+            if now - self.last_sweep > SWEEP_INTERVAL:
+                self.sweep(now)
+            return flooded
+
+    def sweep(self, now):
+        self.last_sweep = now
+        for chat_id in [chat_id for chat_id, seen in self.last_seen.items() if now - seen > IDLE_CHAT_TIMEOUT]:
+            del self.last_seen[chat_id]
+            self.chats.pop(chat_id, None)
+
+    def forget_chat(self, chat_id):
+        with self.lock:
+            self.chats.pop(chat_id, None)
+            self.last_seen.pop(chat_id, None)
+
+
+FLOOD_TRACKER = FloodTracker()
 
 
 def set_flood(chat_id, amount):
@@ -54,35 +132,33 @@ def set_flood(chat_id, amount):
         flood.user_id = None
         flood.limit = amount
 
-        CHAT_FLOOD[str(chat_id)] = (None, DEF_COUNT, amount)
+        CHAT_FLOOD[str(chat_id)] = amount
+        FLOOD_TRACKER.forget_chat(str(chat_id))
 
         SESSION.add(flood)
         SESSION.commit()
 
 
 def update_flood(chat_id: str, user_id) -> bool:
-    if str(chat_id) in CHAT_FLOOD:
-        curr_user_id, count, limit = CHAT_FLOOD.get(str(chat_id), DEF_OBJ)
+    limit = CHAT_FLOOD.get(str(chat_id), DEF_LIMIT)
+    if not limit or user_id is None:  # no antiflood
+        return False
+    return FLOOD_TRACKER.hit(str(chat_id), user_id, limit, CHAT_FLOOD_WINDOW.get(str(chat_id), DEF_WINDOW))
 
-        if limit == 0:  # no antiflood
-            return False
 
-        if user_id != curr_user_id or user_id is None:  # other user
-            CHAT_FLOOD[str(chat_id)] = (user_id, DEF_COUNT, limit)
-            return False
+def get_flood_limit(chat_id):
+    return CHAT_FLOOD.get(str(chat_id), DEF_LIMIT)
 
-        count += 1
-        if count > limit:  # too many msgs, kick
-            CHAT_FLOOD[str(chat_id)] = (None, DEF_COUNT, limit)
-            return True
 
-        # default -> update
-        CHAT_FLOOD[str(chat_id)] = (user_id, count, limit)
-        return False
+def set_flood_window(chat_id, seconds):
+    with INSERTION_FLOOD_LOCK:
+        SESSION.merge(FloodWindow(str(chat_id), int(seconds)))
+        SESSION.commit()
+        CHAT_FLOOD_WINDOW[str(chat_id)] = int(seconds)
 
 
-def get_flood_limit(chat_id):
-    return CHAT_FLOOD.get(str(chat_id), DEF_OBJ)[2]
+def get_flood_window(chat_id):
+    return CHAT_FLOOD_WINDOW.get(str(chat_id), DEF_WINDOW)
 
 
 def set_flood_strength(chat_id, flood_type, value):
@@ -102,36 +178,57 @@ def set_flood_strength(chat_id, flood_type, value):
 
         SESSION.add(curr_setting)
         SESSION.commit()
+        CHAT_FLOOD_SETTINGS[str(chat_id)] = (int(flood_type), str(value))
 
 
 def get_flood_setting(chat_id):
-    try:
-        setting = SESSION.query(FloodSettings).get(str(chat_id))
-        if setting:
-            return setting.flood_type, setting.value
-        else:
-            return 1, "0"
-
-    finally:
-        SESSION.close()
+    return CHAT_FLOOD_SETTINGS.get(str(chat_id), DEF_SETTING)
 
 
 def migrate_chat(old_chat_id, new_chat_id):
     with INSERTION_FLOOD_LOCK:
         flood = SESSION.query(FloodControl).get(str(old_chat_id))
         if flood:
-            CHAT_FLOOD[str(new_chat_id)] = CHAT_FLOOD.get(str(old_chat_id), DEF_OBJ)
             flood.chat_id = str(new_chat_id)
-            SESSION.commit()
+        window = SESSION.query(FloodWindow).get(str(old_chat_id))
+        if window:
+            window.chat_id = str(new_chat_id)
+        setting = SESSION.query(FloodSettings).get(str(old_chat_id))
+        if setting:
+            setting.chat_id = str(new_chat_id)
+        SESSION.commit()
 
-        SESSION.close()
+        for cache in (CHAT_FLOOD, CHAT_FLOOD_WINDOW, CHAT_FLOOD_SETTINGS):
+            if str(old_chat_id) in cache:
+                cache[str(new_chat_id)] = cache.pop(str(old_chat_id))
+        FLOOD_TRACKER.forget_chat(str(old_chat_id))
+
+
+def reload_chat(chat_id):
+    # puts the chat's cached settings back in line with the database, e.g. after a rolled back import
+    with INSERTION_FLOOD_LOCK, INSERTION_FLOOD_SETTINGS_LOCK:
+        try:
+            flood = SESSION.query(FloodControl).get(str(chat_id))
+            window = SESSION.query(FloodWindow).get(str(chat_id))
+            setting = SESSION.query(FloodSettings).get(str(chat_id))
+            for cache, row, value in ((CHAT_FLOOD, flood, flood and flood.limit),
+                                      (CHAT_FLOOD_WINDOW, window, window and window.seconds),
+                                      (CHAT_FLOOD_SETTINGS, setting, setting and (setting.flood_type, setting.value))):
+                if row:
+                    cache[str(chat_id)] = value
+                else:
+                    cache.pop(str(chat_id), None)
+            FLOOD_TRACKER.forget_chat(str(chat_id))
+        finally:
+            SESSION.close()
 
 
 def __load_flood_settings():
-    global CHAT_FLOOD
     try:
-        all_chats = SESSION.query(FloodControl).all()
-        CHAT_FLOOD = {chat.chat_id: (None, DEF_COUNT, chat.limit) for chat in all_chats}
+        CHAT_FLOOD.update({chat.chat_id: chat.limit for chat in SESSION.query(FloodControl).all()})
+        CHAT_FLOOD_WINDOW.update({chat.chat_id: chat.seconds for chat in SESSION.query(FloodWindow).all()})
+        CHAT_FLOOD_SETTINGS.update({chat.chat_id: (chat.flood_type, chat.value)
+                                    for chat in SESSION.query(FloodSettings).all()})
     finally:
         SESSION.close()
 
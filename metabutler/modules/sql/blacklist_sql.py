@@ -2,6 +2,7 @@ import threading
 
 from sqlalchemy import func, distinct, Column, String, UnicodeText, Integer
 
+from metabutler.modules.helper_funcs.trigger_matcher import TriggerMatcherCache
 from metabutler.modules.sql import SESSION, BASE
 
 
@@ -45,6 +46,7 @@ BLACKLIST_SETTINGS_INSERTION_LOCK = threading.RLock()
 
 CHAT_BLACKLISTS = {}
 CHAT_SETTINGS_BLACKLISTS = {}
+CHAT_BLACKLIST_MATCHERS = TriggerMatcherCache(lambda chat_id: get_chat_blacklist(chat_id))
 
 
 def add_to_blacklist(chat_id, trigger):
@@ -58,6 +60,7 @@ def add_to_blacklist(chat_id, trigger):
             CHAT_BLACKLISTS[str(chat_id)] = {trigger}
         else:
             CHAT_BLACKLISTS.get(str(chat_id), set()).add(trigger)
+        CHAT_BLACKLIST_MATCHERS.invalidate(chat_id)
 
 
 def rm_from_blacklist(chat_id, trigger):
@@ -66,6 +69,7 @@ def rm_from_blacklist(chat_id, trigger):
         if blacklist_filt:
             if trigger in CHAT_BLACKLISTS.get(str(chat_id), set()):  # sanity check
                 CHAT_BLACKLISTS.get(str(chat_id), set()).remove(trigger)
+                CHAT_BLACKLIST_MATCHERS.invalidate(chat_id)
 
             SESSION.delete(blacklist_filt)
             SESSION.commit()
@@ -79,6 +83,10 @@ def get_chat_blacklist(chat_id):
     return CHAT_BLACKLISTS.get(str(chat_id), set())
 
 
+def match_blacklist(chat_id, text):
+    return CHAT_BLACKLIST_MATCHERS.search(chat_id, text)
+
+
 def num_blacklist_filters():
     try:
         return SESSION.query(BlackListFilters).count()
@@ -134,6 +142,25 @@ def get_blacklist_setting(chat_id):
     finally:
         SESSION.close()
 
+def reload_chat(chat_id):
+    # puts the chat's cached triggers and settings back in line with the database, e.g. after a rolled back import
+    with BLACKLIST_FILTER_INSERTION_LOCK, BLACKLIST_SETTINGS_INSERTION_LOCK:
+        try:
+            triggers = {x.trigger for x in SESSION.query(BlackListFilters)
+                        .filter(BlackListFilters.chat_id == str(chat_id)).all()}
+            setting = SESSION.query(BlacklistSettings).get(str(chat_id))
+        finally:
+            SESSION.close()
+        if triggers:
+            CHAT_BLACKLISTS[str(chat_id)] = triggers
+        else:
+            CHAT_BLACKLISTS.pop(str(chat_id), None)
+        if setting:
+            CHAT_SETTINGS_BLACKLISTS[str(chat_id)] = {'blacklist_type': setting.blacklist_type, 'value': setting.value}
+        else:
+            CHAT_SETTINGS_BLACKLISTS.pop(str(chat_id), None)
+        CHAT_BLACKLIST_MATCHERS.invalidate(chat_id)
+
 def __load_chat_blacklists():
     global CHAT_BLACKLISTS
     try:
@@ -167,6 +194,10 @@ def migrate_chat(old_chat_id, new_chat_id):
         for filt in chat_filters:
             filt.chat_id = str(new_chat_id)
         SESSION.commit()
+        if str(old_chat_id) in CHAT_BLACKLISTS:
+            CHAT_BLACKLISTS[str(new_chat_id)] = CHAT_BLACKLISTS.pop(str(old_chat_id))
+        CHAT_BLACKLIST_MATCHERS.invalidate(old_chat_id)
+        CHAT_BLACKLIST_MATCHERS.invalidate(new_chat_id)
 
 
 __load_chat_blacklists()
@@ -135,6 +135,25 @@ def get_blacklist_setting(chat_id):
         SESSION.close()
 
 
+def reload_chat(chat_id):
+    # puts the chat's cached stickers and settings back in line with the database, e.g. after a rolled back import
+    with STICKERS_FILTER_INSERTION_LOCK, STICKSET_FILTER_INSERTION_LOCK:
+        try:
+            triggers = {x.trigger for x in SESSION.query(StickersFilters)
+                        .filter(StickersFilters.chat_id == str(chat_id)).all()}
+            setting = SESSION.query(StickerSettings).get(str(chat_id))
+        finally:
+            SESSION.close()
+        if triggers:
+            CHAT_STICKERS[str(chat_id)] = triggers
+        else:
+            CHAT_STICKERS.pop(str(chat_id), None)
+        if setting:
+            CHAT_BLSTICK_BLACKLISTS[str(chat_id)] = {'blacklist_type': setting.blacklist_type, 'value': setting.value}
+        else:
+            CHAT_BLSTICK_BLACKLISTS.pop(str(chat_id), None)
+
+
 def __load_CHAT_STICKERS():
     global CHAT_STICKERS
     try:
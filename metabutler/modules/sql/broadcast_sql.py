@@ -0,0 +1,96 @@
+import threading
+
+from sqlalchemy import Column, String, UnicodeText, Integer, Boolean
+
+from metabutler.modules.sql import SESSION, BASE
+
+
+class Broadcast(BASE):
+    __tablename__ = "broadcasts"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(8), nullable=False)  # 'users' for every chat, 'fed' for the chats of one federation
+    fed_id = Column(UnicodeText)
+    text = Column(UnicodeText, nullable=False)
+    parse_mode = Column(String(10))
+    report_chat = Column(String(14))
+    cursor = Column(String(14), default="")  # last chat id the message was sent to, chats are walked in id order
+    total = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    removed = Column(Integer, default=0)
+    finished = Column(Boolean, default=False)
+
+    def __init__(self, kind, fed_id, text, parse_mode, report_chat, total):
+        self.kind = kind
+        self.fed_id = fed_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.report_chat = str(report_chat) if report_chat else None
+        self.cursor = ""
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.removed = 0
+        self.finished = False
+
+    def __repr__(self):
+        return "<Broadcast {} to {} ({}/{})>".format(self.id, self.kind, self.sent, self.total)
+
+
+Broadcast.__table__.create(checkfirst=True)
+
+BROADCAST_LOCK = threading.RLock()
+
+# id -> dict of every unfinished broadcast, the engine only reads this
+RUNNING_BROADCASTS = {}
+
+
+def __as_dict(bcast):
+    return {'id': bcast.id, 'kind': bcast.kind, 'fed_id': bcast.fed_id, 'text': bcast.text,
+            'parse_mode': bcast.parse_mode, 'report_chat': bcast.report_chat, 'cursor': bcast.cursor or "",
+            'total': bcast.total, 'sent': bcast.sent, 'failed': bcast.failed, 'removed': bcast.removed}
+
+
+def new_broadcast(kind, fed_id, text, parse_mode, report_chat, total):
+    with BROADCAST_LOCK:
+        bcast = Broadcast(kind, fed_id, text, parse_mode, report_chat, total)
+        SESSION.add(bcast)
+        SESSION.commit()
+        RUNNING_BROADCASTS[bcast.id] = __as_dict(bcast)
+        SESSION.close()
+        return RUNNING_BROADCASTS[bcast.id]
+
+
+def get_running_broadcasts():
+    return list(RUNNING_BROADCASTS.values())
+
+
+def save_progress(bcast_id, cursor, sent, failed, removed, finished=False):
+    with BROADCAST_LOCK:
+        bcast = SESSION.query(Broadcast).get(bcast_id)
+        if not bcast:
+            SESSION.close()
+            RUNNING_BROADCASTS.pop(bcast_id, None)
+            return
+        bcast.cursor = cursor
+        bcast.sent = sent
+        bcast.failed = failed
+        bcast.removed = removed
+        bcast.finished = finished
+        SESSION.commit()
+
+        if finished:
+            RUNNING_BROADCASTS.pop(bcast_id, None)
+        else:
+            RUNNING_BROADCASTS[bcast_id].update(cursor=cursor, sent=sent, failed=failed, removed=removed)
+
+
+def __load_running_broadcasts():
+    try:
+        for bcast in SESSION.query(Broadcast).filter(Broadcast.finished == False).all():
+            RUNNING_BROADCASTS[bcast.id] = __as_dict(bcast)
+    finally:
+        SESSION.close()
+
+
+__load_running_broadcasts()
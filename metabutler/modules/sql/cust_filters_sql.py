@@ -3,6 +3,7 @@ import threading
 from sqlalchemy import Column, String, UnicodeText, Boolean, Integer, distinct, func
 
 from metabutler.modules.helper_funcs.msg_types import Types
+from metabutler.modules.helper_funcs.trigger_matcher import TriggerMatcherCache
 from metabutler.modules.sql import BASE, SESSION
 
 
@@ -104,6 +105,7 @@ Buttons.__table__.create(checkfirst=True)
 CUST_FILT_LOCK = threading.RLock()
 BUTTON_LOCK = threading.RLock()
 CHAT_FILTERS = {}
+CHAT_FILTER_MATCHERS = TriggerMatcherCache(lambda chat_id: get_chat_triggers(chat_id))
 
 
 def get_all_filters():
@@ -136,6 +138,7 @@ def add_filter(chat_id, keyword, reply, is_sticker=False, is_document=False, is_
 		if keyword not in CHAT_FILTERS.get(str(chat_id), []):
 			CHAT_FILTERS[str(chat_id)] = sorted(CHAT_FILTERS.get(str(chat_id), []) + [keyword],
 												key=lambda x: (-len(x), x))
+			CHAT_FILTER_MATCHERS.invalidate(chat_id)
 
 		SESSION.add(filt)
 		SESSION.commit()
@@ -165,6 +168,7 @@ def new_add_filter(chat_id, keyword, reply_text, file_type, file_id, buttons):
 		if keyword not in CHAT_FILTERS.get(str(chat_id), []):
 			CHAT_FILTERS[str(chat_id)] = sorted(CHAT_FILTERS.get(str(chat_id), []) + [keyword],
 												key=lambda x: (-len(x), x))
+			CHAT_FILTER_MATCHERS.invalidate(chat_id)
 
 		SESSION.add(filt)
 		SESSION.commit()
@@ -180,6 +184,7 @@ def remove_filter(chat_id, keyword):
 		if filt:
 			if keyword in CHAT_FILTERS.get(str(chat_id), []):  # Sanity check
 				CHAT_FILTERS.get(str(chat_id), []).remove(keyword)
+				CHAT_FILTER_MATCHERS.invalidate(chat_id)
 
 			with BUTTON_LOCK:
 				prev_buttons = SESSION.query(Buttons).filter(Buttons.chat_id == str(chat_id),
@@ -199,6 +204,10 @@ def get_chat_triggers(chat_id):
 	return CHAT_FILTERS.get(str(chat_id), set())
 
 
+def match_filter(chat_id, text):
+	return CHAT_FILTER_MATCHERS.search(chat_id, text)
+
+
 def get_chat_filters(chat_id):
 	try:
 		return SESSION.query(CustomFilters).filter(CustomFilters.chat_id == str(chat_id)).order_by(
@@ -243,6 +252,20 @@ def num_chats():
 		SESSION.close()
 
 
+def reload_chat(chat_id):
+	# puts the chat's cached filters back in line with the database, e.g. after a rolled back import
+	with CUST_FILT_LOCK:
+		try:
+			keywords = {x.keyword for x in SESSION.query(CustomFilters).filter(CustomFilters.chat_id == str(chat_id)).all()}
+		finally:
+			SESSION.close()
+		if keywords:
+			CHAT_FILTERS[str(chat_id)] = sorted(keywords, key=lambda i: (-len(i), i))
+		else:
+			CHAT_FILTERS.pop(str(chat_id), None)
+		CHAT_FILTER_MATCHERS.invalidate(chat_id)
+
+
 def __load_chat_filters():
 	global CHAT_FILTERS
 	try:
@@ -302,8 +325,10 @@ def migrate_chat(old_chat_id, new_chat_id):
 		for filt in chat_filters:
 			filt.chat_id = str(new_chat_id)
 		SESSION.commit()
-		CHAT_FILTERS[str(new_chat_id)] = CHAT_FILTERS[str(old_chat_id)]
-		del CHAT_FILTERS[str(old_chat_id)]
+		if str(old_chat_id) in CHAT_FILTERS:
+			CHAT_FILTERS[str(new_chat_id)] = CHAT_FILTERS.pop(str(old_chat_id))
+		CHAT_FILTER_MATCHERS.invalidate(old_chat_id)
+		CHAT_FILTER_MATCHERS.invalidate(new_chat_id)
 
 		with BUTTON_LOCK:
 			chat_buttons = SESSION.query(Buttons).filter(Buttons.chat_id == str(old_chat_id)).all()
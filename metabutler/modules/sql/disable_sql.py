@@ -138,6 +138,23 @@ def disableable_cache(cmd):
 def get_disableable():
     return DISABLEABLE
 
+def reload_chat(chat_id):
+    # puts the chat's cached disabled commands back in line with the database, e.g. after a rolled back import
+    with DISABLE_INSERTION_LOCK, DISABLEDEL_INSERTION_LOCK:
+        try:
+            commands = {x.command for x in SESSION.query(Disable).filter(Disable.chat_id == str(chat_id)).all()}
+            disabledel = SESSION.query(DisableDelete).get(str(chat_id))
+        finally:
+            SESSION.close()
+        if commands:
+            DISABLED[str(chat_id)] = commands
+        else:
+            DISABLED.pop(str(chat_id), None)
+        if str(chat_id) in DISABLEDEL:
+            DISABLEDEL.remove(str(chat_id))
+        if disabledel and disabledel.is_enable:
+            DISABLEDEL.append(str(chat_id))
+
 def __load_disabled_commands():
     global DISABLED
     try:
@@ -0,0 +1,168 @@
+import threading
+import time
+
+from sqlalchemy import Column, String, UnicodeText, Integer, BigInteger
+
+from metabutler.modules.sql import SESSION, BASE
+
+
+class FbanJob(BASE):
+    __tablename__ = "fban_jobs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    batch_id = Column(String(36), nullable=False, index=True)
+    fed_id = Column(UnicodeText, nullable=False)  # federation the chat belongs to, differs from the batch for subscribers
+    chat_id = Column(String(14), nullable=False)
+    attempts = Column(Integer, default=0)
+    not_before = Column(BigInteger, default=0)
+
+    def __init__(self, batch_id, fed_id, chat_id):
+        self.batch_id = batch_id
+        self.fed_id = fed_id
+        self.chat_id = str(chat_id)
+        self.attempts = 0
+        self.not_before = 0
+
+    def __repr__(self):
+        return "<Fban job {} of batch {} in {}>".format(self.id, self.batch_id, self.chat_id)
+
+
+class FbanBatch(BASE):
+    __tablename__ = "fban_batches"
+    batch_id = Column(String(36), primary_key=True)
+    fed_id = Column(UnicodeText, nullable=False)
+    user_id = Column(String(14), nullable=False)
+    action = Column(String(8), nullable=False)  # 'ban' or 'unban'
+    report_chat = Column(String(14))
+    total = Column(Integer, default=0)
+    done = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+
+    def __init__(self, batch_id, fed_id, user_id, action, report_chat, total):
+        self.batch_id = batch_id
+        self.fed_id = fed_id
+        self.user_id = str(user_id)
+        self.action = action
+        self.report_chat = str(report_chat) if report_chat else None
+        self.total = total
+        self.done = 0
+        self.failed = 0
+
+    def __repr__(self):
+        return "<Fban batch {} ({} {})>".format(self.batch_id, self.action, self.user_id)
+
+
+FbanJob.__table__.create(checkfirst=True)
+FbanBatch.__table__.create(checkfirst=True)
+
+FBAN_QUEUE_LOCK = threading.RLock()
+
+PENDING_JOBS = 0
+
+
+def add_batch(batch_id, fed_id, user_id, action, report_chat, chats):
+    # chats: iterable of (fed_id, chat_id); returns the number of queued jobs. Whatever is still queued for the same
+    # user in the same federation is dropped first, so an unban can't be overtaken by an older ban, or the other way
+    global PENDING_JOBS
+    with FBAN_QUEUE_LOCK:
+        __drop_user_batches(str(fed_id), str(user_id))
+        jobs = [FbanJob(batch_id, str(chat_fed), chat_id) for chat_fed, chat_id in chats]
+        if not jobs:
+            return 0
+        SESSION.add(FbanBatch(batch_id, str(fed_id), user_id, action, report_chat, len(jobs)))
+        SESSION.add_all(jobs)
+        SESSION.commit()
+        PENDING_JOBS += len(jobs)
+        return len(jobs)
+
+
+def has_pending():
+    return PENDING_JOBS > 0
+
+
+def get_due_jobs(limit):
+    # due jobs together with their batch, oldest first
+    try:
+        return SESSION.query(FbanJob, FbanBatch).join(FbanBatch, FbanJob.batch_id == FbanBatch.batch_id) \
+            .filter(FbanJob.not_before <= int(time.time())).order_by(FbanJob.id).limit(limit).all()
+    finally:
+        SESSION.close()
+
+
+def finish_job(job_id, ok):
+    # returns the batch as a dict once its last job finished, None otherwise
+    global PENDING_JOBS
+    with FBAN_QUEUE_LOCK:
+        job = SESSION.query(FbanJob).get(job_id)
+        if not job:
+            SESSION.close()
+            return None
+        batch = SESSION.query(FbanBatch).get(job.batch_id)
+        SESSION.delete(job)
+        PENDING_JOBS = max(PENDING_JOBS - 1, 0)
+
+        finished = None
+        if batch:
+            if ok:
+                batch.done += 1
+            else:
+                batch.failed += 1
+            if batch.done + batch.failed >= batch.total:
+                finished = {'fed_id': batch.fed_id, 'user_id': batch.user_id, 'action': batch.action,
+                            'report_chat': batch.report_chat, 'total': batch.total, 'done': batch.done,
+                            'failed': batch.failed}
+                SESSION.delete(batch)
+        SESSION.commit()
+        return finished
+
+
+def retry_job(job_id, delay):
+    with FBAN_QUEUE_LOCK:
+        job = SESSION.query(FbanJob).get(job_id)
+        if not job:
+            SESSION.close()
+            return 0
+        job.attempts += 1
+        job.not_before = int(time.time() + delay)
+        attempts = job.attempts
+        SESSION.commit()
+        return attempts
+
+
+def cancel_batch(batch_id):
+    # drop the remaining jobs of a batch (the user id turned out to be invalid), counting them as failed
+    global PENDING_JOBS
+    with FBAN_QUEUE_LOCK:
+        dropped = SESSION.query(FbanJob).filter(FbanJob.batch_id == batch_id).delete(synchronize_session=False)
+        PENDING_JOBS = max(PENDING_JOBS - dropped, 0)
+        batch = SESSION.query(FbanBatch).get(batch_id)
+        finished = None
+        if batch:
+            finished = {'fed_id': batch.fed_id, 'user_id': batch.user_id, 'action': batch.action,
+                        'report_chat': batch.report_chat, 'total': batch.total, 'done': batch.done,
+                        'failed': batch.total - batch.done}
+            SESSION.delete(batch)
+        SESSION.commit()
+        return finished
+
+
+def __drop_user_batches(fed_id, user_id):
+    # callers hold FBAN_QUEUE_LOCK and commit
+    global PENDING_JOBS
+    batch_ids = [x.batch_id for x in SESSION.query(FbanBatch.batch_id)
+                 .filter(FbanBatch.fed_id == fed_id, FbanBatch.user_id == user_id).all()]
+    if not batch_ids:
+        return
+    dropped = SESSION.query(FbanJob).filter(FbanJob.batch_id.in_(batch_ids)).delete(synchronize_session=False)
+    SESSION.query(FbanBatch).filter(FbanBatch.batch_id.in_(batch_ids)).delete(synchronize_session=False)
+    PENDING_JOBS = max(PENDING_JOBS - dropped, 0)
+
+
+def __load_pending_jobs():
+    global PENDING_JOBS
+    try:
+        PENDING_JOBS = SESSION.query(FbanJob).count()
+    finally:
+        SESSION.close()
+
+
+__load_pending_jobs()
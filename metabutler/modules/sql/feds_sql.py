@@ -1,10 +1,12 @@
+import ast
 import threading
 
 from sqlalchemy import Column, String, UnicodeText, distinct, Integer, Boolean
+from sqlalchemy.dialects.postgresql import insert
 from telegram.error import BadRequest, TelegramError, Unauthorized
 
-from metabutler import dispatcher
-from metabutler.modules.sql import SESSION, BASE
+from metabutler import dispatcher, LOGGER
+from metabutler.modules.sql import SESSION, BASE, session_scope, read_session
 
 
 class Federations(BASE):
@@ -14,7 +16,7 @@ class Federations(BASE):
     fed_id = Column(UnicodeText, primary_key=True)
     fed_rules = Column(UnicodeText)
     fed_log = Column(UnicodeText)
-    fed_users = Column(UnicodeText)
+    fed_users = Column(UnicodeText)  # legacy repr of the admin list, moved to fed_admins on load
 
     def __init__(self, owner_id, fed_name, fed_id, fed_rules, fed_log, fed_users):
         self.owner_id = owner_id
@@ -57,6 +59,19 @@ class BansF(BASE):
         self.time = time
 
 
+class FedAdmins(BASE):
+    __tablename__ = "fed_admins"
+    fed_id = Column(UnicodeText, primary_key=True)
+    user_id = Column(String(14), primary_key=True)
+
+    def __init__(self, fed_id, user_id):
+        self.fed_id = str(fed_id)
+        self.user_id = str(user_id)
+
+    def __repr__(self):
+        return "<Fed {} admin {}>".format(self.fed_id, self.user_id)
+
+
 class FedsUserSettings(BASE):
     __tablename__ = "feds_settings"
     user_id = Column(Integer, primary_key=True)
@@ -91,6 +106,7 @@ class FedSubs(BASE):
 Federations.__table__.create(checkfirst=True)
 ChatF.__table__.create(checkfirst=True)
 BansF.__table__.create(checkfirst=True)
+FedAdmins.__table__.create(checkfirst=True)
 FedsUserSettings.__table__.create(checkfirst=True)
 FedSubs.__table__.create(checkfirst=True)
 
@@ -103,11 +119,17 @@ FEDERATION_BYNAME = {}
 FEDERATION_BYOWNER = {}
 FEDERATION_BYFEDID = {}
 
+FED_ADMINS = {}  # fed_id -> set of admin user ids (the owner is not in it)
+USER_ADMIN_FEDS = {}  # user_id -> set of fed_ids the user is admin of
+USER_OWNER_FEDS = {}  # user_id -> set of fed_ids the user owns
+
 FEDERATION_CHATS = {}
 FEDERATION_CHATS_BYID = {}
 
 FEDERATION_BANNED_FULL = {}
 FEDERATION_BANNED_USERID = {}
+USER_FBANS = {}  # user_id -> {fed_id: ban}, the same ban dicts as in FEDERATION_BANNED_FULL
+FBAN_COUNT = 0  # bans over all federations
 
 FEDERATION_NOTIFICATION = {}
 FEDS_SUBSCRIBER = {}
@@ -140,72 +162,61 @@ def get_fed_name(chat_id):
 def get_user_fban(fed_id, user_id):
     if not FEDERATION_BANNED_FULL.get(fed_id):
         return False, False, False
-    user_info = FEDERATION_BANNED_FULL[fed_id].get(user_id)
+    user_info = FEDERATION_BANNED_FULL[fed_id].get(str(user_id))
     if not user_info:
         return None, None, None
     return user_info['first_name'], user_info['reason'], user_info['time']
 
 
 def get_user_admin_fed_name(user_id):
-    user_feds = []
-    for f in FEDERATION_BYFEDID:
-        if int(user_id) in eval(eval(FEDERATION_BYFEDID[f]['fusers'])['members']):
-            user_feds.append(FEDERATION_BYFEDID[f]['fname'])
-    return user_feds
+    return [FEDERATION_BYFEDID[f]['fname'] for f in USER_ADMIN_FEDS.get(int(user_id), ())]
 
 
 def get_user_owner_fed_name(user_id):
-    user_feds = []
-    for f in FEDERATION_BYFEDID:
-        if int(user_id) == int(eval(FEDERATION_BYFEDID[f]['fusers'])['owner']):
-            user_feds.append(FEDERATION_BYFEDID[f]['fname'])
-    return user_feds
+    return [FEDERATION_BYFEDID[f]['fname'] for f in USER_OWNER_FEDS.get(int(user_id), ())]
 
 
 def get_user_admin_fed_full(user_id):
-    user_feds = []
-    for f in FEDERATION_BYFEDID:
-        if int(user_id) in eval(eval(FEDERATION_BYFEDID[f]['fusers'])['members']):
-            user_feds.append({"fed_id": f, "fed": FEDERATION_BYFEDID[f]})
-    return user_feds
+    return [{"fed_id": f, "fed": FEDERATION_BYFEDID[f]} for f in USER_ADMIN_FEDS.get(int(user_id), ())]
 
 
 def get_user_owner_fed_full(user_id):
-    user_feds = []
-    for f in FEDERATION_BYFEDID:
-        if int(user_id) == int(eval(FEDERATION_BYFEDID[f]['fusers'])['owner']):
-            user_feds.append({"fed_id": f, "fed": FEDERATION_BYFEDID[f]})
-    return user_feds
+    return [{"fed_id": f, "fed": FEDERATION_BYFEDID[f]} for f in USER_OWNER_FEDS.get(int(user_id), ())]
+
+
+def is_user_fed_admin(fed_id, user_id):
+    # admins and the owner
+    return int(user_id) in FED_ADMINS.get(str(fed_id), ()) or is_user_fed_owner(fed_id, user_id)
+
+
+def is_user_fed_owner(fed_id, user_id):
+    return str(fed_id) in USER_OWNER_FEDS.get(int(user_id), ())
 
 
 def get_user_fbanlist(user_id):
-    banlist = FEDERATION_BANNED_FULL
     user_name = ""
     fedname = []
-    for x in banlist:
-        if banlist[x].get(user_id):
-            if user_name == "":
-                user_name = banlist[x][user_id].get('first_name')
-            fedname.append([x, banlist[x][user_id].get('reason')])
+    for fed_id, ban in list(USER_FBANS.get(int(user_id), {}).items()):
+        if user_name == "":
+            user_name = ban.get('first_name')
+        fedname.append([fed_id, ban.get('reason')])
     return user_name, fedname
 
 
 def new_fed(owner_id, fed_name, fed_id):
     with FEDS_LOCK:
         global FEDERATION_BYOWNER, FEDERATION_BYFEDID, FEDERATION_BYNAME
-        fed = Federations(str(owner_id), fed_name, str(fed_id), 'Rules is not set in this federation.', None,
-                          str({'owner': str(owner_id), 'members': '[]'}))
+        fed = Federations(str(owner_id), fed_name, str(fed_id), 'Rules is not set in this federation.', None, None)
         SESSION.add(fed)
         SESSION.commit()
         FEDERATION_BYOWNER[str(owner_id)] = (
-        {'fid': str(fed_id), 'fname': fed_name, 'frules': 'Rules is not set in this federation.', 'flog': None,
-         'fusers': str({'owner': str(owner_id), 'members': '[]'})})
+        {'fid': str(fed_id), 'fname': fed_name, 'frules': 'Rules is not set in this federation.', 'flog': None})
         FEDERATION_BYFEDID[str(fed_id)] = (
-        {'owner': str(owner_id), 'fname': fed_name, 'frules': 'Rules is not set in this federation.', 'flog': None,
-         'fusers': str({'owner': str(owner_id), 'members': '[]'})})
+        {'owner': str(owner_id), 'fname': fed_name, 'frules': 'Rules is not set in this federation.', 'flog': None})
         FEDERATION_BYNAME[fed_name] = (
-        {'fid': str(fed_id), 'owner': str(owner_id), 'frules': 'Rules is not set in this federation.', 'flog': None,
-         'fusers': str({'owner': str(owner_id), 'members': '[]'})})
+        {'fid': str(fed_id), 'owner': str(owner_id), 'frules': 'Rules is not set in this federation.', 'flog': None})
+        FED_ADMINS[str(fed_id)] = set()
+        USER_OWNER_FEDS.setdefault(int(owner_id), set()).add(str(fed_id))
         return fed
 
 
@@ -223,6 +234,10 @@ def del_fed(fed_id):
         FEDERATION_BYOWNER.pop(owner_id)
         FEDERATION_BYFEDID.pop(fed_id)
         FEDERATION_BYNAME.pop(fed_name)
+        USER_OWNER_FEDS.get(int(owner_id), set()).discard(fed_id)
+        for user_id in FED_ADMINS.pop(fed_id, ()):
+            USER_ADMIN_FEDS.get(user_id, set()).discard(fed_id)
+        SESSION.query(FedAdmins).filter(FedAdmins.fed_id == fed_id).delete()
         if FEDERATION_CHATS_BYID.get(fed_id):
             for x in FEDERATION_CHATS_BYID[fed_id]:
                 delchats = SESSION.query(ChatF).get(str(x))
@@ -232,17 +247,12 @@ def del_fed(fed_id):
                 FEDERATION_CHATS.pop(x)
             FEDERATION_CHATS_BYID.pop(fed_id)
         # Delete fedban users
-        getall = FEDERATION_BANNED_USERID.get(fed_id)
-        if getall:
-            for x in getall:
-                banlist = SESSION.query(BansF).get((fed_id, str(x)))
-                if banlist:
-                    SESSION.delete(banlist)
-                    SESSION.commit()
-        if FEDERATION_BANNED_USERID.get(fed_id):
-            FEDERATION_BANNED_USERID.pop(fed_id)
-        if FEDERATION_BANNED_FULL.get(fed_id):
-            FEDERATION_BANNED_FULL.pop(fed_id)
+        SESSION.query(BansF).filter(BansF.fed_id == fed_id).delete()
+        SESSION.commit()
+        for user_id in list(FEDERATION_BANNED_USERID.get(fed_id, ())):
+            __uncache_fban(fed_id, user_id)
+        FEDERATION_BANNED_USERID.pop(fed_id, None)
+        FEDERATION_BANNED_FULL.pop(fed_id, None)
         # Delete fedsubs
         getall = MYFEDS_SUBSCRIBER.get(fed_id)
         if getall:
@@ -285,77 +295,31 @@ def search_fed_by_name(fed_name):
 
 
 def search_user_in_fed(fed_id, user_id):
-    getfed = FEDERATION_BYFEDID.get(fed_id)
-    if getfed == None:
-        return False
-    getfed = eval(getfed['fusers'])['members']
-    if user_id in eval(getfed):
-        return True
-    else:
-        return False
+    return int(user_id) in FED_ADMINS.get(str(fed_id), ())
 
 
 def user_demote_fed(fed_id, user_id):
     with FEDS_LOCK:
-        global FEDERATION_BYOWNER, FEDERATION_BYFEDID, FEDERATION_BYNAME
-        # Variables
-        getfed = FEDERATION_BYFEDID.get(str(fed_id))
-        owner_id = getfed['owner']
-        fed_name = getfed['fname']
-        fed_rules = getfed['frules']
-        fed_log = getfed['flog']
-        # Temp set
-        try:
-            members = eval(eval(getfed['fusers'])['members'])
-        except ValueError:
+        admins = FED_ADMINS.get(str(fed_id))
+        if not admins or int(user_id) not in admins:
             return False
-        members.remove(user_id)
-        # Set user
-        FEDERATION_BYOWNER[str(owner_id)]['fusers'] = str({'owner': str(owner_id), 'members': str(members)})
-        FEDERATION_BYFEDID[str(fed_id)]['fusers'] = str({'owner': str(owner_id), 'members': str(members)})
-        FEDERATION_BYNAME[fed_name]['fusers'] = str({'owner': str(owner_id), 'members': str(members)})
-        # Set on database
-        fed = Federations(str(owner_id), fed_name, str(fed_id), fed_rules, fed_log,
-                          str({'owner': str(owner_id), 'members': str(members)}))
-        SESSION.merge(fed)
+        curr = SESSION.query(FedAdmins).get((str(fed_id), str(user_id)))
+        if curr:
+            SESSION.delete(curr)
         SESSION.commit()
+        admins.discard(int(user_id))
+        USER_ADMIN_FEDS.get(int(user_id), set()).discard(str(fed_id))
         return True
 
-        curr = SESSION.query(UserF).all()
-        result = False
-        for r in curr:
-            if int(r.user_id) == int(user_id):
-                if r.fed_id == fed_id:
-                    SESSION.delete(r)
-                    SESSION.commit()
-                    result = True
-
-        SESSION.close()
-        return result
-
 
 def user_join_fed(fed_id, user_id):
     with FEDS_LOCK:
-        global FEDERATION_BYOWNER, FEDERATION_BYFEDID, FEDERATION_BYNAME
-        # Variables
-        getfed = FEDERATION_BYFEDID.get(str(fed_id))
-        owner_id = getfed['owner']
-        fed_name = getfed['fname']
-        fed_rules = getfed['frules']
-        fed_log = getfed['flog']
-        # Temp set
-        members = eval(eval(getfed['fusers'])['members'])
-        members.append(user_id)
-        # Set user
-        FEDERATION_BYOWNER[str(owner_id)]['fusers'] = str({'owner': str(owner_id), 'members': str(members)})
-        FEDERATION_BYFEDID[str(fed_id)]['fusers'] = str({'owner': str(owner_id), 'members': str(members)})
-        FEDERATION_BYNAME[fed_name]['fusers'] = str({'owner': str(owner_id), 'members': str(members)})
-        # Set on database
-        fed = Federations(str(owner_id), fed_name, str(fed_id), fed_rules, fed_log,
-                          str({'owner': str(owner_id), 'members': str(members)}))
-        SESSION.merge(fed)
+        if str(fed_id) not in FEDERATION_BYFEDID:
+            return False
+        SESSION.merge(FedAdmins(fed_id, user_id))
         SESSION.commit()
-        __load_all_feds_chats()
+        FED_ADMINS.setdefault(str(fed_id), set()).add(int(user_id))
+        USER_ADMIN_FEDS.setdefault(int(user_id), set()).add(str(fed_id))
         return True
 
 
@@ -389,40 +353,30 @@ def all_fed_chats(fed_id):
 
 
 def all_fed_users(fed_id):
-    with FEDS_LOCK:
-        getfed = FEDERATION_BYFEDID.get(str(fed_id))
-        if getfed == None:
-            return False
-        fed_owner = eval(eval(getfed['fusers'])['owner'])
-        fed_admins = eval(eval(getfed['fusers'])['members'])
-        fed_admins.append(fed_owner)
-        return fed_admins
+    # admins and owner, as a new list the caller may change
+    getfed = FEDERATION_BYFEDID.get(str(fed_id))
+    if getfed == None:
+        return False
+    return list(FED_ADMINS.get(str(fed_id), ())) + [int(getfed['owner'])]
 
 
 def all_fed_members(fed_id):
-    with FEDS_LOCK:
-        getfed = FEDERATION_BYFEDID.get(str(fed_id))
-        fed_admins = eval(eval(getfed['fusers'])['members'])
-        return fed_admins
+    return list(FED_ADMINS.get(str(fed_id), ()))
 
 
 def set_frules(fed_id, rules):
     with FEDS_LOCK:
-        global FEDERATION_BYOWNER, FEDERATION_BYFEDID, FEDERATION_BYNAME
         # Variables
         getfed = FEDERATION_BYFEDID.get(str(fed_id))
         owner_id = getfed['owner']
         fed_name = getfed['fname']
-        fed_members = getfed['fusers']
         fed_rules = str(rules)
-        fed_log = getfed['flog']
         # Set user
         FEDERATION_BYOWNER[str(owner_id)]['frules'] = fed_rules
         FEDERATION_BYFEDID[str(fed_id)]['frules'] = fed_rules
         FEDERATION_BYNAME[fed_name]['frules'] = fed_rules
-        # Set on database
-        fed = Federations(str(owner_id), fed_name, str(fed_id), fed_rules, fed_log, str(fed_members))
-        SESSION.merge(fed)
+        # Set on database, only the column that changed so a legacy fed_users string is left alone
+        SESSION.query(Federations).filter(Federations.fed_id == str(fed_id)).update({'fed_rules': fed_rules})
         SESSION.commit()
         return True
 
@@ -435,104 +389,93 @@ def get_frules(fed_id):
 
 def fban_user(fed_id, user_id, first_name, last_name, user_name, reason, time):
     with FEDS_LOCK:
-        r = SESSION.query(BansF).all()
-        for I in r:
-            if I.fed_id == fed_id:
-                if int(I.user_id) == int(user_id):
-                    SESSION.delete(I)
-
         r = BansF(str(fed_id), str(user_id), first_name, last_name, user_name, reason, time)
 
-        SESSION.add(r)
+        SESSION.merge(r)  # merge to replace a previous ban of the same user
         try:
             SESSION.commit()
         except:
             SESSION.rollback()
             return False
-        finally:
-            SESSION.commit()
-        __load_all_feds_banned()
+        __cache_fban(fed_id, user_id, first_name, last_name, user_name, reason, time)
         return r
 
 
-def multi_fban_user(multi_fed_id, multi_user_id, multi_first_name, multi_last_name, multi_user_name, multi_reason):
-    if True:  # with FEDS_LOCK:
-        counter = 0
-        time = 0
-        for x in range(len(multi_fed_id)):
-            fed_id = multi_fed_id[x]
-            user_id = multi_user_id[x]
-            first_name = multi_first_name[x]
-            last_name = multi_last_name[x]
-            user_name = multi_user_name[x]
-            reason = multi_reason[x]
-            r = SESSION.query(BansF).all()
-            for I in r:
-                if I.fed_id == fed_id:
-                    if int(I.user_id) == int(user_id):
-                        SESSION.delete(I)
-
-            r = BansF(str(fed_id), str(user_id), first_name, last_name, user_name, reason, time)
-
-            SESSION.add(r)
-            counter += 1
-            if str(str(counter)[-2:]) == "00":
-                print(user_id)
-                print(first_name)
-                print(reason)
-                print(counter)
-        try:
-            SESSION.commit()
-        except:
-            SESSION.rollback()
-            return False
-        finally:
-            SESSION.commit()
-        __load_all_feds_banned()
-        print("Done")
-        return counter
+def import_fbans(fed_id, bans, chunk_size=1000, progress=None):
+    # bans yields (user_id, first_name, last_name, user_name, reason). The rows are written as chunked upserts in a
+    # transaction of their own, so only the current chunk and the ids seen so far are held in memory and FEDS_LOCK
+    # is only taken at the end, to load the federation's bans into the cache; progress() never runs under it.
+    # The first row of a user wins, later duplicates are neither written nor counted.
+    imported = 0
+    seen = set()
+    with session_scope() as session:
+        chunk = {}
+        for user_id, first_name, last_name, user_name, reason in bans:
+            if str(user_id) in seen:
+                continue
+            seen.add(str(user_id))
+            chunk[str(user_id)] = {'fed_id': str(fed_id), 'user_id': str(user_id), 'first_name': first_name,
+                                   'last_name': last_name, 'user_name': user_name, 'reason': reason, 'time': 0}
+            if len(chunk) >= chunk_size:
+                __upsert_fbans(session, list(chunk.values()))
+                imported += len(chunk)
+                chunk = {}
+                if progress:
+                    progress(imported)
+        if chunk:
+            __upsert_fbans(session, list(chunk.values()))
+            imported += len(chunk)
+
+    with FEDS_LOCK:
+        __reload_fed_bans(str(fed_id))
+    return imported
+
+
+def __reload_fed_bans(fed_id):
+    # an import only adds or replaces bans, so caching every row again is enough and nothing disappears meanwhile
+    with read_session() as session:
+        for x in session.query(BansF).filter(BansF.fed_id == fed_id).yield_per(1000):
+            __cache_fban(x.fed_id, x.user_id, x.first_name, x.last_name, x.user_name, x.reason, x.time)
+
+
+def __upsert_fbans(session, chunk):
+    stmt = insert(BansF.__table__).values(chunk)
+    stmt = stmt.on_conflict_do_update(index_elements=[BansF.fed_id, BansF.user_id],
+                                      set_={'first_name': stmt.excluded.first_name,
+                                            'last_name': stmt.excluded.last_name,
+                                            'user_name': stmt.excluded.user_name,
+                                            'reason': stmt.excluded.reason,
+                                            'time': stmt.excluded.time})
+    session.execute(stmt)
 
 
 def un_fban_user(fed_id, user_id):
     with FEDS_LOCK:
-        r = SESSION.query(BansF).all()
-        for I in r:
-            if I.fed_id == fed_id:
-                if int(I.user_id) == int(user_id):
-                    SESSION.delete(I)
+        r = SESSION.query(BansF).get((str(fed_id), str(user_id)))
+        if not r:
+            SESSION.close()
+            return False
+
+        SESSION.delete(r)
         try:
             SESSION.commit()
         except:
             SESSION.rollback()
             return False
-        finally:
-            SESSION.commit()
-        __load_all_feds_banned()
-        return I
+        __uncache_fban(fed_id, user_id)
+        return r
 
 
 def get_fban_user(fed_id, user_id):
-    list_fbanned = FEDERATION_BANNED_USERID.get(fed_id)
-    if list_fbanned == None:
-        FEDERATION_BANNED_USERID[fed_id] = []
-    if user_id in FEDERATION_BANNED_USERID[fed_id]:
-        r = SESSION.query(BansF).all()
-        reason = None
-        for I in r:
-            if I.fed_id == fed_id:
-                if int(I.user_id) == int(user_id):
-                    reason = I.reason
-                    time = I.time
-        return True, reason, time
+    user_info = FEDERATION_BANNED_FULL.get(fed_id, {}).get(str(user_id))
+    if user_info:
+        return True, user_info['reason'], user_info['time']
     else:
         return False, None, None
 
 
 def get_all_fban_users(fed_id):
-    list_fbanned = FEDERATION_BANNED_USERID.get(fed_id)
-    if list_fbanned == None:
-        FEDERATION_BANNED_USERID[fed_id] = []
-    return FEDERATION_BANNED_USERID[fed_id]
+    return list(FEDERATION_BANNED_USERID.get(fed_id, ()))
 
 
 def get_all_fban_users_target(fed_id, user_id):
@@ -545,7 +488,6 @@ def get_all_fban_users_target(fed_id, user_id):
 
 
 def get_all_fban_users_global():
-    list_fbanned = FEDERATION_BANNED_USERID
     total = []
     for x in list(FEDERATION_BANNED_USERID):
         for y in FEDERATION_BANNED_USERID[x]:
@@ -553,6 +495,14 @@ def get_all_fban_users_global():
     return total
 
 
+def num_fbans():
+    return FBAN_COUNT
+
+
+def num_feds():
+    return len(FEDERATION_BYFEDID)
+
+
 def get_all_feds_users_global():
     list_fed = FEDERATION_BYFEDID
     total = []
@@ -618,23 +568,18 @@ def get_fed_log(fed_id):
 
 def set_fed_log(fed_id, chat_id):
     with FEDS_LOCK:
-        global FEDERATION_BYOWNER, FEDERATION_BYFEDID, FEDERATION_BYNAME
         # Variables
         getfed = FEDERATION_BYFEDID.get(str(fed_id))
         owner_id = getfed['owner']
         fed_name = getfed['fname']
-        fed_members = getfed['fusers']
-        fed_rules = getfed['frules']
         fed_log = str(chat_id)
         # Set user
         FEDERATION_BYOWNER[str(owner_id)]['flog'] = fed_log
         FEDERATION_BYFEDID[str(fed_id)]['flog'] = fed_log
         FEDERATION_BYNAME[fed_name]['flog'] = fed_log
-        # Set on database
-        fed = Federations(str(owner_id), fed_name, str(fed_id), fed_rules, fed_log, str(fed_members))
-        SESSION.merge(fed)
+        # Set on database, only the column that changed so a legacy fed_users string is left alone
+        SESSION.query(Federations).filter(Federations.fed_id == str(fed_id)).update({'fed_log': fed_log})
         SESSION.commit()
-        print(fed_log)
         return True
 
 
@@ -699,19 +644,45 @@ def __load_all_feds():
             if check == None:
                 FEDERATION_BYOWNER[x.owner_id] = []
             FEDERATION_BYOWNER[str(x.owner_id)] = {'fid': str(x.fed_id), 'fname': x.fed_name, 'frules': x.fed_rules,
-                                                   'flog': x.fed_log, 'fusers': str(x.fed_users)}
+                                                   'flog': x.fed_log}
             # Fed By FedId
             check = FEDERATION_BYFEDID.get(x.fed_id)
             if check == None:
                 FEDERATION_BYFEDID[x.fed_id] = []
             FEDERATION_BYFEDID[str(x.fed_id)] = {'owner': str(x.owner_id), 'fname': x.fed_name, 'frules': x.fed_rules,
-                                                 'flog': x.fed_log, 'fusers': str(x.fed_users)}
+                                                 'flog': x.fed_log}
             # Fed By Name
             check = FEDERATION_BYNAME.get(x.fed_name)
             if check == None:
                 FEDERATION_BYNAME[x.fed_name] = []
             FEDERATION_BYNAME[x.fed_name] = {'fid': str(x.fed_id), 'owner': str(x.owner_id), 'frules': x.fed_rules,
-                                             'flog': x.fed_log, 'fusers': str(x.fed_users)}
+                                             'flog': x.fed_log}
+    finally:
+        SESSION.close()
+
+
+def __load_fed_admins():
+    # moves the admin lists still stored as a repr string in feds.fed_users into fed_admins, once
+    try:
+        for fed in SESSION.query(Federations).filter(Federations.fed_users != None).all():
+            try:
+                members = ast.literal_eval(ast.literal_eval(fed.fed_users)['members'])
+            except (ValueError, SyntaxError, KeyError, TypeError):
+                # keep the string, so the admins can still be recovered by hand
+                LOGGER.error("Can't read the admin list of federation %s, left in feds.fed_users: %r",
+                             fed.fed_id, fed.fed_users)
+                continue
+            for user_id in set(members):
+                SESSION.merge(FedAdmins(fed.fed_id, user_id))
+            fed.fed_users = None
+        SESSION.commit()
+
+        for x in SESSION.query(Federations.fed_id, Federations.owner_id).all():
+            FED_ADMINS[x.fed_id] = set()
+            USER_OWNER_FEDS.setdefault(int(x.owner_id), set()).add(x.fed_id)
+        for x in SESSION.query(FedAdmins).all():
+            FED_ADMINS.setdefault(x.fed_id, set()).add(int(x.user_id))
+            USER_ADMIN_FEDS.setdefault(int(x.user_id), set()).add(x.fed_id)
     finally:
         SESSION.close()
 
@@ -737,23 +708,38 @@ def __load_all_feds_chats():
         SESSION.close()
 
 
+def __cache_fban(fed_id, user_id, first_name, last_name, user_name, reason, time):
+    global FBAN_COUNT
+    ban = {'first_name': first_name, 'last_name': last_name, 'user_name': user_name, 'reason': reason, 'time': time}
+    FEDERATION_BANNED_USERID.setdefault(fed_id, set()).add(int(user_id))
+    FEDERATION_BANNED_FULL.setdefault(fed_id, {})[str(user_id)] = ban
+    user_bans = USER_FBANS.setdefault(int(user_id), {})
+    if fed_id not in user_bans:
+        FBAN_COUNT += 1
+    user_bans[fed_id] = ban
+
+
+def __uncache_fban(fed_id, user_id):
+    global FBAN_COUNT
+    FEDERATION_BANNED_USERID.get(fed_id, set()).discard(int(user_id))
+    FEDERATION_BANNED_FULL.get(fed_id, {}).pop(str(user_id), None)
+    user_bans = USER_FBANS.get(int(user_id))
+    if user_bans and user_bans.pop(fed_id, None) is not None:
+        FBAN_COUNT -= 1
+        if not user_bans:
+            del USER_FBANS[int(user_id)]
+
+
 def __load_all_feds_banned():
-    global FEDERATION_BANNED_USERID, FEDERATION_BANNED_FULL
+    global FBAN_COUNT
     try:
-        FEDERATION_BANNED_USERID = {}
-        FEDERATION_BANNED_FULL = {}
+        FEDERATION_BANNED_USERID.clear()
+        FEDERATION_BANNED_FULL.clear()
+        USER_FBANS.clear()
+        FBAN_COUNT = 0
         qall = SESSION.query(BansF).all()
         for x in qall:
-            check = FEDERATION_BANNED_USERID.get(x.fed_id)
-            if check == None:
-                FEDERATION_BANNED_USERID[x.fed_id] = []
-            if int(x.user_id) not in FEDERATION_BANNED_USERID[x.fed_id]:
-                FEDERATION_BANNED_USERID[x.fed_id].append(int(x.user_id))
-            check = FEDERATION_BANNED_FULL.get(x.fed_id)
-            if check == None:
-                FEDERATION_BANNED_FULL[x.fed_id] = {}
-            FEDERATION_BANNED_FULL[x.fed_id][x.user_id] = {'first_name': x.first_name, 'last_name': x.last_name,
-                                                           'user_name': x.user_name, 'reason': x.reason, 'time': x.time}
+            __cache_fban(x.fed_id, x.user_id, x.first_name, x.last_name, x.user_name, x.reason, x.time)
     finally:
         SESSION.close()
 
@@ -796,6 +782,7 @@ def __load_feds_subscriber():
 
 
 __load_all_feds()
+__load_fed_admins()
 __load_all_feds_chats()
 __load_all_feds_banned()
 __load_all_feds_settings()
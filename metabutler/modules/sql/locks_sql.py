@@ -90,6 +90,28 @@ PERM_LOCK = threading.RLock()
 RESTR_LOCK = threading.RLock()
 CONF_LOCK = threading.RLock()
 
+LOCK_COLUMNS = ('audio', 'voice', 'contact', 'video', 'document', 'photo', 'sticker', 'gif', 'url', 'bots',
+                'forward', 'game', 'location', 'rtl', 'button')
+LOCK_BITS = {column: 1 << i for i, column in enumerate(LOCK_COLUMNS)}
+RESTR_COLUMNS = ('messages', 'media', 'other', 'preview')
+
+# write-through caches of the three tables, so message handlers never hit the db
+CHAT_LOCKS = {}  # chat_id -> bitmask of LOCK_BITS
+CHAT_RESTRICTIONS = {}  # chat_id -> {column: bool}
+CHAT_LOCK_CONF = {}  # chat_id -> should warn
+
+
+def __cache_permissions(perm):
+    mask = 0
+    for column in LOCK_COLUMNS:
+        if getattr(perm, column):
+            mask |= LOCK_BITS[column]
+    CHAT_LOCKS[str(perm.chat_id)] = mask
+
+
+def __cache_restrictions(restr):
+    CHAT_RESTRICTIONS[str(restr.chat_id)] = {column: bool(getattr(restr, column)) for column in RESTR_COLUMNS}
+
 
 def init_permissions(chat_id, reset=False):
     curr_perm = SESSION.query(Permissions).get(str(chat_id))
@@ -99,6 +121,7 @@ def init_permissions(chat_id, reset=False):
     perm = Permissions(str(chat_id))
     SESSION.add(perm)
     SESSION.commit()
+    __cache_permissions(perm)
     return perm
 
 
@@ -110,6 +133,7 @@ def init_restrictions(chat_id, reset=False):
     restr = Restrictions(str(chat_id))
     SESSION.add(restr)
     SESSION.commit()
+    __cache_restrictions(restr)
     return restr
 
 
@@ -152,6 +176,7 @@ def update_lock(chat_id, lock_type, locked):
 
         SESSION.add(curr_perm)
         SESSION.commit()
+        __cache_permissions(curr_perm)
 
 
 def update_restriction(chat_id, restr_type, locked):
@@ -175,64 +200,33 @@ def update_restriction(chat_id, restr_type, locked):
             curr_restr.preview = locked
         SESSION.add(curr_restr)
         SESSION.commit()
+        __cache_restrictions(curr_restr)
 
 
-def is_locked(chat_id, lock_type):
-    curr_perm = SESSION.query(Permissions).get(str(chat_id))
-    SESSION.close()
+def get_lock_mask(chat_id):
+    return CHAT_LOCKS.get(str(chat_id), 0)
 
-    if not curr_perm:
-        return False
 
-    elif lock_type == "sticker":
-        return curr_perm.sticker
-    elif lock_type == "photo":
-        return curr_perm.photo
-    elif lock_type == "audio":
-        return curr_perm.audio
-    elif lock_type == "voice":
-        return curr_perm.voice
-    elif lock_type == "contact":
-        return curr_perm.contact
-    elif lock_type == "video":
-        return curr_perm.video
-    elif lock_type == "document":
-        return curr_perm.document
-    elif lock_type == "gif":
-        return curr_perm.gif
-    elif lock_type == "url":
-        return curr_perm.url
-    elif lock_type == "bots":
-        return curr_perm.bots
-    elif lock_type == "forward":
-        return curr_perm.forward
-    elif lock_type == "game":
-        return curr_perm.game
-    elif lock_type == "location":
-        return curr_perm.location
-    elif lock_type == "rtl":
-        return curr_perm.rtl
-    elif lock_type == "button":
-        return curr_perm.button
+def is_locked(chat_id, lock_type):
+    return bool(get_lock_mask(chat_id) & LOCK_BITS.get(lock_type, 0))
 
 
 def is_restr_locked(chat_id, lock_type):
-    curr_restr = SESSION.query(Restrictions).get(str(chat_id))
-    SESSION.close()
+    curr_restr = CHAT_RESTRICTIONS.get(str(chat_id))
 
     if not curr_restr:
         return False
 
     if lock_type == "messages":
-        return curr_restr.messages
+        return curr_restr['messages']
     elif lock_type == "media":
-        return curr_restr.media
+        return curr_restr['media']
     elif lock_type == "other":
-        return curr_restr.other
+        return curr_restr['other']
     elif lock_type == "previews":
-        return curr_restr.preview
+        return curr_restr['preview']
     elif lock_type == "all":
-        return curr_restr.messages and curr_restr.media and curr_restr.other and curr_restr.preview
+        return all(curr_restr.values())
 
 
 def get_locks(chat_id):
@@ -255,12 +249,24 @@ def migrate_chat(old_chat_id, new_chat_id):
         if perms:
             perms.chat_id = str(new_chat_id)
         SESSION.commit()
+        if str(old_chat_id) in CHAT_LOCKS:
+            CHAT_LOCKS[str(new_chat_id)] = CHAT_LOCKS.pop(str(old_chat_id))
 
     with RESTR_LOCK:
         rest = SESSION.query(Restrictions).get(str(old_chat_id))
         if rest:
             rest.chat_id = str(new_chat_id)
         SESSION.commit()
+        if str(old_chat_id) in CHAT_RESTRICTIONS:
+            CHAT_RESTRICTIONS[str(new_chat_id)] = CHAT_RESTRICTIONS.pop(str(old_chat_id))
+
+    with CONF_LOCK:
+        conf = SESSION.query(LockConfig).get(str(old_chat_id))
+        if conf:
+            conf.chat_id = str(new_chat_id)
+        SESSION.commit()
+        if str(old_chat_id) in CHAT_LOCK_CONF:
+            CHAT_LOCK_CONF[str(new_chat_id)] = CHAT_LOCK_CONF.pop(str(old_chat_id))
 
 
 def set_lockconf(chat_id, should_warn):
@@ -272,12 +278,48 @@ def set_lockconf(chat_id, should_warn):
         lock_setting.warn = should_warn
         SESSION.add(lock_setting)
         SESSION.commit()
+        CHAT_LOCK_CONF[str(chat_id)] = bool(should_warn)
 
 def get_lockconf(chat_id) -> bool:
+    return CHAT_LOCK_CONF.get(str(chat_id), False)
+
+
+def reload_chat(chat_id):
+    # puts the chat's cached locks back in line with the database, e.g. after a rolled back import
+    with PERM_LOCK, RESTR_LOCK, CONF_LOCK:
+        try:
+            perm = SESSION.query(Permissions).get(str(chat_id))
+            restr = SESSION.query(Restrictions).get(str(chat_id))
+            conf = SESSION.query(LockConfig).get(str(chat_id))
+            if perm:
+                __cache_permissions(perm)
+            else:
+                CHAT_LOCKS.pop(str(chat_id), None)
+            if restr:
+                __cache_restrictions(restr)
+            else:
+                CHAT_RESTRICTIONS.pop(str(chat_id), None)
+            if conf:
+                CHAT_LOCK_CONF[str(chat_id)] = bool(conf.warn)
+            else:
+                CHAT_LOCK_CONF.pop(str(chat_id), None)
+        finally:
+            SESSION.close()
+
+
+def __load_locks():
     try:
-        lock_setting = SESSION.query(LockConfig).get(str(chat_id))
-        if lock_setting:
-            return lock_setting.warn
-        return False
+        for perm in SESSION.query(Permissions).all():
+            __cache_permissions(perm)
+
+        for restr in SESSION.query(Restrictions).all():
+            __cache_restrictions(restr)
+
+        for conf in SESSION.query(LockConfig).all():
+            CHAT_LOCK_CONF[conf.chat_id] = bool(conf.warn)
+
     finally:
         SESSION.close()
+
+
+__load_locks()
@@ -1,10 +1,11 @@
 # Note: chat_id's are stored as strings because the int is too large to be stored in a PSQL database.
 import threading
+from collections import OrderedDict, namedtuple
 
 from sqlalchemy import Column, String, Boolean, UnicodeText, Integer, func, distinct
 
 from metabutler.modules.helper_funcs.msg_types import Types
-from metabutler.modules.sql import SESSION, BASE
+from metabutler.modules.sql import SESSION, BASE, read_session
 
 
 class Notes(BASE):
@@ -67,6 +68,18 @@ NOTES_INSERTION_LOCK = threading.RLock()
 BUTTONS_INSERTION_LOCK = threading.RLock()
 PMNOTE_INSERTION_LOCK = threading.RLock()
 
+# Read-only copies of notes for /get and #hashtags, kept until the note changes
+CachedNote = namedtuple('CachedNote', 'chat_id name value file is_reply msgtype buttons')
+NoteButton = namedtuple('NoteButton', 'name url same_line')
+
+NOTE_CACHE_SIZE = 4096
+NOTE_CACHE = OrderedDict()  # (chat_id, name) -> CachedNote, or None for a name that isn't a note
+NOTE_CACHE_LOCK = threading.Lock()
+# bumped by every invalidation; a reader only stores what it read if nothing was invalidated while it was reading
+NOTE_GENERATION = 0
+
+PRIVATE_NOTES = {}  # chat_id -> (is_private, is_delete)
+
 
 def add_note_to_db(chat_id, note_name, note_data, msgtype, buttons=None, file=None):
     if not buttons:
@@ -84,6 +97,7 @@ def add_note_to_db(chat_id, note_name, note_data, msgtype, buttons=None, file=No
         note = Notes(str(chat_id), note_name, note_data or "", msgtype=msgtype.value, file=file)
         SESSION.add(note)
         SESSION.commit()
+        __invalidate_note(chat_id, note_name)
 
     for b_name, url, same_line in buttons:
         add_note_button_to_db(chat_id, note_name, b_name, url, same_line)
@@ -108,6 +122,7 @@ def rm_note(chat_id, note_name):
 
             SESSION.delete(note)
             SESSION.commit()
+            __invalidate_note(chat_id, note_name)
             return True
 
         else:
@@ -122,11 +137,33 @@ def get_all_chat_notes(chat_id):
         SESSION.close()
 
 
+def iter_chat_notes(chat_id, batch=100):
+    # (note, buttons) for every note of a chat, read a batch of notes and their buttons at a time
+    last_name = None
+    with read_session() as session:
+        while True:
+            query = session.query(Notes).filter(Notes.chat_id == str(chat_id))
+            if last_name is not None:
+                query = query.filter(Notes.name > last_name)
+            notes = query.order_by(Notes.name.asc()).limit(batch).all()
+            if not notes:
+                return
+            buttons = {}
+            for btn in session.query(Buttons).filter(Buttons.chat_id == str(chat_id),
+                                                     Buttons.note_name.in_([note.name for note in notes])
+                                                     ).order_by(Buttons.id):
+                buttons.setdefault(btn.note_name, []).append(btn)
+            for note in notes:
+                yield note, buttons.get(note.name, [])
+            last_name = notes[-1].name
+
+
 def add_note_button_to_db(chat_id, note_name, b_name, url, same_line):
     with BUTTONS_INSERTION_LOCK:
         button = Buttons(chat_id, note_name, b_name, url, same_line)
         SESSION.add(button)
         SESSION.commit()
+        __invalidate_note(chat_id, note_name)
 
 
 def get_buttons(chat_id, note_name):
@@ -146,13 +183,73 @@ def private_note(chat_id, is_private, is_delete):
 
         SESSION.add(curr)
         SESSION.commit()
+        with NOTE_CACHE_LOCK:
+            __bump_generation()
+            PRIVATE_NOTES[str(chat_id)] = (is_private, is_delete)
 
 def get_private_note(chat_id):
-    curr = SESSION.query(PrivateNote).get(str(chat_id))
-    if curr:
-        return curr.is_private, curr.is_delete
-    else:
-        return False, False
+    setting = PRIVATE_NOTES.get(str(chat_id))
+    if setting is not None:
+        return setting
+    generation = NOTE_GENERATION
+    try:
+        curr = SESSION.query(PrivateNote).get(str(chat_id))
+        setting = (curr.is_private, curr.is_delete) if curr else (False, False)
+    finally:
+        SESSION.close()
+    with NOTE_CACHE_LOCK:
+        if generation == NOTE_GENERATION:
+            PRIVATE_NOTES[str(chat_id)] = setting
+    return setting
+
+
+def get_cached_note(chat_id, note_name):
+    # CachedNote or None, only the first lookup of a note goes to the database
+    key = (str(chat_id), note_name)
+    with NOTE_CACHE_LOCK:
+        if key in NOTE_CACHE:
+            NOTE_CACHE.move_to_end(key)
+            return NOTE_CACHE[key]
+        generation = NOTE_GENERATION
+
+    with read_session() as session:
+        note = session.query(Notes).get(key)
+        cached = None
+        if note:
+            buttons = session.query(Buttons).filter(Buttons.chat_id == key[0], Buttons.note_name == note_name
+                                                    ).order_by(Buttons.id).all()
+            cached = CachedNote(note.chat_id, note.name, note.value, note.file, note.is_reply, note.msgtype,
+                                tuple(NoteButton(btn.name, btn.url, btn.same_line) for btn in buttons))
+
+    with NOTE_CACHE_LOCK:
+        if generation != NOTE_GENERATION:
+            # a write committed while we were reading, what we read may already be stale
+            return cached
+        NOTE_CACHE[key] = cached
+        while len(NOTE_CACHE) > NOTE_CACHE_SIZE:
+            NOTE_CACHE.popitem(last=False)
+    return cached
+
+
+def __bump_generation():
+    # callers hold NOTE_CACHE_LOCK
+    global NOTE_GENERATION
+    NOTE_GENERATION += 1
+
+
+def __invalidate_note(chat_id, note_name):
+    with NOTE_CACHE_LOCK:
+        __bump_generation()
+        NOTE_CACHE.pop((str(chat_id), note_name), None)
+
+
+def invalidate_chat(chat_id):
+    # after anything that changed a chat's notes outside the functions above (imports, migrations)
+    with NOTE_CACHE_LOCK:
+        __bump_generation()
+        for key in [key for key in NOTE_CACHE if key[0] == str(chat_id)]:
+            del NOTE_CACHE[key]
+        PRIVATE_NOTES.pop(str(chat_id), None)
 
 def num_notes():
     try:
@@ -180,3 +277,5 @@ def migrate_chat(old_chat_id, new_chat_id):
                 btn.chat_id = str(new_chat_id)
 
         SESSION.commit()
+        invalidate_chat(old_chat_id)
+        invalidate_chat(new_chat_id)
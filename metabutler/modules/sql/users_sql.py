@@ -1,9 +1,13 @@
+import atexit
 import threading
+import time
+from collections import OrderedDict
 
-from sqlalchemy import Column, Integer, UnicodeText, String, ForeignKey, UniqueConstraint, func
+from sqlalchemy import Column, Integer, UnicodeText, String, ForeignKey, UniqueConstraint, Index, func
+from sqlalchemy.dialects.postgresql import insert
 
 from metabutler import dispatcher
-from metabutler.modules.sql import BASE, SESSION
+from metabutler.modules.sql import BASE, SESSION, session_scope, read_session
 
 
 class Users(BASE):
@@ -61,8 +65,33 @@ Users.__table__.create(checkfirst=True)
 Chats.__table__.create(checkfirst=True)
 ChatMembers.__table__.create(checkfirst=True)
 
+# @username lookups compare lower(username), so they need an index on that expression
+USERNAME_INDEX = Index("users_username_lower_idx", func.lower(Users.username))
+USERNAME_INDEX.create(checkfirst=True)
+
 INSERTION_LOCK = threading.RLock()
 
+# Write-behind buffer for the users module, which sees every group message. Observations are coalesced in memory,
+# skipped when the LRU says nothing changed, and written as bulk upserts by flush_users().
+BUFFER_LOCK = threading.Lock()
+FLUSH_SIZE = 500
+SEEN_SIZE = 50000
+
+PENDING_USERS = {}  # user_id -> username
+PENDING_CHATS = {}  # chat_id -> chat_name
+PENDING_MEMBERS = set()  # (chat_id, user_id)
+SEEN = OrderedDict()  # (user_id, chat_id) -> (username, chat_name) of recently written observations
+
+# lowercased username -> (expires, [user_id, ...]); an empty list remembers that nobody has that name
+USERNAME_LOCK = threading.Lock()
+USERNAME_CACHE = OrderedDict()
+USERNAME_CACHED_IDS = {}  # user_id -> lowercased username it is cached under, to drop it when the name changes
+USERNAME_CACHE_SIZE = 10000
+USERNAME_TTL = 600
+USERNAME_MISS_TTL = 60
+USERNAME_WATCHERS = []  # see watch_usernames()
+USERNAME_GENERATION = 0  # bumped by every username write, so a lookup racing with one doesn't cache what it read
+
 
 def ensure_bot_in_db():
     with INSERTION_LOCK:
@@ -83,6 +112,7 @@ def update_user(user_id, username, chat_id=None, chat_name=None):
 
         if not chat_id or not chat_name:
             SESSION.commit()
+            __forget_usernames({user_id: username})
             return
 
         chat = SESSION.query(Chats).get(str(chat_id))
@@ -101,59 +131,185 @@ def update_user(user_id, username, chat_id=None, chat_name=None):
             SESSION.add(chat_member)
 
         SESSION.commit()
+        __forget_usernames({user_id: username})
+
+
+def record_user(user_id, username, chat_id=None, chat_name=None):
+    # buffered update_user; returns True once the buffer is big enough that it should be flushed
+    if not chat_id or not chat_name:
+        chat_id = chat_name = None
+    else:
+        chat_id = str(chat_id)
+
+    key = (user_id, chat_id)
+    with BUFFER_LOCK:
+        if SEEN.get(key) == (username, chat_name):
+            SEEN.move_to_end(key)
+            return False
+        SEEN[key] = (username, chat_name)
+        if len(SEEN) > SEEN_SIZE:
+            SEEN.popitem(last=False)
+
+        PENDING_USERS[user_id] = username
+        if chat_id:
+            PENDING_CHATS[chat_id] = chat_name
+            PENDING_MEMBERS.add((chat_id, user_id))
+        return len(PENDING_USERS) + len(PENDING_MEMBERS) >= FLUSH_SIZE
+
+
+def flush_users():
+    global PENDING_USERS, PENDING_CHATS, PENDING_MEMBERS
+    with INSERTION_LOCK:
+        with BUFFER_LOCK:
+            users, chats, members = PENDING_USERS, PENDING_CHATS, PENDING_MEMBERS
+            PENDING_USERS, PENDING_CHATS, PENDING_MEMBERS = {}, {}, set()
+        if not users:
+            return 0
+
+        try:
+            with session_scope() as session:
+                stmt = insert(Users.__table__).values([{'user_id': user_id, 'username': username}
+                                                       for user_id, username in sorted(users.items())])
+                session.execute(stmt.on_conflict_do_update(index_elements=[Users.user_id],
+                                                           set_={'username': stmt.excluded.username}))
+                if chats:
+                    stmt = insert(Chats.__table__).values([{'chat_id': chat_id, 'chat_name': chat_name}
+                                                           for chat_id, chat_name in sorted(chats.items())])
+                    session.execute(stmt.on_conflict_do_update(index_elements=[Chats.chat_id],
+                                                               set_={'chat_name': stmt.excluded.chat_name}))
+                if members:
+                    stmt = insert(ChatMembers.__table__).values([{'chat': chat_id, 'user': user_id}
+                                                                 for chat_id, user_id in sorted(members)])
+                    session.execute(stmt.on_conflict_do_nothing(constraint='_chat_members_uc'))
+        except Exception:
+            # forget the batch in the LRU so the next message from these users queues it again
+            with BUFFER_LOCK:
+                for key in [key for key in SEEN if key[0] in users]:
+                    del SEEN[key]
+            raise
+        __forget_usernames(users)
+        return len(users)
 
 
 def get_userid_by_name(username):
-    try:
-        return SESSION.query(Users).filter(func.lower(Users.username) == username.lower()).all()
-    finally:
-        SESSION.close()
+    # ids of every user stored under this username, ignoring case; cached, unknown names included
+    name = username.lower()
+    now = time.monotonic()
+    with USERNAME_LOCK:
+        cached = USERNAME_CACHE.get(name)
+        if cached and cached[0] > now:
+            USERNAME_CACHE.move_to_end(name)
+            return list(cached[1])
+        generation = USERNAME_GENERATION
+
+    with read_session() as session:
+        user_ids = [x.user_id for x in session.query(Users.user_id)
+                    .filter(func.lower(Users.username) == name).all()]
+    __cache_username(name, user_ids, generation)
+    return user_ids
+
+
+def resolve_username(username, user_id):
+    # several users once had this name and the caller found out who has it now
+    __cache_username(username.lower(), [user_id])
+
+
+def __cache_username(name, user_ids, generation=None):
+    # generation: USERNAME_GENERATION from before the read, nothing is stored if a write committed since
+    ttl = USERNAME_TTL if user_ids else USERNAME_MISS_TTL
+    with USERNAME_LOCK:
+        if generation is not None and generation != USERNAME_GENERATION:
+            return
+        USERNAME_CACHE[name] = (time.monotonic() + ttl, user_ids)
+        USERNAME_CACHE.move_to_end(name)
+        for user_id in user_ids:
+            USERNAME_CACHED_IDS[user_id] = name
+        while len(USERNAME_CACHE) > USERNAME_CACHE_SIZE:
+            old_name, (expires, old_ids) = USERNAME_CACHE.popitem(last=False)
+            for old_id in old_ids:
+                if USERNAME_CACHED_IDS.get(old_id) == old_name:
+                    del USERNAME_CACHED_IDS[old_id]
+
+
+def __forget_usernames(users):
+    # users: {user_id: username} just written; drops the entries for their new and their previous names
+    global USERNAME_GENERATION
+    with USERNAME_LOCK:
+        USERNAME_GENERATION += 1
+        for user_id, username in users.items():
+            if username:
+                USERNAME_CACHE.pop(username.lower(), None)
+            old_name = USERNAME_CACHED_IDS.pop(user_id, None)
+            if old_name:
+                USERNAME_CACHE.pop(old_name, None)
+    for watcher in USERNAME_WATCHERS:
+        watcher(users)
+
+
+def watch_usernames(callback):
+    # callback({user_id: username}) runs after every write to the users table, for modules keeping their own
+    # caches keyed by username
+    USERNAME_WATCHERS.append(callback)
 
 
 def get_name_by_userid(user_id):
-    try:
-        return SESSION.query(Users).get(Users.user_id == int(user_id)).first()
-    finally:
-        SESSION.close()
+    with read_session() as session:
+        return session.query(Users).get(Users.user_id == int(user_id)).first()
 
 
 def get_chat_members(chat_id):
-    try:
-        return SESSION.query(ChatMembers).filter(ChatMembers.chat == str(chat_id)).all()
-    finally:
-        SESSION.close()
+    with read_session() as session:
+        return session.query(ChatMembers).filter(ChatMembers.chat == str(chat_id)).all()
 
 
 def get_all_chats():
-    try:
-        return SESSION.query(Chats).all()
-    finally:
-        SESSION.close()
+    with read_session() as session:
+        return session.query(Chats).all()
+
+
+def get_chat_ids_after(chat_id, limit):
+    # chat ids in id order, used to walk all chats in resumable batches
+    with read_session() as session:
+        return [x.chat_id for x in session.query(Chats.chat_id).filter(Chats.chat_id > str(chat_id))
+                .order_by(Chats.chat_id).limit(limit).all()]
+
+
+def __forget_chat(chat_id):
+    with BUFFER_LOCK:
+        for key in [key for key in SEEN if key[1] == str(chat_id)]:
+            del SEEN[key]
+
+
+def rem_chat(chat_id):
+    with INSERTION_LOCK:
+        __forget_chat(chat_id)
+        chat = SESSION.query(Chats).get(str(chat_id))
+        if chat:
+            SESSION.delete(chat)
+            SESSION.commit()
+        else:
+            SESSION.close()
 
 
 def get_user_num_chats(user_id):
-    try:
-        return SESSION.query(ChatMembers).filter(ChatMembers.user == int(user_id)).count()
-    finally:
-        SESSION.close()
+    with read_session() as session:
+        return session.query(ChatMembers).filter(ChatMembers.user == int(user_id)).count()
 
 
 def num_chats():
-    try:
-        return SESSION.query(Chats).count()
-    finally:
-        SESSION.close()
+    with read_session() as session:
+        return session.query(Chats).count()
 
 
 def num_users():
-    try:
-        return SESSION.query(Users).count()
-    finally:
-        SESSION.close()
+    with read_session() as session:
+        return session.query(Users).count()
 
 
 def migrate_chat(old_chat_id, new_chat_id):
     with INSERTION_LOCK:
+        flush_users()
+        __forget_chat(old_chat_id)
         chat = SESSION.query(Chats).get(str(old_chat_id))
         if chat:
             chat.chat_id = str(new_chat_id)
@@ -170,3 +326,5 @@ def migrate_chat(old_chat_id, new_chat_id):
 
 
 ensure_bot_in_db()
+
+atexit.register(flush_users)
@@ -3,7 +3,8 @@ import threading
 from sqlalchemy import Integer, Column, String, UnicodeText, func, distinct, Boolean
 from sqlalchemy.dialects import postgresql
 
-from metabutler.modules.sql import SESSION, BASE
+from metabutler.modules.helper_funcs.trigger_matcher import TriggerMatcherCache
+from metabutler.modules.sql import SESSION, BASE, read_session
 
 
 class Warns(BASE):
@@ -70,6 +71,7 @@ WARN_FILTER_INSERTION_LOCK = threading.RLock()
 WARN_SETTINGS_LOCK = threading.RLock()
 
 WARN_FILTERS = {}
+WARN_FILTER_MATCHERS = TriggerMatcherCache(lambda chat_id: get_chat_warn_triggers(chat_id))
 
 
 def warn_user(user_id, chat_id, reason=None):
@@ -140,6 +142,7 @@ def add_warn_filter(chat_id, keyword, reply):
         if keyword not in WARN_FILTERS.get(str(chat_id), []):
             WARN_FILTERS[str(chat_id)] = sorted(WARN_FILTERS.get(str(chat_id), []) + [keyword],
                                                 key=lambda x: (-len(x), x))
+            WARN_FILTER_MATCHERS.invalidate(chat_id)
 
         SESSION.merge(warn_filt)  # merge to avoid duplicate key issues
         SESSION.commit()
@@ -151,6 +154,7 @@ def remove_warn_filter(chat_id, keyword):
         if warn_filt:
             if keyword in WARN_FILTERS.get(str(chat_id), []):  # sanity check
                 WARN_FILTERS.get(str(chat_id), []).remove(keyword)
+                WARN_FILTER_MATCHERS.invalidate(chat_id)
 
             SESSION.delete(warn_filt)
             SESSION.commit()
@@ -163,6 +167,10 @@ def get_chat_warn_triggers(chat_id):
     return WARN_FILTERS.get(str(chat_id), set())
 
 
+def match_warn_filter(chat_id, text):
+    return WARN_FILTER_MATCHERS.search(chat_id, text)
+
+
 def get_chat_warn_filters(chat_id):
     try:
         return SESSION.query(WarnFilters).filter(WarnFilters.chat_id == str(chat_id)).all()
@@ -272,6 +280,20 @@ def num_warn_filter_chats():
         SESSION.close()
 
 
+def reload_chat(chat_id):
+    # puts the chat's cached warn filters back in line with the database, e.g. after a rolled back import
+    with WARN_FILTER_INSERTION_LOCK:
+        try:
+            keywords = {x.keyword for x in SESSION.query(WarnFilters).filter(WarnFilters.chat_id == str(chat_id)).all()}
+        finally:
+            SESSION.close()
+        if keywords:
+            WARN_FILTERS[str(chat_id)] = sorted(keywords, key=lambda i: (-len(i), i))
+        else:
+            WARN_FILTERS.pop(str(chat_id), None)
+        WARN_FILTER_MATCHERS.invalidate(chat_id)
+
+
 def __load_chat_warn_filters():
     global WARN_FILTERS
     try:
@@ -301,8 +323,10 @@ def migrate_chat(old_chat_id, new_chat_id):
         for filt in chat_filters:
             filt.chat_id = str(new_chat_id)
         SESSION.commit()
-        WARN_FILTERS[str(new_chat_id)] = WARN_FILTERS[str(old_chat_id)]
-        del WARN_FILTERS[str(old_chat_id)]
+        if str(old_chat_id) in WARN_FILTERS:
+            WARN_FILTERS[str(new_chat_id)] = WARN_FILTERS.pop(str(old_chat_id))
+        WARN_FILTER_MATCHERS.invalidate(old_chat_id)
+        WARN_FILTER_MATCHERS.invalidate(new_chat_id)
 
     with WARN_SETTINGS_LOCK:
         chat_settings = SESSION.query(WarnSettings).filter(WarnSettings.chat_id == str(old_chat_id)).all()
@@ -311,13 +335,16 @@ def migrate_chat(old_chat_id, new_chat_id):
         SESSION.commit()
 
 
+def iter_chat_warns(chat_id, batch=500):
+    # one chat's warns, fetched from the database in batches
+    with read_session() as session:
+        query = session.query(Warns).filter(Warns.chat_id == str(chat_id), Warns.num_warns > 0).yield_per(batch)
+        for x in query:
+            yield {"user_id": x.user_id, 'warns': x.num_warns, 'reasons': x.reasons}
+
+
 def get_allwarns(chat_id):
-    get = SESSION.query(Warns).all()
-    allwarns = []
-    for x in get:
-        if x.chat_id == str(chat_id) and x.num_warns > 0:
-            allwarns.append({"user_id": x.user_id, 'warns': x.num_warns, 'reasons': x.reasons})
-    return allwarns
+    return list(iter_chat_warns(chat_id))
 
 
 def import_warns(user_id, chat_id, warns, reasons):
@@ -1,8 +1,10 @@
 import threading
 import time
+from collections import namedtuple
 from typing import Union
 
-from sqlalchemy import Column, String, Boolean, UnicodeText, Integer, BigInteger
+from sqlalchemy import Column, String, Boolean, UnicodeText, Integer, BigInteger, Index, tuple_
+from sqlalchemy.dialects.postgresql import insert
 
 from metabutler.modules.helper_funcs.msg_types import Types
 from metabutler.modules.sql import SESSION, BASE
@@ -140,6 +142,10 @@ WelcomeSecurity.__table__.create(checkfirst=True)
 UserRestrict.__table__.create(checkfirst=True)
 WelcomeTimeout.__table__.create(checkfirst=True)
 
+# the timeout scheduler reads pending verifications in deadline order on startup
+WELCOME_TIMEOUT_INDEX = Index("welcome_timeout_int_idx", WelcomeTimeout.timeout_int)
+WELCOME_TIMEOUT_INDEX.create(checkfirst=True)
+
 INSERTION_LOCK = threading.RLock()
 WELC_BTN_LOCK = threading.RLock()
 LEAVE_BTN_LOCK = threading.RLock()
@@ -151,6 +157,61 @@ TO_LOCK = threading.RLock()
 CHAT_USERRESTRICT = {}
 CHAT_TIMEOUT = {}
 
+# Immutable snapshot of everything new_member reads, built with one round of queries and dropped by every setter
+WelcomeSettings = namedtuple("WelcomeSettings", ["should_welcome", "custom_welcome", "custom_content", "welcome_type",
+												 "clean_welcome", "clean_service", "security", "buttons"])
+WelcomeButton = namedtuple("WelcomeButton", ["name", "url", "same_line"])
+DEFAULT_SECURITY = (False, False, "0", "0", 1, "Click here to unmute")
+
+SETTINGS_LOCK = threading.RLock()
+CHAT_SETTINGS = {}
+
+
+def get_welcome_settings(chat_id):
+	settings = CHAT_SETTINGS.get(str(chat_id))
+	if settings is None:
+		with SETTINGS_LOCK:
+			settings = CHAT_SETTINGS.get(str(chat_id))
+			if settings is None:
+				settings = __load_welcome_settings(str(chat_id))
+				CHAT_SETTINGS[str(chat_id)] = settings
+	return settings
+
+
+def __load_welcome_settings(chat_id):
+	try:
+		welc = SESSION.query(Welcome).get(chat_id)
+		security = SESSION.query(WelcomeSecurity).get(chat_id)
+		clean = SESSION.query(CleanServiceSetting).get(chat_id)
+		buttons = SESSION.query(WelcomeButtons).filter(WelcomeButtons.chat_id == chat_id).order_by(
+			WelcomeButtons.id).all()
+
+		if security:
+			security = (security.security, security.extra_verify, security.mute_time, security.timeout,
+						security.timeout_mode, security.custom_text)
+		else:
+			security = DEFAULT_SECURITY
+		buttons = tuple(WelcomeButton(btn.name, btn.url, btn.same_line) for btn in buttons)
+		clean_service = clean.clean_service if clean else False
+
+		if welc:
+			return WelcomeSettings(welc.should_welcome, welc.custom_welcome, welc.custom_content, welc.welcome_type,
+								   welc.clean_welcome, clean_service, security, buttons)
+		# Welcome by default.
+		return WelcomeSettings(True, DEFAULT_WELCOME, None, Types.TEXT, False, clean_service, security, buttons)
+	finally:
+		SESSION.close()
+
+
+def __invalidate_settings(chat_id):
+	with SETTINGS_LOCK:
+		CHAT_SETTINGS.pop(str(chat_id), None)
+
+
+def reload_chat(chat_id):
+	# drops the chat's settings snapshot, e.g. after a rolled back import
+	__invalidate_settings(chat_id)
+
 
 def add_to_userlist(chat_id, user_id, is_clicked):
 	with UR_LOCK:
@@ -165,6 +226,19 @@ def add_to_userlist(chat_id, user_id, is_clicked):
 			CHAT_USERRESTRICT.get(str(chat_id))[user_id] = is_clicked
 
 
+def add_many_to_userlist(chat_id, user_ids, is_clicked):
+	# one upsert for a whole batch, used while a chat is being raided
+	if not user_ids:
+		return
+	with UR_LOCK:
+		stmt = insert(UserRestrict.__table__).values([{'chat_id': str(chat_id), 'user_id': user_id,
+													  'is_clicked': is_clicked} for user_id in user_ids])
+		SESSION.execute(stmt.on_conflict_do_update(index_elements=[UserRestrict.chat_id, UserRestrict.user_id],
+												   set_={'is_clicked': stmt.excluded.is_clicked}))
+		SESSION.commit()
+		CHAT_USERRESTRICT.setdefault(str(chat_id), {}).update(dict.fromkeys(user_ids, is_clicked))
+
+
 def rm_from_userlist(chat_id, user_id):
 	with UR_LOCK:
 		user_filt = SESSION.query(UserRestrict).get((str(chat_id), user_id))
@@ -188,14 +262,18 @@ def get_chat_userlist(chat_id):
 
 def add_to_timeout(chat_id, user_id, timeout_int):
 	with TO_LOCK:
-		user_filt = WelcomeTimeout(str(chat_id), user_id, int(time.time()) + int(timeout_int))
+		deadline = int(time.time()) + int(timeout_int)
+		user_filt = WelcomeTimeout(str(chat_id), user_id, deadline)
 
 		SESSION.merge(user_filt)  # merge to avoid duplicate key issues
 		SESSION.commit()
+		CHAT_TIMEOUT.setdefault(str(chat_id), {})[user_id] = deadline
+		return deadline
 
 
 def rm_from_timeout(chat_id, user_id):
 	with TO_LOCK:
+		CHAT_TIMEOUT.get(str(chat_id), {}).pop(user_id, None)
 		user_filt = SESSION.query(WelcomeTimeout).get((str(chat_id), user_id))
 		if user_filt:
 			SESSION.delete(user_filt)
@@ -205,22 +283,36 @@ def rm_from_timeout(chat_id, user_id):
 		SESSION.close()
 		return False
 
+
+def rm_timeouts(pairs):
+	# pairs of (chat_id, user_id), removed with one statement
+	pairs = [(str(chat_id), user_id) for chat_id, user_id in pairs]
+	if not pairs:
+		return
+	with TO_LOCK:
+		for chat_id, user_id in pairs:
+			CHAT_TIMEOUT.get(chat_id, {}).pop(user_id, None)
+		SESSION.query(WelcomeTimeout).filter(tuple_(WelcomeTimeout.chat_id, WelcomeTimeout.user_id).in_(pairs)) \
+			.delete(synchronize_session=False)
+		SESSION.commit()
+
+
+def get_timeout(chat_id, user_id):
+	return CHAT_TIMEOUT.get(str(chat_id), {}).get(user_id)
+
+
 def get_all_chat_timeout():
-	return SESSION.query(WelcomeTimeout).all()
+	try:
+		return SESSION.query(WelcomeTimeout).order_by(WelcomeTimeout.timeout_int).all()
+	finally:
+		SESSION.close()
 
 def get_chat_timeout(chat_id):
 	return SESSION.query(WelcomeTimeout).filter(WelcomeTimeout.chat_id == str(chat_id)).all()
 
 
 def welcome_security(chat_id):
-	try:
-		security = SESSION.query(WelcomeSecurity).get(str(chat_id))
-		if security:
-			return security.security, security.extra_verify, security.mute_time, security.timeout, security.timeout_mode, security.custom_text
-		else:
-			return False, False, "0", "0", 1, "Click here to unmute"
-	finally:
-		SESSION.close()
+	return get_welcome_settings(chat_id).security
 
 
 def set_welcome_security(chat_id, security, extra_verify, mute_time, timeout, timeout_mode, custom_text):
@@ -238,16 +330,11 @@ def set_welcome_security(chat_id, security, extra_verify, mute_time, timeout, ti
 
 		SESSION.add(curr_setting)
 		SESSION.commit()
+		__invalidate_settings(chat_id)
 
 
 def clean_service(chat_id: Union[str, int]) -> bool:
-	try:
-		chat_setting = SESSION.query(CleanServiceSetting).get(str(chat_id))
-		if chat_setting:
-			return chat_setting.clean_service
-		return False
-	finally:
-		SESSION.close()
+	return get_welcome_settings(chat_id).clean_service
 		
 
 def set_clean_service(chat_id: Union[int, str], setting: bool):
@@ -259,16 +346,12 @@ def set_clean_service(chat_id: Union[int, str], setting: bool):
 		chat_setting.clean_service = setting
 		SESSION.add(chat_setting)
 		SESSION.commit()
+		__invalidate_settings(chat_id)
 
 
 def get_welc_pref(chat_id):
-	welc = SESSION.query(Welcome).get(str(chat_id))
-	SESSION.close()
-	if welc:
-		return welc.should_welcome, welc.custom_welcome, welc.custom_content, welc.welcome_type
-	else:
-		# Welcome by default.
-		return True, DEFAULT_WELCOME, None, Types.TEXT
+	settings = get_welcome_settings(chat_id)
+	return settings.should_welcome, settings.custom_welcome, settings.custom_content, settings.welcome_type
 
 
 def get_gdbye_pref(chat_id):
@@ -284,6 +367,7 @@ def get_gdbye_pref(chat_id):
 def set_clean_welcome(chat_id, clean_welcome):
 	with INSERTION_LOCK:
 		curr = SESSION.query(Welcome).get(str(chat_id))
+		existed = curr is not None
 		if not curr:
 			curr = Welcome(str(chat_id))
 
@@ -292,15 +376,17 @@ def set_clean_welcome(chat_id, clean_welcome):
 		SESSION.add(curr)
 		SESSION.commit()
 
+		# runs after every welcome, so patch the snapshot instead of reloading it
+		with SETTINGS_LOCK:
+			settings = CHAT_SETTINGS.get(str(chat_id))
+			if settings is not None and existed:
+				CHAT_SETTINGS[str(chat_id)] = settings._replace(clean_welcome=int(clean_welcome))
+			else:
+				CHAT_SETTINGS.pop(str(chat_id), None)
 
-def get_clean_pref(chat_id):
-	welc = SESSION.query(Welcome).get(str(chat_id))
-	SESSION.close()
-
-	if welc:
-		return welc.clean_welcome
 
-	return False
+def get_clean_pref(chat_id):
+	return get_welcome_settings(chat_id).clean_welcome
 
 
 def set_welc_preference(chat_id, should_welcome):
@@ -313,6 +399,7 @@ def set_welc_preference(chat_id, should_welcome):
 
 		SESSION.add(curr)
 		SESSION.commit()
+		__invalidate_settings(chat_id)
 
 
 def set_gdbye_preference(chat_id, should_goodbye):
@@ -325,6 +412,7 @@ def set_gdbye_preference(chat_id, should_goodbye):
 
 		SESSION.add(curr)
 		SESSION.commit()
+		__invalidate_settings(chat_id)
 
 
 def set_custom_welcome(chat_id, custom_content, custom_welcome, welcome_type, buttons=None):
@@ -357,6 +445,7 @@ def set_custom_welcome(chat_id, custom_content, custom_welcome, welcome_type, bu
 				SESSION.add(button)
 
 		SESSION.commit()
+		__invalidate_settings(chat_id)
 
 
 def get_custom_welcome(chat_id):
@@ -399,6 +488,7 @@ def set_custom_gdbye(chat_id, custom_content_leave, custom_goodbye, goodbye_type
 				SESSION.add(button)
 
 		SESSION.commit()
+		__invalidate_settings(chat_id)
 
 
 def get_custom_gdbye(chat_id):
@@ -412,11 +502,7 @@ def get_custom_gdbye(chat_id):
 
 
 def get_welc_buttons(chat_id):
-	try:
-		return SESSION.query(WelcomeButtons).filter(WelcomeButtons.chat_id == str(chat_id)).order_by(
-			WelcomeButtons.id).all()
-	finally:
-		SESSION.close()
+	return get_welcome_settings(chat_id).buttons
 
 
 def get_gdbye_buttons(chat_id):
@@ -444,6 +530,8 @@ def migrate_chat(old_chat_id, new_chat_id):
 				btn.chat_id = str(new_chat_id)
 
 		SESSION.commit()
+		__invalidate_settings(old_chat_id)
+		__invalidate_settings(new_chat_id)
 
 def __load_chat_userrestrict():
 	global CHAT_USERRESTRICT
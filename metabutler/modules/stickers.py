@@ -7,12 +7,12 @@ from PIL import Image
 from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram import TelegramError
 from telegram import Update, bot
-from telegram.ext import run_async
 from telegram.utils.helpers import escape_markdown
 
 from metabutler import dispatcher
 from metabutler.modules.disable import DisableAbleCommandHandler
 from metabutler.modules.helper_funcs.alternate import send_message
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 
 @run_async
@@ -1,16 +1,16 @@
 from io import BytesIO
-from time import sleep
 from typing import Optional
 
-from telegram import TelegramError, Chat, Message
+from telegram import Chat, Message
 from telegram import Update, Bot
 from telegram.error import BadRequest
 from telegram.ext import MessageHandler, Filters, CommandHandler
-from telegram.ext.dispatcher import run_async
 
 import metabutler.modules.sql.users_sql as sql
-from metabutler import dispatcher, OWNER_ID, LOGGER
+from metabutler import dispatcher, updater, OWNER_ID, LOGGER
 from metabutler.modules.helper_funcs.filters import CustomFilters
+from metabutler.modules.helper_funcs.broadcast import BROADCASTER
+from metabutler.modules.helper_funcs.pipeline import run_async
 
 import metabutler.modules.sql.feds_sql as fedsql
 from metabutler.modules.helper_funcs.alternate import send_message
@@ -32,13 +32,14 @@ def get_user_id(username):
         return None
 
     elif len(users) == 1:
-        return users[0].user_id
+        return users[0]
 
     else:
-        for user_obj in users:
+        for user_id in users:
             try:
-                userdat = dispatcher.bot.get_chat(user_obj.user_id)
+                userdat = dispatcher.bot.get_chat(user_id)
                 if userdat.username == username:
+                    sql.resolve_username(username, userdat.id)
                     return userdat.id
 
             except BadRequest as excp:
@@ -54,17 +55,22 @@ def get_user_id(username):
 def broadcast(update, context):
     to_send = update.effective_message.text.split(None, 1)
     if len(to_send) >= 2:
-        chats = sql.get_all_chats() or []
-        failed = 0
-        for chat in chats:
-            try:
-                context.bot.sendMessage(int(chat.chat_id), to_send[1])
-                sleep(0.1)
-            except TelegramError:
-                failed += 1
-                LOGGER.warning("Couldn't send broadcast to %s, group name %s", str(chat.chat_id), str(chat.chat_name))
+        BROADCASTER.start('users', to_send[1], update.effective_chat.id, total=sql.num_chats())
+        send_message(update.effective_message, "Broadcast started, check /broadcaststatus for progress.")
+
+
+@run_async
+def broadcast_status(update, context):
+    send_message(update.effective_message, BROADCASTER.status())
+
+
+def broadcast_chats(bcast, cursor, limit):
+    return sql.get_chat_ids_after(cursor, limit)
+
 
-        send_message(update.effective_message, "Broadcast complete. {} group failed to receive message, maybe because it was kicked".format(failed))
+def remove_broadcast_chat(bcast, chat_id):
+    LOGGER.info("Removing chat %s from the chat list, it can no longer receive broadcasts", str(chat_id))
+    sql.rem_chat(chat_id)
 
 
 @run_async
@@ -87,20 +93,31 @@ def log_user(update, context):
                 except:
                 	print("Fban: cannot banned this user")
 
-    sql.update_user(msg.from_user.id,
-                    msg.from_user.username,
-                    chat.id,
-                    chat.title)
+    flush = sql.record_user(msg.from_user.id,
+                            msg.from_user.username,
+                            chat.id,
+                            chat.title)
 
     if msg.reply_to_message:
-        sql.update_user(msg.reply_to_message.from_user.id,
-                        msg.reply_to_message.from_user.username,
-                        chat.id,
-                        chat.title)
+        flush |= sql.record_user(msg.reply_to_message.from_user.id,
+                                 msg.reply_to_message.from_user.username,
+                                 chat.id,
+                                 chat.title)
 
     if msg.forward_from:
-        sql.update_user(msg.forward_from.id,
-                        msg.forward_from.username)
+        flush |= sql.record_user(msg.forward_from.id,
+                                 msg.forward_from.username)
+
+    if flush:
+        sql.flush_users()
+
+
+def flush_users(context):
+    try:
+        sql.flush_users()
+    except Exception:
+        LOGGER.exception("Flushing tracked users failed")
+
 
 @run_async
 def chats(update, context):
@@ -135,9 +152,18 @@ __help__ = ""  # no help string
 __mod_name__ = "Users"
 
 BROADCAST_HANDLER = CommandHandler("broadcast", broadcast, filters=Filters.user(OWNER_ID))
+BROADCAST_STATUS_HANDLER = CommandHandler("broadcaststatus", broadcast_status, filters=Filters.user(OWNER_ID))
 USER_HANDLER = MessageHandler(Filters.all & Filters.group, log_user)
 CHATLIST_HANDLER = CommandHandler("chatlist", chats, filters=CustomFilters.sudo_filter)
 
 dispatcher.add_handler(USER_HANDLER, USERS_GROUP)
 dispatcher.add_handler(BROADCAST_HANDLER)
+dispatcher.add_handler(BROADCAST_STATUS_HANDLER)
 dispatcher.add_handler(CHATLIST_HANDLER)
+
+BROADCASTER.register_target('users', broadcast_chats, remove_broadcast_chat)
+
+job = updater.job_queue
+
+job_flush_users = job.run_repeating(flush_users, interval=1, first=1)
+job_flush_users.enabled = True
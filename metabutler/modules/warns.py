@@ -6,13 +6,15 @@ import telegram
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ParseMode, User, CallbackQuery
 from telegram import Message, Chat, Update, Bot
 from telegram.error import BadRequest
-from telegram.ext import CommandHandler, run_async, DispatcherHandlerStop, MessageHandler, Filters, CallbackQueryHandler
+from telegram.ext import CommandHandler, DispatcherHandlerStop, MessageHandler, Filters, CallbackQueryHandler
 from telegram.utils.helpers import mention_html, escape_markdown
 
 from metabutler import dispatcher, BAN_STICKER, OWNER_ID
 from metabutler.modules.disable import DisableAbleCommandHandler
+from metabutler.modules.helper_funcs.pipeline import run_async
 from metabutler.modules.helper_funcs.chat_status import is_user_admin, bot_admin, user_admin_no_reply, user_admin, \
     can_restrict, is_user_ban_protected
+from metabutler.modules.helper_funcs import pipeline
 from metabutler.modules.helper_funcs.extraction import extract_text, extract_user_and_text, extract_user
 from metabutler.modules.helper_funcs.filters import CustomFilters
 from metabutler.modules.helper_funcs.misc import split_message
@@ -43,6 +45,7 @@ def warn(user: User, chat: Chat, reason: str, message: Message, warner: User = N
     num_warns, reasons = sql.warn_user(user.id, chat.id, reason)
     if num_warns >= limit:
         sql.reset_warns(user.id, chat.id)
+        pipeline.halt()
         if not soft_warn:
             if not warn_mode:
                 chat.unban_member(user.id)
@@ -517,17 +520,15 @@ def reply_filter(update, context) -> str:
     chat = update.effective_chat  # type: Optional[Chat]
     message = update.effective_message  # type: Optional[Message]
 
-    chat_warn_filters = sql.get_chat_warn_triggers(chat.id)
     to_match = extract_text(message)
     if not to_match:
         return ""
 
-    for keyword in chat_warn_filters:
-        pattern = r"( |^|[^\w])" + re.escape(keyword) + r"( |$|[^\w])"
-        if re.search(pattern, to_match, flags=re.IGNORECASE):
-            user = update.effective_user  # type: Optional[User]
-            warn_filter = sql.get_warn_filter(chat.id, keyword)
-            return warn(user, chat, warn_filter.reply, message)
+    keyword = sql.match_warn_filter(chat.id, to_match)
+    if keyword:
+        user = update.effective_user  # type: Optional[User]
+        warn_filter = sql.get_warn_filter(chat.id, keyword)
+        return warn(user, chat, warn_filter.reply, message)
     return ""
 
 
@@ -1,8 +1,10 @@
-import requests
 from telegram import ParseMode
-from telegram.ext import run_async
 from metabutler import dispatcher, LOGGER
 from metabutler.modules.disable import DisableAbleCommandHandler
+from metabutler.modules.helper_funcs.http_client import HTTP
+from metabutler.modules.helper_funcs.pipeline import run_async
+
+WEATHER_TTL = 10 * 60  # the current weather is served from the cache for this long
 
 @run_async
 def weather(update, context):
@@ -14,7 +16,7 @@ def weather(update, context):
 	else:
 		city = args[1]
 		url = "https://api.openweathermap.org/data/2.5/weather?q=" + city + "&appid=2f370427a4e24ed13e0fe6cabbefe5f3&units=metric"
-		response = requests.get(url).json()
+		response = HTTP.get(url, ttl=WEATHER_TTL).json()
 		if response['cod'] == '404':
 			context.bot.sendMessage(chat_id, text = "That city does not exist", reply_to_message_id = msg_id)
 			return
@@ -7,11 +7,12 @@ from typing import Optional, List
 from telegram import Message, Chat, Update, Bot, User, CallbackQuery
 from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton, ChatPermissions
 from telegram.error import BadRequest
-from telegram.ext import MessageHandler, Filters, CommandHandler, run_async, CallbackQueryHandler
+from telegram.ext import MessageHandler, Filters, CommandHandler, CallbackQueryHandler
 from telegram.utils.helpers import mention_markdown, mention_html, escape_markdown
 
 import metabutler.modules.sql.welcome_sql as sql
 from metabutler import dispatcher, OWNER_ID, LOGGER, IS_DEBUG
+from metabutler.modules.helper_funcs.pipeline import run_async
 try:
 	from metabutler import SPAMWATCH_TOKEN
 except:
@@ -21,7 +22,8 @@ from metabutler.modules.helper_funcs.misc import build_keyboard_parser, revert_b
 from metabutler.modules.helper_funcs.msg_types import get_welcome_type
 from metabutler.modules.helper_funcs.string_handling import markdown_parser, \
 	escape_invalid_curly_brackets, extract_time, make_time
-from metabutler.modules.helper_funcs.welcome_timeout import welcome_timeout
+from metabutler.modules.helper_funcs.welcome_timeout import schedule_timeout
+from metabutler.modules.helper_funcs.raid import RAID_GUARD
 from metabutler.modules.log_channel import loggable
 
 import metabutler.modules.sql.feds_sql as fedsql
@@ -103,12 +105,30 @@ def send(update, message, keyboard, backup_message):
 	return msg
 
 
+# chat_id -> (member count, time it was fetched, join message it covers), so a burst of joins asks Telegram once
+MEMBER_COUNTS = {}
+MEMBER_COUNT_TTL = 30
+
+
+def member_count(chat, message):
+	count, fetched, message_id = MEMBER_COUNTS.get(chat.id, (None, 0, None))
+	if count is None or time.time() - fetched > MEMBER_COUNT_TTL:
+		count = chat.get_members_count()
+		MEMBER_COUNTS[chat.id] = (count, time.time(), message.message_id)
+	elif message_id != message.message_id:
+		# the members of a later join message are not in the cached count yet
+		count += len(message.new_chat_members)
+		MEMBER_COUNTS[chat.id] = (count, fetched, message.message_id)
+	return count
+
+
 @run_async
 def new_member(update, context):
 	chat = update.effective_chat  # type: Optional[Chat]
 
-	should_welc, cust_welcome, cust_content, welc_type = sql.get_welc_pref(chat.id)
-	cleanserv = sql.clean_service(chat.id)
+	settings = sql.get_welcome_settings(chat.id)
+	should_welc, cust_welcome, cust_content, welc_type = settings[:4]
+	cleanserv = settings.clean_service
 	if cleanserv:
 		new_members = update.effective_message.new_chat_members
 		for new_mem in new_members:
@@ -117,8 +137,13 @@ def new_member(update, context):
 			except BadRequest:
 				pass
 	if should_welc:
-		sent = None
 		new_members = update.effective_message.new_chat_members
+		raid, started = RAID_GUARD.register_joins(chat.id, len(new_members))
+		if raid:
+			handle_raid_joins(update, context, settings, raid, started)
+			return
+
+		sent = None
 		for new_mem in new_members:
 			# Give the owner a special welcome
 			if OWNER_SPECIAL and new_mem.id == OWNER_ID:
@@ -145,7 +170,7 @@ def new_member(update, context):
 						fullname = "{} {}".format(first_name, new_mem.last_name)
 					else:
 						fullname = first_name
-					count = chat.get_members_count()
+					count = member_count(chat, update.effective_message)
 					mention = mention_markdown(new_mem.id, first_name)
 					if new_mem.username:
 						username = "@" + escape_markdown(new_mem.username)
@@ -161,12 +186,12 @@ def new_member(update, context):
 					else:
 						formatted_text = ""
 					# Build keyboard
-					buttons = sql.get_welc_buttons(chat.id)
+					buttons = settings.buttons
 					keyb = build_keyboard_parser(context.bot, chat.id, buttons)
-					getsec, extra_verify, mutetime, timeout, timeout_mode, custom_text = sql.welcome_security(chat.id)
+					getsec, extra_verify, mutetime, timeout, timeout_mode, custom_text = settings.security
 
 					# If user ban protected don't apply security on him
-					if is_user_ban_protected(chat, new_mem.id, chat.get_member(new_mem.id)):
+					if is_user_ban_protected(chat, new_mem.id):
 						pass
 					elif getsec:
 						# If mute time is turned on
@@ -217,7 +242,7 @@ def new_member(update, context):
 							fullname = "{} {}".format(first_name, new_mem.last_name)
 						else:
 							fullname = first_name
-						count = chat.get_members_count()
+						count = member_count(chat, update.effective_message)
 						mention = mention_markdown(new_mem.id, first_name)
 						if new_mem.username:
 							username = "@" + escape_markdown(new_mem.username)
@@ -233,16 +258,16 @@ def new_member(update, context):
 												  count=count, chatname=escape_markdown(chat.title), id=new_mem.id, rules=rules)
 						else:
 							res = ""
-						buttons = sql.get_welc_buttons(chat.id)
+						buttons = settings.buttons
 						keyb = build_keyboard_parser(context.bot, chat.id, buttons)
 					else:
 						res = sql.DEFAULT_WELCOME.format(first=first_name)
 						keyb = []
 
-					getsec, extra_verify, mutetime, timeout, timeout_mode, custom_text = sql.welcome_security(chat.id)
+					getsec, extra_verify, mutetime, timeout, timeout_mode, custom_text = settings.security
 					
 					# If user ban protected don't apply security on him
-					if is_user_ban_protected(chat, new_mem.id, chat.get_member(new_mem.id)):
+					if is_user_ban_protected(chat, new_mem.id):
 						pass
 					elif getsec:
 						is_clicked = sql.get_chat_userlist(chat.id)
@@ -277,14 +302,14 @@ def new_member(update, context):
 								else:
 									keyb.append([InlineKeyboardButton(text=str(custom_text), callback_data="check_bot_({})".format(new_mem.id))])
 								if timeout != "0":
-									sql.add_to_timeout(chat.id, new_mem.id, int(timeout))
+									schedule_timeout(chat.id, new_mem.id, int(timeout))
 							elif new_mem.id in list(is_clicked) and is_clicked[new_mem.id] == False:
 								if extra_verify:
 									keyb.append([InlineKeyboardButton(text=str(custom_text), url="t.me/{}?start=verify_{}".format(context.bot.username, chat.id))])
 								else:
 									keyb.append([InlineKeyboardButton(text=str(custom_text), callback_data="check_bot_({})".format(new_mem.id))])
 								if timeout != "0":
-									sql.add_to_timeout(chat.id, new_mem.id, int(timeout))
+									schedule_timeout(chat.id, new_mem.id, int(timeout))
 					keyboard = InlineKeyboardMarkup(keyb)
 
 					sent = send(update, res, keyboard,
@@ -314,6 +339,48 @@ def new_member(update, context):
 			t.start()
 	"""
 
+def handle_raid_joins(update, context, settings, raid, started):
+	# raid mode: no welcome per member, mutes are queued and the chat gets one summary message
+	chat = update.effective_chat  # type: Optional[Chat]
+	getsec, extra_verify, mutetime, timeout, timeout_mode, custom_text = settings.security
+	if started:
+		raid.secured = bool(getsec) and bot_can_restrict(chat, context.bot.id)
+		RAID_GUARD.report(context.bot, raid)
+	if not raid.secured:
+		return
+
+	is_clicked = sql.get_chat_userlist(chat.id)
+	for new_mem in update.effective_message.new_chat_members:
+		if new_mem.id == context.bot.id or is_clicked.get(new_mem.id) or is_user_ban_protected(chat, new_mem.id):
+			continue
+		RAID_GUARD.queue_restrict(raid, new_mem.id)
+		if timeout != "0":
+			schedule_timeout(chat.id, new_mem.id, int(timeout))
+
+
+@run_async
+def raid_verify_button(update, context):
+	chat = update.effective_chat  # type: Optional[Chat]
+	user = update.effective_user  # type: Optional[User]
+	query = update.callback_query  # type: Optional[CallbackQuery]
+
+	getalluser = sql.get_chat_userlist(chat.id)
+	if user.id not in getalluser:
+		query.answer(text="You are not a new member!")
+		return
+	if getalluser[user.id] == True:
+		query.answer(text="You've clicked this before!")
+		return
+	try:
+		context.bot.restrict_chat_member(chat.id, user.id, permissions=ChatPermissions(can_send_messages=True, can_send_media_messages=True, can_send_other_messages=True, can_add_web_page_previews=True))
+	except BadRequest as err:
+		query.answer(text="Error: " + str(err.message))
+		return
+	sql.add_to_userlist(chat.id, user.id, True)
+	sql.rm_from_timeout(chat.id, user.id)
+	query.answer(text="You've been unmuted!")
+
+
 @run_async
 def check_bot_button(update, context):
 	chat = update.effective_chat  # type: Optional[Chat]
@@ -1168,6 +1235,8 @@ __help__ = """
  - /wtimeout <Xw/d/h/m>: Set welcome timeout, when user wasn't verify for X, then that user will be kicked/banned
  - /wtmode <kick/ban>: Set welcome timeout should be kicked or banned
 
+When lots of people join at once (a raid), I stop welcoming them one by one and post a single summary instead; with welcomemute on they're muted until they press its button.
+
 Read /welcomehelp and /markdownhelp to learn about formatting your text and mentioning new users when the join!
 
 If you want to save an image, gif, or sticker, or any other data, do the following:
@@ -1198,6 +1267,7 @@ CLEAN_SERVICE_HANDLER = CommandHandler("cleanservice", cleanservice, pass_args=T
 
 welcomesec_callback_handler = CallbackQueryHandler(check_bot_button, pattern=r"check_bot_")
 WELC_BTNSET_HANDLER = CallbackQueryHandler(WELC_EDITBTN, pattern=r"set_welc")
+RAID_VERIFY_HANDLER = CallbackQueryHandler(raid_verify_button, pattern=r"raid_verify")
 
 dispatcher.add_handler(NEW_MEM_HANDLER)
 dispatcher.add_handler(LEFT_MEM_HANDLER)
@@ -1217,3 +1287,4 @@ dispatcher.add_handler(CLEAN_SERVICE_HANDLER)
 
 dispatcher.add_handler(welcomesec_callback_handler)
 dispatcher.add_handler(WELC_BTNSET_HANDLER)
+dispatcher.add_handler(RAID_VERIFY_HANDLER)
@@ -37,6 +37,18 @@ class Config(object):
     CUSTOM_CMD = False # Set to ('/', '!') or whatever to enable it, like ALLOW_EXCL but with more custom handler!
     SPAMMERS = "" # Will not allow to interact with bot
     TEMPORARY_DATA = None # Temporary data for backup module, use int number
+    MODERATION_PIPELINE = False  # Run the per-message checks (locks, antiflood, filters, blacklist...) as one job per message
+    BROADCAST_RATE = 20  # Broadcast messages sent per second, over all chats
+    BROADCAST_CONCURRENCY = 4  # Broadcast messages in flight at the same time
+    DB_POOL_SIZE = 10  # Database connections kept open, should be at least WORKERS
+    DB_MAX_OVERFLOW = 20  # Extra connections opened when the pool is busy
+    DB_POOL_TIMEOUT = 30  # Seconds to wait for a free connection
+    DB_POOL_PRE_PING = True  # Test connections before use, avoids errors after the database restarted
+    PERF_STATS = False  # Time every handler, see /perf
+    PERF_DUMP_FILE = "perf_stats.json"  # Where the handler timings are written, None to keep them in memory only
+    PERF_DUMP_INTERVAL = 300  # Seconds between two writes of PERF_DUMP_FILE
+    HTTP_TIMEOUT = 10  # Seconds to wait for a lookup command's website to answer
+    HTTP_CACHE_FILE = None  # File to keep cached lookups (twrp, magisk, weather...) in across restarts, None for memory only
 
 
 class Production(Config):